@@ -0,0 +1,1154 @@
+"""Micro-benchmarks of the game engine.
+
+Usage: python benchmarks.py <benchmark> [options]. Run python benchmarks.py -h to list them."""
+from engine import Board, Session, AreaState, GameState, FirstClick, DIRECTIONS
+from chunked_board import ChunkedBoard
+from mapped_board import MappedBoard
+from persistence import PersistenceWorker
+from history import GameHistory
+from replay import Recorder, Replay
+from solver import Solver
+import save_game_manager
+import tracemalloc
+import replay
+import generator
+import subprocess
+import argparse
+import pickle
+import tempfile
+import settings
+import random
+import engine
+import time
+import sys
+import os
+
+
+def bench_memory(args):
+    """Measure the construction time and memory used per area by a Board."""
+    print('{:>12} {:>10} {:>12} {:>14}'.format('Size', 'Mines', 'Time (s)', 'Bytes/area'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        mines = int(width * height * args.density)
+
+        start = time.perf_counter()
+        Board(width, height, mines)
+        elapsed = time.perf_counter() - start
+
+        # Memory is measured on a second construction as tracing allocations slows everything down
+        tracemalloc.start()
+
+        f = Board(width, height, mines)
+
+        used, _ = tracemalloc.get_traced_memory()
+
+        tracemalloc.stop()
+
+        print('{:>12} {:>10} {:>12.3f} {:>14.2f}'.format(size, mines, elapsed, used / f.areas_count))
+
+
+def _reference_nearby_mines(f):
+    """Compute the nearby mines counts of a Board area by area, direction by direction."""
+    counts = bytearray(f.areas_count)
+
+    for y in range(0, f.height):
+        for x in range(0, f.width):
+            if f._mines[y * f.width + x]:
+                continue
+
+            for dir_x, dir_y in DIRECTIONS:
+                nearby_x = x + dir_x
+                nearby_y = y + dir_y
+
+                if 0 <= nearby_x < f.width and 0 <= nearby_y < f.height and f._mines[nearby_y * f.width + nearby_x]:
+                    counts[y * f.width + x] += 1
+
+    return counts
+
+
+def bench_counts(args):
+    """Check and time the nearby mines counts computations against each other."""
+    paths = [('reference', None), ('python', Board._compute_nearby_mines_python)]
+
+    if engine.numpy is not None:
+        paths.append(('numpy', Board._compute_nearby_mines_numpy))
+
+    print('{:>12} {:>10} '.format('Size', 'Seeds') + ' '.join('{:>12}'.format(name + ' (s)') for name, _ in paths))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        timings = [0.0] * len(paths)
+
+        for seed in range(0, args.seeds):
+            rng = random.Random(seed)
+
+            f = Board(width, height, int(width * height * rng.uniform(0, args.max_density)), seed=rng)
+
+            start = time.perf_counter()
+            expected = _reference_nearby_mines(f)
+            timings[0] += time.perf_counter() - start
+
+            for i, (name, compute) in enumerate(paths[1:], start=1):
+                start = time.perf_counter()
+                compute(f)
+                timings[i] += time.perf_counter() - start
+
+                if f._counts != expected:
+                    raise AssertionError('The {} nearby mines counts differ from the reference ones (size {}, seed {})'.format(name, size, seed))
+
+        print('{:>12} {:>10} '.format(size, args.seeds) + ' '.join('{:>12.4f}'.format(t / args.seeds) for t in timings))
+
+
+def _reference_flood_fill(f, coords):
+    """Clear the surrounding areas of the given coordinates area by area, direction by direction, and return the indexes
+    of the cleared areas."""
+    revealed = set()
+    stack = [coords]
+
+    while stack:
+        x, y = stack.pop()
+
+        for dir_x, dir_y in DIRECTIONS:
+            nearby_x = x + dir_x
+            nearby_y = y + dir_y
+
+            if not (0 <= nearby_x < f.width and 0 <= nearby_y < f.height):
+                continue
+
+            index = nearby_y * f.width + nearby_x
+
+            if f._states[index] == AreaState.INITIAL:
+                f._states[index] = AreaState.CLEARED
+                revealed.add(index)
+
+                if f._counts[index] == 0:
+                    stack.append((nearby_x, nearby_y))
+
+    return revealed
+
+
+def bench_flood(args):
+    """Check the flood fill against a reference one, then time the opening of a fully empty board."""
+    for seed in range(0, args.seeds):
+        rng = random.Random(seed)
+        width = rng.randint(1, 60)
+        height = rng.randint(1, 60)
+
+        f = Board(width, height, int(width * height * rng.uniform(0, 0.25)), seed=rng)
+
+        # Flag a few areas, they must stop the flood
+        for _ in range(0, rng.randint(0, 10)):
+            f._states[rng.randrange(f.areas_count)] = AreaState.MARKED
+
+        for index in range(0, f.areas_count):
+            if f._states[index] == AreaState.INITIAL and not f._mines[index] and f._counts[index] == 0:
+                break
+        else:
+            continue
+
+        coords = (index % width, index // width)
+        states = f._states[:]
+
+        f._states[index] = AreaState.CLEARED
+        revealed = f.clear_surrounding_areas(coords)
+        result = f._states
+
+        f._states = states
+        f._states[index] = AreaState.CLEARED
+        expected_revealed = _reference_flood_fill(f, coords)
+
+        if revealed != expected_revealed or result != f._states:
+            raise AssertionError('The flood fill differs from the reference one (seed {})'.format(seed))
+
+    print('Flood fill checked on {} random boards'.format(args.seeds))
+
+    width, height = (int(v) for v in args.size.split('x'))
+
+    f = Board(width, height, 0)
+    start = time.perf_counter()
+    revealed = f.clear_surrounding_areas((width // 2, height // 2))
+    elapsed = time.perf_counter() - start
+
+    print('Opened an empty {} board ({} areas cleared) in {:.3f} s'.format(args.size, len(revealed), elapsed))
+
+
+def _create_game(width, height, mines):
+    """Create a Game without any display, sound, saved game or stats, for the given board settings."""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+    import pygame
+    import game
+
+    pygame.init()
+
+    directory = tempfile.mkdtemp()
+
+    settings.SAVE_FILE_NAME = os.path.join(directory, 'save.dat')
+    settings.STATS_FILE_NAME = os.path.join(directory, 'stats.json')
+    settings.WIDTH = width
+    settings.HEIGHT = height
+    settings.MINES = mines
+    settings.HISTORY_FILE_NAME = os.path.join(directory, 'history.db')
+    settings.REPLAY_FILE_NAME = os.path.join(directory, 'last_game.replay')
+    settings.WINDOW_SIZE = (
+        min(settings.MAX_WINDOW_SIZE[0], width * settings.AREAS_SIDE_SIZE + (width - 1) * settings.GRID_SPACING),
+        min(settings.MAX_WINDOW_SIZE[1], settings.INFO_PANEL_HEIGHT + height * settings.AREAS_SIDE_SIZE + (height - 1) * settings.GRID_SPACING)
+    )
+
+    return game.Game()
+
+
+def _click_random_area(g, rng):
+    """Left click on a random uncleared area of the game, without mine. Return False if there's none left."""
+    import pygame
+
+    candidates = [index for index in range(0, g.field.areas_count) if g.field._states[index] == AreaState.INITIAL and not g.field._mines[index]]
+
+    if not candidates:
+        return False
+
+    index = rng.choice(candidates)
+    pos = g._get_area_position((index % g.field.width, index // g.field.width))
+
+    g._event_area_left_click(pygame.event.Event(pygame.MOUSEBUTTONUP, button=settings.MOUSE_BUTTON_LEFT, pos=pos))
+
+    return True
+
+
+def bench_frames(args):
+    """Compare the time taken to draw frames with and without dirty rects."""
+    print('{:>12} {:>12} {:>16} {:>16}'.format('Size', 'Dirty rects', 'Idle frame (ms)', 'Click frame (ms)'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+
+        for dirty_rects in (False, True):
+            settings.DIRTY_RECTS = dirty_rects
+
+            g = _create_game(width, height, int(width * height * args.density))
+            g._draw()
+
+            rng = random.Random(args.seed)
+            timings = {'idle': [], 'click': []}
+
+            for frame in range(0, args.frames):
+                kind = 'click' if frame % args.click_every == 0 else 'idle'
+
+                if kind == 'click' and not _click_random_area(g, rng):
+                    g._start_new_game()
+                    g._draw()
+
+                start = time.perf_counter()
+                g._draw()
+                timings[kind].append(time.perf_counter() - start)
+
+                if g.state != GameState.PLAYING:
+                    g._start_new_game()
+                    g._draw()
+
+            print('{:>12} {:>12} {:>16.3f} {:>16.3f}'.format(
+                size,
+                'yes' if dirty_rects else 'no',
+                sum(timings['idle']) / len(timings['idle']) * 1000,
+                sum(timings['click']) / len(timings['click']) * 1000
+            ))
+
+
+def bench_layers(args):
+    """Compare the time taken to draw the whole window with static layers cached and rendered again every frame."""
+    print('{:>12} {:>12} {:>16} {:>16} {:>12}'.format('Size', 'Screen', 'Cached (ms)', 'Rendered (ms)', 'Saved (ms)'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+
+        g = _create_game(width, height, int(width * height * args.density))
+
+        for state in (GameState.PLAYING, GameState.LOST):
+            g.state = state
+            timings = []
+
+            for cached in (True, False):
+                g._draw_window()
+
+                start = time.perf_counter()
+
+                for _ in range(0, args.frames):
+                    if not cached:
+                        g._layers.clear()
+
+                    g._draw_window()
+
+                timings.append((time.perf_counter() - start) / args.frames * 1000)
+
+            print('{:>12} {:>12} {:>16.3f} {:>16.3f} {:>12.3f}'.format(
+                size,
+                'playing' if state == GameState.PLAYING else 'lost',
+                timings[0],
+                timings[1],
+                timings[1] - timings[0]
+            ))
+
+        print('{:>12} text cache: {} hits, {} misses'.format(size, g.texts.hits, g.texts.misses))
+
+
+def bench_camera(args):
+    """Measure the time taken to draw frames while scrolling the field, at each zoom level."""
+    print('{:>12} {:>8} {:>16} {:>16}'.format('Size', 'Zoom', 'Visible areas', 'Frame (ms)'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+
+        g = _create_game(width, height, int(width * height * args.density))
+
+        for zoom in settings.ZOOM_LEVELS:
+            g.zoom = zoom
+            g.camera = [0, 0]
+            g._draw()
+
+            columns, rows = g._get_visible_areas()
+
+            start = time.perf_counter()
+
+            for _ in range(0, args.frames):
+                g._move_camera(settings.SCROLL_STEP // 4, settings.SCROLL_STEP // 4)
+                g._draw()
+
+            print('{:>12} {:>8} {:>16} {:>16.3f}'.format(
+                size,
+                zoom,
+                len(columns) * len(rows),
+                (time.perf_counter() - start) / args.frames * 1000
+            ))
+
+
+def bench_loop(args):
+    """Compare the CPU time used by an idle game with the event-driven and the fixed frame rate game loops."""
+    print('{:>14} {:>14} {:>20}'.format('Loop', 'Screen', 'CPU time (s/min)'))
+
+    for event_driven in (False, True):
+        settings.EVENT_DRIVEN = event_driven
+
+        g = _create_game(settings.WIDTH, settings.HEIGHT, settings.MINES)
+
+        for show_stats in (False, True):
+            g._toggle_stats(show_stats)
+
+            start = time.monotonic()
+            start_cpu_time = time.process_time()
+
+            while time.monotonic() - start < args.seconds:
+                g.update()
+
+            cpu_time = time.process_time() - start_cpu_time
+
+            print('{:>14} {:>14} {:>20.3f}'.format(
+                'event-driven' if event_driven else 'fixed FPS',
+                'stats' if show_stats else 'playing',
+                cpu_time / (time.monotonic() - start) * 60
+            ))
+
+
+def bench_engine(args):
+    """Measure how many headless games per second the engine plays, with a player knowing where the mines are."""
+    print('{:>12} {:>10} {:>12} {:>12}'.format('Size', 'Mines', 'Games', 'Games/s'))
+
+    for preset in args.presets:
+        size, mines = preset.split('/')
+        width, height = (int(v) for v in size.split('x'))
+        mines = int(mines)
+
+        rng = random.Random(args.seed)
+
+        start = time.perf_counter()
+
+        for _ in range(0, args.games):
+            session = Session(Board(width, height, mines, seed=rng.getrandbits(64)))
+            candidates = list(range(0, session.board.areas_count))
+
+            rng.shuffle(candidates)
+
+            while session.state == GameState.PLAYING:
+                index = candidates.pop()
+
+                if session.board._states[index] != AreaState.INITIAL:
+                    continue
+
+                if session.board._mines[index]:
+                    session.toggle_mine_marker((index % width, index // width))
+                else:
+                    session.reveal((index % width, index // width))
+
+        elapsed = time.perf_counter() - start
+
+        print('{:>12} {:>10} {:>12} {:>12.1f}'.format(size, mines, args.games, args.games / elapsed))
+
+    for module in ('engine', 'game'):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', 'import ' + module], stdout=subprocess.DEVNULL)
+
+        print('Starting Python and importing {}: {:.3f} s'.format(module, time.perf_counter() - start))
+
+
+def _play_with_solver(session, incremental=True):
+    """Play a game following the solver hints and marking the mines it finds. Return the duration of each solve."""
+    solver = Solver(session.board)
+    width = session.board.width
+    solve_times = []
+
+    while session.state == GameState.PLAYING:
+        if not incremental:
+            solver = Solver(session.board)
+
+        start = time.perf_counter()
+        solver.solve()
+        solve_times.append(time.perf_counter() - start)
+
+        for index in solver.mines:
+            if session.board._states[index] == AreaState.INITIAL:
+                session.toggle_mine_marker((index % width, index // width))
+                solver.update([index])
+
+        if session.state != GameState.PLAYING:
+            break
+
+        coords = solver.hint()
+
+        if not coords:
+            break
+
+        solver.update(session.reveal(coords))
+
+    return solve_times
+
+
+def bench_solver(args):
+    """Measure how long the solver takes to analyse positions, and how many games it wins by following its own hints."""
+    size, mines = args.preset.split('/')
+    width, height = (int(v) for v in size.split('x'))
+    mines = int(mines)
+
+    print('{:>12} {:>8} {:>10} {:>12} {:>12} {:>12}'.format('Mode', 'Games', 'Win rate', 'Solve p50', 'Solve p95', 'Solve max'))
+
+    for incremental in (True, False):
+        rng = random.Random(args.seed)
+        solve_times = []
+        won = 0
+
+        for _ in range(0, args.games):
+            session = Session(Board(width, height, mines, seed=rng.getrandbits(64)))
+
+            solve_times.extend(_play_with_solver(session, incremental))
+
+            if session.state == GameState.WON:
+                won += 1
+
+        solve_times.sort()
+
+        print('{:>12} {:>8} {:>9.1f}% {:>9.3f} ms {:>9.3f} ms {:>9.3f} ms'.format(
+            'incremental' if incremental else 'from scratch',
+            args.games,
+            won / args.games * 100,
+            solve_times[len(solve_times) // 2] * 1000,
+            solve_times[int(len(solve_times) * 0.95)] * 1000,
+            solve_times[-1] * 1000
+        ))
+
+
+def bench_noguess(args):
+    """Measure how long it takes to generate no-guess fields, by board size and density."""
+    executor = generator.create_executor(args.processes) if args.processes != 0 else None
+
+    print('{:>12} {:>8} {:>8} {:>8} {:>10} {:>10} {:>10}'.format('Size', 'Density', 'Mines', 'Failed', 'p50', 'p95', 'Max'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+
+        for density in args.densities:
+            mines = int(width * height * density)
+            durations = []
+            failed = 0
+
+            for seed in range(0, args.boards):
+                start = time.perf_counter()
+
+                mines_indexes = generator.generate_no_guess_mines(width, height, mines, seed=seed, executor=executor)
+
+                durations.append(time.perf_counter() - start)
+
+                if mines_indexes is None:
+                    failed += 1
+
+            durations.sort()
+
+            print('{:>12} {:>8.3f} {:>8} {:>8} {:>8.3f} s {:>8.3f} s {:>8.3f} s'.format(
+                size,
+                density,
+                mines,
+                failed,
+                durations[len(durations) // 2],
+                durations[int(len(durations) * 0.95)],
+                durations[-1]
+            ))
+
+    if executor:
+        executor.shutdown()
+
+
+def bench_pool(args):
+    """Measure how long starting a new game takes, with and without fields built ahead of time in the background."""
+    settings.NO_GUESS = args.no_guess
+
+    print('{:>14} {:>6} {:>12} {:>12} {:>6} {:>6} {:>12}'.format('Preset', 'Pool', 'Start p50', 'Start max', 'Hits', 'Misses', 'Refill p50'))
+
+    for preset in args.presets:
+        size, mines = preset.split('/')
+        width, height = (int(v) for v in size.split('x'))
+
+        for pool_size in (0, args.pool_size):
+            settings.FIELD_POOL_SIZE = pool_size
+
+            g = _create_game(width, height, int(mines))
+
+            durations = []
+
+            for _ in range(0, args.games):
+                time.sleep(args.pause) # The player plays meanwhile
+
+                start = time.perf_counter()
+                g._start_new_game()
+                durations.append(time.perf_counter() - start)
+
+            durations.sort()
+
+            if g.field_pool:
+                g.field_pool.stop()
+
+                refill_durations = sorted(g.field_pool.refill_durations)
+
+                print('{:>14} {:>6} {:>9.1f} ms {:>9.1f} ms {:>6} {:>6} {:>9.1f} ms'.format(
+                    preset,
+                    pool_size,
+                    durations[len(durations) // 2] * 1000,
+                    durations[-1] * 1000,
+                    g.field_pool.hits,
+                    g.field_pool.misses,
+                    refill_durations[len(refill_durations) // 2] * 1000
+                ))
+            else:
+                print('{:>14} {:>6} {:>9.1f} ms {:>9.1f} ms {:>6} {:>6} {:>12}'.format(
+                    preset,
+                    pool_size,
+                    durations[len(durations) // 2] * 1000,
+                    durations[-1] * 1000,
+                    '-',
+                    '-',
+                    '-'
+                ))
+
+
+def bench_firstclick(args):
+    """Check the nearby mines counts after mines were moved away from the first click, and time the move against
+    computing all the counts again."""
+    rng = random.Random(args.seed)
+
+    for _ in range(0, args.checks):
+        width, height = rng.randint(1, 20), rng.randint(1, 20)
+        f = Board(width, height, rng.randint(0, width * height), seed=rng.getrandbits(64))
+        session = Session(f, first_click=rng.choice((FirstClick.SAFE, FirstClick.OPENING)))
+
+        session.reveal((rng.randrange(0, width), rng.randrange(0, height)))
+
+        if f._counts != _reference_nearby_mines(f):
+            raise AssertionError('Wrong nearby mines counts after the first click (seed {})'.format(f.seed))
+
+        if f.mines < f.areas_count and session.state == GameState.LOST:
+            raise AssertionError('The first click exploded (seed {})'.format(f.seed))
+
+    print('Checked {} first clicks'.format(args.checks))
+    print('{:>12} {:>10} {:>14} {:>14}'.format('Size', 'Mines', 'Moved (ms)', 'Recount (ms)'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        f = Board(width, height, int(width * height * args.density), seed=args.seed)
+
+        # The worst case: all the areas around the first click are mined
+        index = (height // 2) * width + width // 2
+
+        for mined_index in [index] + f.get_surrounding_areas(index):
+            if not f._mines[mined_index]:
+                f.move_mine(f._mines.find(1, index + width * 2), mined_index)
+
+        start = time.perf_counter()
+        f.clear_mines_around(index, opening=True)
+        moved = time.perf_counter() - start
+
+        start = time.perf_counter()
+        f._compute_nearby_mines()
+        recount = time.perf_counter() - start
+
+        print('{:>12} {:>10} {:>14.3f} {:>14.3f}'.format(size, f.mines, moved * 1000, recount * 1000))
+
+
+def bench_save(args):
+    """Compare the size and speed of saved games in the binary format, with and without compression, and with pickle."""
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'save.dat')
+
+    print('{:>12} {:>10} {:>14} {:>12} {:>12}'.format('Size', 'Format', 'File size (B)', 'Save (ms)', 'Load (ms)'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        rng = random.Random(args.seed)
+        session = Session(Board(width, height, int(width * height * args.density), seed=rng.getrandbits(64)), first_click=FirstClick.OPENING)
+
+        # Play a bit so the states aren't all the same
+        for _ in range(0, args.clicks):
+            coords = (rng.randrange(0, width), rng.randrange(0, height))
+
+            if session.board._mines[coords[1] * width + coords[0]]:
+                session.toggle_mine_marker(coords)
+            else:
+                session.reveal(coords)
+
+        for name in ('binary', 'zlib', 'pickle'):
+            start = time.perf_counter()
+
+            if name == 'pickle':
+                with open(filename, 'wb') as f:
+                    pickle.dump({'field': session.board, 'duration': 42}, f)
+            else:
+                save_game_manager.save_game(filename, session.board, 42, compress=name == 'zlib')
+
+            saved = time.perf_counter() - start
+
+            start = time.perf_counter()
+
+            if name == 'pickle':
+                with open(filename, 'rb') as f:
+                    board = pickle.load(f)['field']
+            else:
+                board, duration = save_game_manager.load_game(filename, Board)
+
+            loaded = time.perf_counter() - start
+
+            if board._mines != session.board._mines or board._states != session.board._states or board._counts != session.board._counts:
+                raise AssertionError('The {} saved game differs from the original one (size {})'.format(name, size))
+
+            print('{:>12} {:>10} {:>14} {:>12.2f} {:>12.2f}'.format(size, name, os.path.getsize(filename), saved * 1000, loaded * 1000))
+
+    os.remove(filename)
+
+
+def bench_mapped(args):
+    """Compare opening a board kept in a memory-mapped file to loading a saved game (with pickle and in the binary
+    format), then the latency of revealing random areas on it."""
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'save.dat')
+    mapped_save_filename = os.path.join(directory, 'mapped_save.dat')
+    mapped_filename = os.path.join(directory, 'field.map')
+
+    print('{:>12} {:>8} {:>14} {:>10} {:>10} {:>16} {:>15}'.format('Size', 'Format', 'File size (B)', 'Save (ms)', 'Open (ms)', 'Reveal avg (ms)', 'Reveal max (ms)'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        mines = int(width * height * args.density)
+        rng = random.Random(args.seed)
+        seed = rng.getrandbits(64)
+        mapped_board = MappedBoard(width, height, mines, seed=seed, filename=mapped_filename)
+        board = Board.from_buffers(width, height, mines, mines, bytearray(mapped_board._mines), bytearray([AreaState.INITIAL]) * (width * height), seed=seed) # Mapped boards don't get the same mines from a seed
+        sessions = [Session(board, first_click=FirstClick.OPENING), Session(mapped_board, first_click=FirstClick.OPENING)]
+
+        # Play a bit so the states aren't all the same
+        for _ in range(0, args.clicks):
+            coords = (rng.randrange(0, width), rng.randrange(0, height))
+
+            for session in sessions:
+                if session.board._mines[coords[1] * width + coords[0]]:
+                    session.toggle_mine_marker(coords)
+                else:
+                    session.reveal(coords)
+
+        reveals = [(rng.randrange(0, width), rng.randrange(0, height)) for _ in range(0, args.reveals)]
+        final_states = None
+
+        for name in ('pickle', 'binary', 'mapped'):
+            start = time.perf_counter()
+
+            if name == 'pickle':
+                with open(filename, 'wb') as f:
+                    pickle.dump({'field': board, 'duration': 42}, f)
+            elif name == 'binary':
+                save_game_manager.save_game(filename, board, 42)
+            else:
+                save_game_manager.save_game(mapped_save_filename, mapped_board, 42)
+
+                mapped_board.close()
+
+            saved = time.perf_counter() - start
+
+            start = time.perf_counter()
+
+            if name == 'pickle':
+                with open(filename, 'rb') as f:
+                    opened = pickle.load(f)['field']
+            elif name == 'binary':
+                opened, duration = save_game_manager.load_game(filename, Board)
+            else:
+                opened, duration = save_game_manager.load_game(mapped_save_filename, MappedBoard)
+
+            loaded = time.perf_counter() - start
+
+            session = Session(opened, first_click=FirstClick.OPENING)
+            timings = []
+
+            for coords in reveals:
+                if opened._mines[coords[1] * width + coords[0]]: # Not to end the game
+                    continue
+
+                start = time.perf_counter()
+                session.reveal(coords)
+                timings.append(time.perf_counter() - start)
+
+            if final_states is None:
+                final_states = bytes(opened._states)
+            elif bytes(opened._states) != final_states:
+                raise AssertionError('The {} board differs from the original one (size {})'.format(name, size))
+
+            print('{:>12} {:>8} {:>14} {:>10.2f} {:>10.2f} {:>16.3f} {:>15.3f}'.format(
+                size,
+                name,
+                os.path.getsize(mapped_filename if name == 'mapped' else filename),
+                saved * 1000,
+                loaded * 1000,
+                sum(timings) / len(timings) * 1000 if timings else 0,
+                max(timings) * 1000 if timings else 0
+            ))
+
+            if name == 'mapped':
+                opened.close()
+
+    os.remove(filename)
+    os.remove(mapped_save_filename)
+    os.remove(mapped_filename)
+
+
+def bench_persistence(args):
+    """Measure how long saving a game blocks the game loop, when saving directly and through the background worker, and
+    how many writes are merged when saving in bursts."""
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'save.dat')
+
+    print('{:>12} {:>14} {:>14} {:>14} {:>8} {:>8}'.format('Size', 'Direct (ms)', 'Snapshot (ms)', 'Worker (ms)', 'Saves', 'Writes'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        board = Board(width, height, int(width * height * args.density), seed=args.seed)
+
+        start = time.perf_counter()
+        save_game_manager.save_game(filename, board, 0)
+        direct = time.perf_counter() - start
+
+        worker = PersistenceWorker()
+        blocked = 0.0
+
+        for duration in range(0, args.saves):
+            start = time.perf_counter()
+
+            snapshot = save_game_manager.GameSnapshot(board, duration)
+            worker.write(filename, lambda snapshot=snapshot: save_game_manager.dump_game(snapshot, snapshot.duration))
+
+            blocked += time.perf_counter() - start
+
+            time.sleep(args.interval)
+
+        worker.stop()
+
+        _, duration = save_game_manager.load_game(filename, Board)
+
+        if duration != args.saves - 1:
+            raise AssertionError('The last save wasn\'t written (size {})'.format(size))
+
+        print('{:>12} {:>14.2f} {:>14.2f} {:>14.2f} {:>8} {:>8}'.format(
+            size,
+            direct * 1000,
+            blocked / args.saves * 1000,
+            sum(worker.write_durations) / len(worker.write_durations) * 1000,
+            args.saves,
+            worker.writes
+        ))
+
+    os.remove(filename)
+
+
+def bench_history(args):
+    """Measure how fast games are appended to the history, and how long the stats take to read from the precomputed
+    aggregates compared to scanning the games."""
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'history.db')
+    configs = [(9, 9, 10), (16, 16, 40), (30, 16, 99)]
+    rng = random.Random(args.seed)
+
+    history = GameHistory(filename)
+
+    start = time.perf_counter()
+
+    for _ in range(0, args.games // args.batch_size):
+        games = []
+
+        for _ in range(0, args.batch_size):
+            width, height, mines = rng.choice(configs)
+            won = rng.random() < 0.4
+
+            games.append((width, height, mines, rng.getrandbits(64), rng.randint(10, 600), won, rng.randint(1, 300), None))
+
+        history.record_many(games)
+
+    history.close()
+
+    appended = time.perf_counter() - start
+
+    print('Appended {} games in {:.2f} s ({:.0f} games/s), database size: {:.1f} MB'.format(
+        args.games,
+        appended,
+        args.games / appended,
+        os.path.getsize(filename) / 1024 / 1024
+    ))
+
+    start = time.perf_counter()
+    history = GameHistory(filename)
+    print('Opening the history and loading the aggregates: {:.2f} ms'.format((time.perf_counter() - start) * 1000))
+
+    reads = 1000
+    start = time.perf_counter()
+
+    for _ in range(0, reads):
+        aggregate = history.get_aggregate(30, 16, 99)
+        aggregate.win_rate
+        aggregate.get_duration_percentile(50)
+        aggregate.get_duration_percentile(90)
+
+    print('Reading the stats from the aggregates: {:.3f} ms'.format((time.perf_counter() - start) / reads * 1000))
+
+    start = time.perf_counter()
+
+    durations = [row[0] for row in history._connection.execute('SELECT duration FROM games WHERE width = 30 AND height = 16 AND mines = 99 AND won = 1 ORDER BY duration')]
+    wins = history._connection.execute('SELECT SUM(won), COUNT(*) FROM games WHERE width = 30 AND height = 16 AND mines = 99').fetchone()
+
+    print('Computing the same stats by scanning the games: {:.2f} ms'.format((time.perf_counter() - start) * 1000))
+
+    if durations[int(0.5 * (len(durations) - 1))] != aggregate.get_duration_percentile(50) or wins[0] != aggregate.wins:
+        raise AssertionError('The aggregates differ from the games')
+
+    history.close()
+
+    os.remove(filename)
+
+
+def bench_chunks(args):
+    """Measure the memory used by chunked boards and the time taken to reveal areas on them, with the same explored
+    area whatever their size. Their mines and nearby mines counts are first checked against a board generated at once."""
+    width, height = (int(v) for v in args.check_size.split('x'))
+    mines = int(width * height * args.density)
+    chunked = ChunkedBoard(width, height, mines, seed=args.seed, max_chunks=4)
+    chunked_mines = chunked._mines[0:chunked.areas_count]
+    board = Board.from_buffers(width, height, mines, mines, bytearray(chunked_mines), bytearray([AreaState.INITIAL]) * (width * height))
+
+    assert chunked_mines.count(1) == mines, 'Wrong mines count'
+    assert chunked._counts[0:chunked.areas_count] == bytes(board._counts), 'Wrong nearby mines counts'
+    assert chunked._mines[0:chunked.areas_count] == chunked_mines, 'Chunks generated again differ'
+
+    print('{} mines and nearby mines counts checked ({} chunks generated with at most 4 in memory)'.format(args.check_size, chunked.generated_chunks))
+    print()
+    print('{:>16} {:>10} {:>12} {:>14} {:>16} {:>12}'.format('Size', 'Chunks', 'Generated', 'Memory (MB)', 'Reveal (ms)', 'Cleared'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        rng = random.Random(args.seed)
+
+        tracemalloc.start()
+
+        board = ChunkedBoard(width, height, int(width * height * args.density), seed=args.seed)
+        session = Session(board, first_click=FirstClick.SAFE)
+        left = max(0, width // 2 - args.explored // 2)
+        top = max(0, height // 2 - args.explored // 2)
+        timings = []
+
+        for _ in range(0, args.reveals):
+            coords = (left + rng.randrange(0, min(width, args.explored)), top + rng.randrange(0, min(height, args.explored)))
+
+            if board._mines[coords[1] * width + coords[0]] and session.moves:
+                continue
+
+            start = time.perf_counter()
+            session.reveal(coords)
+            timings.append(time.perf_counter() - start)
+
+        used, _ = tracemalloc.get_traced_memory()
+
+        tracemalloc.stop()
+
+        print('{:>16} {:>10} {:>12} {:>14.2f} {:>16.3f} {:>12}'.format(
+            size,
+            board.materialized_chunks,
+            board.generated_chunks,
+            used / 1024 / 1024,
+            sum(timings) / len(timings) * 1000,
+            board.areas_count - board._initial_count
+        ))
+
+
+def bench_minimap(args):
+    """Measure how long computing the whole overview of a field takes (with NumPy if available and in pure Python), and
+    updating it after each move. The updated overview is checked against one computed again entirely."""
+    import minimap
+    from minimap import Minimap
+    from field import Field
+
+    print('{:>12} {:>10} {:>14} {:>14} {:>14}'.format('Size', 'Blocks', 'NumPy (ms)', 'Python (ms)', 'Update (ms)'))
+
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        rng = random.Random(args.seed)
+        field = Field(width, height, int(width * height * args.density), seed=args.seed)
+        session = Session(field, first_click=FirstClick.OPENING)
+        overview = Minimap(settings.MINIMAP_SIZE)
+        timings = {}
+
+        for name in ('numpy', 'python'):
+            if name == 'numpy' and minimap.numpy is None:
+                continue
+
+            numpy, minimap.numpy = minimap.numpy, minimap.numpy if name == 'numpy' else None
+
+            start = time.perf_counter()
+            overview.render(field)
+            timings[name] = time.perf_counter() - start
+
+            minimap.numpy = numpy
+
+        updates = []
+
+        for _ in range(0, args.moves):
+            coords = (rng.randrange(0, width), rng.randrange(0, height))
+
+            if field._mines[coords[1] * width + coords[0]]:
+                session.toggle_mine_marker(coords)
+            else:
+                session.reveal(coords)
+
+            changed_areas = field.pop_changed_areas()
+
+            start = time.perf_counter()
+            overview.update(field, changed_areas)
+            updates.append(time.perf_counter() - start)
+
+        rendered = Minimap(settings.MINIMAP_SIZE)
+        rendered.render(field)
+
+        if rendered._pixels != overview._pixels:
+            raise AssertionError('The updated overview differs from the rendered one (size {})'.format(size))
+
+        print('{:>12} {:>10} {:>14} {:>14.2f} {:>14.3f}'.format(
+            size,
+            '{0}x{0}'.format(overview.areas_per_pixel),
+            '{:.2f}'.format(timings['numpy'] * 1000) if 'numpy' in timings else '-',
+            timings['python'] * 1000,
+            sum(updates) / len(updates) * 1000
+        ))
+
+
+def bench_replay(args):
+    """Measure the size of recorded games played by the solver, and how many moves per second are replayed instantly."""
+    print('{:>14} {:>8} {:>10} {:>12} {:>12} {:>14}'.format('Preset', 'Games', 'Moves', 'Size (B)', 'B/move', 'Moves/s'))
+
+    for preset in args.presets:
+        size, mines = preset.split('/')
+        width, height = (int(v) for v in size.split('x'))
+        rng = random.Random(args.seed)
+        recorded_games = []
+        moves = 0
+
+        for _ in range(0, args.games):
+            session = Session(Board(width, height, int(mines), seed=rng.getrandbits(64)), first_click=FirstClick.SAFE)
+            recorder = Recorder(session)
+            solver = Solver(session.board)
+
+            while session.state == GameState.PLAYING:
+                solver.solve()
+
+                for index in solver.mines:
+                    if session.board._states[index] == AreaState.INITIAL:
+                        coords = (index % width, index // width)
+
+                        session.toggle_mine_marker(coords)
+                        recorder.record(replay.TOGGLE_MINE_MARKER, coords)
+                        solver.update([index])
+
+                coords = solver.hint() if session.state == GameState.PLAYING else None
+
+                if not coords:
+                    break
+
+                recorder.record(replay.REVEAL, coords)
+                solver.update(session.reveal(coords))
+
+            recorded_games.append((recorder.dump(), bytes(session.board._states)))
+            moves += recorder.moves
+
+        start = time.perf_counter()
+
+        for data, states in recorded_games:
+            if bytes(Replay.loads(data).play_instantly().board._states) != states:
+                raise AssertionError('The replayed game differs from the recorded one (preset {})'.format(preset))
+
+        elapsed = time.perf_counter() - start
+        total_size = sum(len(data) for data, _ in recorded_games)
+
+        print('{:>14} {:>8} {:>10} {:>12} {:>12.2f} {:>14.0f}'.format(
+            preset,
+            args.games,
+            moves,
+            total_size,
+            total_size / moves,
+            moves / elapsed
+        ))
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Minesweeper engine benchmarks.')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    parser_memory = subparsers.add_parser('memory', help=bench_memory.__doc__)
+    parser_memory.add_argument('--sizes', nargs='+', default=['30x16', '300x300', '1000x1000'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_memory.add_argument('--density', type=float, default=0.2, help='Ratio of mined areas')
+    parser_memory.set_defaults(func=bench_memory)
+
+    parser_counts = subparsers.add_parser('counts', help=bench_counts.__doc__)
+    parser_counts.add_argument('--sizes', nargs='+', default=['1x1', '7x3', '30x16', '200x200'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_counts.add_argument('--seeds', type=int, default=10, help='Number of random boards per size')
+    parser_counts.add_argument('--max-density', type=float, default=0.3, help='Maximum ratio of mined areas')
+    parser_counts.set_defaults(func=bench_counts)
+
+    parser_flood = subparsers.add_parser('flood', help=bench_flood.__doc__)
+    parser_flood.add_argument('--size', default='2000x2000', help='Empty board size, as WIDTHxHEIGHT')
+    parser_flood.add_argument('--seeds', type=int, default=200, help='Number of random boards to check the flood fill on')
+    parser_flood.set_defaults(func=bench_flood)
+
+    parser_frames = subparsers.add_parser('frames', help=bench_frames.__doc__)
+    parser_frames.add_argument('--sizes', nargs='+', default=['30x16', '150x100'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_frames.add_argument('--density', type=float, default=0.1, help='Ratio of mined areas')
+    parser_frames.add_argument('--frames', type=int, default=300, help='Number of frames to draw per size and mode')
+    parser_frames.add_argument('--click-every', type=int, default=10, help='Number of frames between two clicks')
+    parser_frames.add_argument('--seed', type=int, default=0, help='Seed of the clicks positions')
+    parser_frames.set_defaults(func=bench_frames)
+
+    parser_layers = subparsers.add_parser('layers', help=bench_layers.__doc__)
+    parser_layers.add_argument('--sizes', nargs='+', default=['30x16', '150x100'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_layers.add_argument('--density', type=float, default=0.1, help='Ratio of mined areas')
+    parser_layers.add_argument('--frames', type=int, default=50, help='Number of frames to draw per size and mode')
+    parser_layers.set_defaults(func=bench_layers)
+
+    parser_camera = subparsers.add_parser('camera', help=bench_camera.__doc__)
+    parser_camera.add_argument('--sizes', nargs='+', default=['30x16', '300x300', '2000x2000'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_camera.add_argument('--density', type=float, default=0.15, help='Ratio of mined areas')
+    parser_camera.add_argument('--frames', type=int, default=50, help='Number of frames to draw per size and zoom level')
+    parser_camera.set_defaults(func=bench_camera)
+
+    parser_loop = subparsers.add_parser('loop', help=bench_loop.__doc__)
+    parser_loop.add_argument('--seconds', type=float, default=5, help='Time to run each loop and screen for')
+    parser_loop.set_defaults(func=bench_loop)
+
+    parser_engine = subparsers.add_parser('engine', help=bench_engine.__doc__)
+    parser_engine.add_argument('--presets', nargs='+', default=['9x9/10', '16x16/40', '30x16/99'], help='Board presets, as WIDTHxHEIGHT/MINES')
+    parser_engine.add_argument('--games', type=int, default=2000, help='Number of games to play per preset')
+    parser_engine.add_argument('--seed', type=int, default=0, help='Master seed of the boards and clicks')
+    parser_engine.set_defaults(func=bench_engine)
+
+    parser_solver = subparsers.add_parser('solver', help=bench_solver.__doc__)
+    parser_solver.add_argument('--preset', default='30x16/99', help='Board preset, as WIDTHxHEIGHT/MINES')
+    parser_solver.add_argument('--games', type=int, default=100, help='Number of games to play per mode')
+    parser_solver.add_argument('--seed', type=int, default=0, help='Master seed of the boards')
+    parser_solver.set_defaults(func=bench_solver)
+
+    parser_noguess = subparsers.add_parser('noguess', help=bench_noguess.__doc__)
+    parser_noguess.add_argument('--sizes', nargs='+', default=['9x9', '16x16', '30x16'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_noguess.add_argument('--densities', nargs='+', type=float, default=[0.12, 0.16, 0.2], help='Ratios of mined areas')
+    parser_noguess.add_argument('--boards', type=int, default=20, help='Number of fields to generate per size and density')
+    parser_noguess.add_argument('--processes', type=int, default=None, help='Number of generation processes (0 to generate in the current process, all CPUs by default)')
+    parser_noguess.set_defaults(func=bench_noguess)
+
+    parser_pool = subparsers.add_parser('pool', help=bench_pool.__doc__)
+    parser_pool.add_argument('--presets', nargs='+', default=['30x16/99', '200x200/8000'], help='Board presets, as WIDTHxHEIGHT/MINES')
+    parser_pool.add_argument('--pool-size', type=int, default=2, help='Number of fields built ahead of time')
+    parser_pool.add_argument('--games', type=int, default=10, help='Number of new games to start per preset and mode')
+    parser_pool.add_argument('--pause', type=float, default=1, help='Time between two new games, in seconds')
+    parser_pool.add_argument('--no-guess', action='store_true', help='Build no-guess fields')
+    parser_pool.set_defaults(func=bench_pool)
+
+    parser_firstclick = subparsers.add_parser('firstclick', help=bench_firstclick.__doc__)
+    parser_firstclick.add_argument('--sizes', nargs='+', default=['30x16', '1000x1000', '3000x3000'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_firstclick.add_argument('--density', type=float, default=0.2, help='Ratio of mined areas')
+    parser_firstclick.add_argument('--checks', type=int, default=2000, help='Number of random first clicks to check the counts of')
+    parser_firstclick.add_argument('--seed', type=int, default=0, help='Seed of the boards')
+    parser_firstclick.set_defaults(func=bench_firstclick)
+
+    parser_save = subparsers.add_parser('save', help=bench_save.__doc__)
+    parser_save.add_argument('--sizes', nargs='+', default=['30x16', '300x300', '1000x1000', '3000x3000'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_save.add_argument('--density', type=float, default=0.15, help='Ratio of mined areas')
+    parser_save.add_argument('--clicks', type=int, default=200, help='Number of random clicks played before saving')
+    parser_save.add_argument('--seed', type=int, default=0, help='Seed of the boards and clicks')
+    parser_save.set_defaults(func=bench_save)
+
+    parser_mapped = subparsers.add_parser('mapped', help=bench_mapped.__doc__)
+    parser_mapped.add_argument('--sizes', nargs='+', default=['1000x1000', '4000x4000'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_mapped.add_argument('--density', type=float, default=0.15, help='Ratio of mined areas')
+    parser_mapped.add_argument('--clicks', type=int, default=200, help='Random clicks played before saving')
+    parser_mapped.add_argument('--reveals', type=int, default=1000, help='Random areas revealed once the board is open')
+    parser_mapped.add_argument('--seed', type=int, default=0, help='Seed of the boards and clicks')
+    parser_mapped.set_defaults(func=bench_mapped)
+
+    parser_persistence = subparsers.add_parser('persistence', help=bench_persistence.__doc__)
+    parser_persistence.add_argument('--sizes', nargs='+', default=['30x16', '1000x1000', '3000x3000'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_persistence.add_argument('--density', type=float, default=0.15, help='Ratio of mined areas')
+    parser_persistence.add_argument('--saves', type=int, default=50, help='Number of saves requested per size')
+    parser_persistence.add_argument('--interval', type=float, default=0.01, help='Time between two saves requests, in seconds')
+    parser_persistence.add_argument('--seed', type=int, default=0, help='Seed of the boards')
+    parser_persistence.set_defaults(func=bench_persistence)
+
+    parser_history = subparsers.add_parser('history', help=bench_history.__doc__)
+    parser_history.add_argument('--games', type=int, default=1000000, help='Number of games to append')
+    parser_history.add_argument('--batch-size', type=int, default=10000, help='Number of games appended at once')
+    parser_history.add_argument('--seed', type=int, default=0, help='Seed of the games')
+    parser_history.set_defaults(func=bench_history)
+
+    parser_chunks = subparsers.add_parser('chunks', help=bench_chunks.__doc__)
+    parser_chunks.add_argument('--sizes', nargs='+', default=['1000x1000', '100000x100000', '1000000x1000000'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_chunks.add_argument('--check-size', default='300x200', help='Size of the board checked against one generated at once, as WIDTHxHEIGHT')
+    parser_chunks.add_argument('--density', type=float, default=0.15, help='Ratio of mined areas')
+    parser_chunks.add_argument('--explored', type=int, default=512, help='Side of the square in the middle of the board where areas are revealed')
+    parser_chunks.add_argument('--reveals', type=int, default=2000, help='Number of random areas to reveal')
+    parser_chunks.add_argument('--seed', type=int, default=0, help='Seed of the boards and reveals')
+    parser_chunks.set_defaults(func=bench_chunks)
+
+    parser_minimap = subparsers.add_parser('minimap', help=bench_minimap.__doc__)
+    parser_minimap.add_argument('--sizes', nargs='+', default=['30x16', '200x150', '1000x1000', '4000x4000'], help='Board sizes, as WIDTHxHEIGHT')
+    parser_minimap.add_argument('--density', type=float, default=0.15, help='Ratio of mined areas')
+    parser_minimap.add_argument('--moves', type=int, default=500, help='Random moves played, each one followed by an update')
+    parser_minimap.add_argument('--seed', type=int, default=0, help='Seed of the boards and moves')
+    parser_minimap.set_defaults(func=bench_minimap)
+
+    parser_replay = subparsers.add_parser('replay', help=bench_replay.__doc__)
+    parser_replay.add_argument('--presets', nargs='+', default=['30x16/99', '50x50/400'], help='Board presets, as WIDTHxHEIGHT/MINES')
+    parser_replay.add_argument('--games', type=int, default=20, help='Number of games to record per preset')
+    parser_replay.add_argument('--seed', type=int, default=0, help='Master seed of the boards')
+    parser_replay.set_defaults(func=bench_replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,117 @@
+"""A pool of boards built ahead of time by a background thread, so new games can start without waiting for one."""
+from collections import deque
+import threading
+import logging
+import time
+
+
+class BoardPool:
+    def __init__(self, factory, size=2, discard=None, retry_delay=1, max_retry_delay=60):
+        self.factory = factory # Called without arguments by the worker thread to build a new board
+        self.size = size
+        self.discard = discard # Called with each board left in the pool once it's stopped, e.g. to remove its file
+        self.retry_delay = retry_delay # Time to wait after a board couldn't be built, doubled at each new failure in a row
+        self.max_retry_delay = max_retry_delay # In seconds too
+
+        self.hits = 0 # Boards taken from the pool
+        self.misses = 0 # Boards requested while the pool was empty
+        self.refill_durations = deque(maxlen=100) # Time it took to build each of the last boards, in seconds
+        self.failures = 0 # Boards that couldn't be built
+        self.last_error = None # Exception raised by the last board that couldn't be built
+
+        self._boards = deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._refill, name='BoardPool', daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """The number of boards ready to be taken."""
+        return len(self._boards)
+
+    def pop(self):
+        """Take a board from the pool, or return None if there's none ready yet."""
+        with self._condition:
+            if not self._boards:
+                self.misses += 1
+
+                return None
+
+            board = self._boards.popleft()
+
+            self.hits += 1
+
+            self._condition.notify()
+
+        return board
+
+    def stop(self):
+        """Stop the worker thread once it's done with the board it's building, and discard the boards left."""
+        with self._condition:
+            self._stopped = True
+            boards = list(self._boards)
+
+            self._boards.clear()
+            self._condition.notify()
+
+        for board in boards:
+            self._discard(board)
+
+    def _discard(self, board):
+        """Give a board which won't be taken to the discard function, if any."""
+        if not self.discard:
+            return
+
+        try:
+            self.discard(board)
+        except Exception:
+            logging.exception('Could not discard a board of the pool')
+
+    def _refill(self):
+        """Build boards until the pool is full, then wait for some to be taken. Wait longer and longer before trying
+        again while boards can't be built."""
+        retry_delay = self.retry_delay
+
+        while True:
+            with self._condition:
+                while not self._stopped and len(self._boards) >= self.size:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+            started_at = time.perf_counter()
+
+            try:
+                board = self.factory()
+            except Exception as e:
+                with self._condition:
+                    if self._stopped: # Building may fail while the game is closing
+                        return
+
+                    logging.exception('Could not build a board for the pool, trying again in {} s'.format(retry_delay))
+
+                    self.failures += 1
+                    self.last_error = e
+
+                    self._condition.wait_for(lambda: self._stopped, retry_delay)
+
+                retry_delay = min(retry_delay * 2, self.max_retry_delay)
+
+                continue
+
+            retry_delay = self.retry_delay
+
+            with self._condition:
+                self.refill_durations.append(time.perf_counter() - started_at)
+
+                if not self._stopped:
+                    self._boards.append(board)
+
+                    continue
+
+            self._discard(board) # The pool was stopped while the board was being built
+
+            return
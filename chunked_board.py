@@ -0,0 +1,436 @@
+"""Boards generated chunk by chunk, as they are explored, so their size is only limited by the area the player explored.
+
+The areas are grouped in square chunks of CHUNK_SIZE areas of side. The mines of a chunk are generated from the seed of
+the board and from the coordinates of the chunk only, so any chunk can be generated again at any time, in any order, and
+always gets the same mines. The number of mines of each chunk is the share of the mines of the board its areas are
+entitled to, so the board has exactly the requested mines count.
+
+A chunk is materialized (its nearby mines counts computed, with the mines of the chunks surrounding it for the areas of
+its borders, and its areas states allocated) the first time one of its areas is read. Chunks in which nothing was played
+are kept in a LRU cache, so the least recently used ones are thrown away when there are too many: they would be
+generated again exactly the same. Chunks the player changed are kept for good.
+
+ChunkedBoard keeps the Board interface, its buffers being replaced by ChunkedBuffer views, so sessions, the solver and
+the rendering work the same on both."""
+from engine import Board, AreaState
+from collections import OrderedDict
+import random
+
+CHUNK_SIZE = 64
+
+
+class Chunk:
+    """The areas of a chunk, in flat buffers indexed by y * CHUNK_SIZE + x (relative to the chunk)."""
+    def __init__(self, mines, counts, states):
+        self.mines = mines
+        self.counts = counts
+        self.states = states
+
+
+class ChunkedBuffer:
+    """A read-only view on one of the buffers of the chunks of a ChunkedBoard (mines, counts or states), indexed like the
+    buffers of a Board. Only reading states doesn't need chunks to be materialized: the ones of unplayed chunks are all
+    INITIAL."""
+    def __init__(self, board, name):
+        self.board = board
+        self.name = name
+
+    def __len__(self):
+        return self.board.areas_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, end, step = index.indices(self.board.areas_count)
+
+            if step != 1:
+                raise ValueError('Slices of chunked buffers must be contiguous')
+
+            return self._get_run(start, end)
+
+        if index < 0:
+            index += self.board.areas_count
+
+        x, y = index % self.board.width, index // self.board.width
+
+        return self.board._get_chunk_buffer(x // CHUNK_SIZE, y // CHUNK_SIZE, self.name)[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE]
+
+    def __setitem__(self, index, value):
+        """Only states can be changed, their chunk is then kept for good."""
+        if self.name != 'states':
+            raise TypeError('Only the states of a chunked board can be changed')
+
+        x, y = index % self.board.width, index // self.board.width
+
+        self.board._get_chunk(x // CHUNK_SIZE, y // CHUNK_SIZE, played=True).states[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE] = value
+
+    def _get_run(self, start, end):
+        """Return the values from the start index to the end one (excluded), row by row and chunk by chunk."""
+        width = self.board.width
+        run = bytearray()
+
+        while start < end:
+            x, y = start % width, start // width
+            length = min(end - start, CHUNK_SIZE - x % CHUNK_SIZE, width - x)
+            buffer = self.board._get_chunk_buffer(x // CHUNK_SIZE, y // CHUNK_SIZE, self.name)
+            local = (y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE
+
+            run += buffer[local:local + length]
+            start += length
+
+        return bytes(run)
+
+    def find(self, value, start=0, end=None):
+        """Return the lowest index of an area with the given state (as an int or a single byte) between start and end,
+        or -1. Only the played chunks are searched, unless looking for INITIAL areas."""
+        if self.name != 'states':
+            raise TypeError('Only the states of a chunked board can be searched')
+
+        value = value[0] if isinstance(value, bytes) else value
+        end = self.board.areas_count if end is None else min(end, self.board.areas_count)
+
+        if value == AreaState.INITIAL:
+            return self._find_initial(start, end)
+
+        found = -1
+
+        for (chunk_x, chunk_y), chunk in self.board._played_chunks.items():
+            index = self._find_in_chunk(chunk_x, chunk_y, chunk, value, start, end if found == -1 else found)
+
+            if index != -1:
+                found = index
+
+        return found
+
+    def _find_in_chunk(self, chunk_x, chunk_y, chunk, value, start, end):
+        """Return the lowest index of an area with the given state of the given chunk between start and end, or -1."""
+        width = self.board.width
+        left = chunk_x * CHUNK_SIZE
+        chunk_width = min(CHUNK_SIZE, width - left)
+
+        for row in range(max(0, start // width - chunk_y * CHUNK_SIZE), min(CHUNK_SIZE, self.board.height - chunk_y * CHUNK_SIZE)):
+            row_start = (chunk_y * CHUNK_SIZE + row) * width + left
+
+            if row_start >= end:
+                break
+
+            local = chunk.states.find(value, row * CHUNK_SIZE, row * CHUNK_SIZE + chunk_width)
+
+            while local != -1 and row_start + local - row * CHUNK_SIZE < start:
+                local = chunk.states.find(value, local + 1, row * CHUNK_SIZE + chunk_width)
+
+            if local != -1 and row_start + local - row * CHUNK_SIZE < end:
+                return row_start + local - row * CHUNK_SIZE
+
+        return -1
+
+    def _find_initial(self, start, end):
+        """Return the lowest index of an INITIAL area between start and end, or -1."""
+        width = self.board.width
+
+        while start < end:
+            x, y = start % width, start // width
+            length = min(end - start, CHUNK_SIZE - x % CHUNK_SIZE, width - x)
+            chunk = self.board._played_chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+
+            if not chunk: # Unplayed chunks only have INITIAL areas
+                return start
+
+            local = (y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE
+            index = chunk.states.find(AreaState.INITIAL, local, local + length)
+
+            if index != -1:
+                return start + index - local
+
+            start += length
+
+        return -1
+
+    def count(self, value):
+        """Return the number of areas with the given state."""
+        if self.name != 'states':
+            raise TypeError('Only the states of a chunked board can be counted')
+
+        value = value[0] if isinstance(value, bytes) else value
+        count = 0
+
+        for (chunk_x, chunk_y), chunk in self.board._played_chunks.items():
+            chunk_width = min(CHUNK_SIZE, self.board.width - chunk_x * CHUNK_SIZE)
+
+            # Areas of the chunks on the right and bottom borders which are outside of the board are left INITIAL
+            for row in range(0, min(CHUNK_SIZE, self.board.height - chunk_y * CHUNK_SIZE)):
+                count += chunk.states.count(value, row * CHUNK_SIZE, row * CHUNK_SIZE + chunk_width)
+
+            if value == AreaState.INITIAL:
+                count -= self.board._get_chunk_size(chunk_x, chunk_y)
+
+        if value == AreaState.INITIAL:
+            count += self.board.areas_count
+
+        return count
+
+
+class ChunkedBoard(Board):
+    """A mines field generated chunk by chunk, as it's explored."""
+    can_place_mines = False # Its mines are only given by its seed (and the few ones moved afterwards)
+
+    def __init__(self, width, height, mines, seed=None, max_chunks=1024):
+        self.width = width
+        self.height = height
+        self.mines = self.mines_left = mines
+        self.max_chunks = max_chunks # Maximum number of unplayed chunks kept, materialized or only their mines
+
+        self.areas_count = self.width * self.height
+
+        if self.mines > self.areas_count:
+            raise ValueError('Not enough space for {} mines'.format(self.mines))
+
+        # Chunks are always generated again from the seed, even after some mines were moved
+        self.seed = seed if seed is not None else random.getrandbits(64)
+
+        self.chunks_width = -(-width // CHUNK_SIZE)
+        self.chunks_height = -(-height // CHUNK_SIZE)
+
+        self._played_chunks = {} # (chunk x, chunk y): Chunk, for the chunks with areas that aren't INITIAL anymore
+        self._chunks = OrderedDict() # (chunk x, chunk y): Chunk, for the unplayed ones, least recently used first
+        self._chunks_mines = OrderedDict() # (chunk x, chunk y): mines, for the chunks only read for their mines
+        self._moved_mines = {} # (chunk x, chunk y): {area index in the chunk: 1 if it has a mine else 0}
+
+        self.generated_chunks = 0 # Number of chunks whose mines were generated, including again after being thrown away
+
+        self._mines = ChunkedBuffer(self, 'mines')
+        self._counts = ChunkedBuffer(self, 'counts')
+        self._states = ChunkedBuffer(self, 'states')
+        self._changed_areas = set()
+
+        self._initial_count = self.areas_count
+        self._correctly_marked_count = 0
+        self._wrongly_marked_count = 0
+
+    def __getstate__(self):
+        raise TypeError('Chunked boards are saved with save_game_manager only')
+
+    @classmethod
+    def from_chunks(cls, width, height, mines, mines_left, seed, moved_mines, played_states):
+        """Create a board from the moved mines and the states of the played chunks of a saved one. The chunks are
+        generated again from the seed."""
+        board = cls(width, height, mines, seed=seed)
+
+        board.mines_left = mines_left
+        board._moved_mines = moved_mines
+
+        for key, states in played_states.items():
+            board._get_chunk(*key, played=True).states[:] = states
+
+        board._initial_count, board._correctly_marked_count, board._wrongly_marked_count = board._count_areas()
+
+        return board
+
+    def get_moved_mines(self):
+        """Return a copy of the mines moved since the chunks were generated, by chunk and area index in the chunk."""
+        return dict((key, dict(moved)) for key, moved in self._moved_mines.items())
+
+    def get_played_states(self):
+        """Return a copy of the states of the areas of the played chunks."""
+        return dict((key, bytes(chunk.states)) for key, chunk in self._played_chunks.items())
+
+    @property
+    def materialized_chunks(self):
+        """The number of chunks held in memory with their nearby mines counts and states."""
+        return len(self._played_chunks) + len(self._chunks)
+
+    def _get_chunk_size(self, chunk_x, chunk_y):
+        """Return the number of areas of a chunk, which is lower than CHUNK_SIZE * CHUNK_SIZE on the right and bottom
+        borders of the board."""
+        return min(CHUNK_SIZE, self.width - chunk_x * CHUNK_SIZE) * min(CHUNK_SIZE, self.height - chunk_y * CHUNK_SIZE)
+
+    def _get_chunk_mines_count(self, chunk_x, chunk_y):
+        """Return the number of mines of a chunk: its share of the mines of the board, the areas of the chunks being
+        ordered row by row."""
+        chunk_height = min(CHUNK_SIZE, self.height - chunk_y * CHUNK_SIZE)
+        start = chunk_y * CHUNK_SIZE * self.width + chunk_x * CHUNK_SIZE * chunk_height
+        end = start + self._get_chunk_size(chunk_x, chunk_y)
+
+        return self.mines * end // self.areas_count - self.mines * start // self.areas_count
+
+    def _generate_mines(self, chunk_x, chunk_y):
+        """Generate the mines of a chunk, the same way each time, then apply the mines moved since."""
+        chunk_width = min(CHUNK_SIZE, self.width - chunk_x * CHUNK_SIZE)
+        rng = random.Random('{}/{}/{}'.format(self.seed, chunk_x, chunk_y))
+        mines = bytearray(CHUNK_SIZE * CHUNK_SIZE)
+
+        for position in rng.sample(range(0, self._get_chunk_size(chunk_x, chunk_y)), self._get_chunk_mines_count(chunk_x, chunk_y)):
+            mines[(position // chunk_width) * CHUNK_SIZE + position % chunk_width] = 1
+
+        for local, mined in self._moved_mines.get((chunk_x, chunk_y), {}).items():
+            mines[local] = mined
+
+        self.generated_chunks += 1
+
+        return mines
+
+    def _get_mines(self, chunk_x, chunk_y):
+        """Return the mines of a chunk, without materializing it, or None if it's outside of the board."""
+        if chunk_x < 0 or chunk_y < 0 or chunk_x >= self.chunks_width or chunk_y >= self.chunks_height:
+            return None
+
+        key = (chunk_x, chunk_y)
+        chunk = self._played_chunks.get(key) or self._chunks.get(key)
+
+        if chunk:
+            return chunk.mines
+
+        mines = self._chunks_mines.get(key)
+
+        if mines is None:
+            mines = self._chunks_mines[key] = self._generate_mines(chunk_x, chunk_y)
+
+            if len(self._chunks_mines) > self.max_chunks:
+                self._chunks_mines.popitem(last=False)
+        else:
+            self._chunks_mines.move_to_end(key)
+
+        return mines
+
+    def _get_chunk(self, chunk_x, chunk_y, played=False):
+        """Return a chunk, materializing it if needed. Played chunks are never thrown away."""
+        key = (chunk_x, chunk_y)
+        chunk = self._played_chunks.get(key)
+
+        if chunk:
+            return chunk
+
+        chunk = self._chunks.pop(key, None) or self._materialize(chunk_x, chunk_y)
+
+        if played:
+            self._played_chunks[key] = chunk
+        else:
+            self._chunks[key] = chunk # Most recently used
+
+            if len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+
+        return chunk
+
+    def _get_chunk_buffer(self, chunk_x, chunk_y, name):
+        """Return one of the buffers of a chunk, materializing it only if needed."""
+        if name == 'states' and (chunk_x, chunk_y) not in self._played_chunks:
+            return _INITIAL_STATES
+
+        if name == 'mines':
+            return self._get_mines(chunk_x, chunk_y)
+
+        return getattr(self._get_chunk(chunk_x, chunk_y), name)
+
+    def _materialize(self, chunk_x, chunk_y):
+        """Build a chunk: its mines, the nearby mines counts of its areas and their (INITIAL) states."""
+        mines = self._chunks_mines.pop((chunk_x, chunk_y), None) or self._generate_mines(chunk_x, chunk_y)
+        side = CHUNK_SIZE + 2
+
+        # The mines of the chunk with a border of the mines of the surrounding chunks, whose counts are computed by the
+        # engine as if it was a tiny board
+        padded = bytearray(side * side)
+
+        for row in range(0, CHUNK_SIZE):
+            padded[(row + 1) * side + 1:(row + 2) * side - 1] = mines[row * CHUNK_SIZE:(row + 1) * CHUNK_SIZE]
+
+        for dir_y in (-1, 0, 1):
+            for dir_x in (-1, 0, 1):
+                if not dir_x and not dir_y:
+                    continue
+
+                neighbour_mines = self._get_mines(chunk_x + dir_x, chunk_y + dir_y)
+
+                if neighbour_mines is None:
+                    continue
+
+                rows = [CHUNK_SIZE - 1] if dir_y == -1 else [0] if dir_y == 1 else range(0, CHUNK_SIZE)
+                columns = [CHUNK_SIZE - 1] if dir_x == -1 else [0] if dir_x == 1 else range(0, CHUNK_SIZE)
+
+                for row in rows:
+                    padded_row = 0 if dir_y == -1 else side - 1 if dir_y == 1 else row + 1
+
+                    for column in columns:
+                        padded_column = 0 if dir_x == -1 else side - 1 if dir_x == 1 else column + 1
+
+                        padded[padded_row * side + padded_column] = neighbour_mines[row * CHUNK_SIZE + column]
+
+        padded_mines_count = padded.count(1)
+        counts = Board.from_buffers(side, side, padded_mines_count, padded_mines_count, padded, bytearray(side * side))._counts
+
+        return Chunk(
+            mines,
+            bytearray(b''.join(counts[(row + 1) * side + 1:(row + 2) * side - 1] for row in range(0, CHUNK_SIZE))),
+            bytearray(_INITIAL_STATES)
+        )
+
+    def move_mine(self, from_index, to_index):
+        """Move the mine at the given index to the given unmined area. The move is kept aside so the chunks of both
+        areas are generated again with it, and applied to the chunks in memory."""
+        if not self._mines[from_index] or self._mines[to_index]:
+            raise ValueError('Can\'t move a mine from area {} to area {}'.format(from_index, to_index))
+
+        self._update_counters(from_index, self._states[from_index], -1)
+        self._update_counters(to_index, self._states[to_index], -1)
+
+        for index, mined in ((from_index, 0), (to_index, 1)):
+            x, y = index % self.width, index // self.width
+            key = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+            local = (y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE
+
+            self._moved_mines.setdefault(key, {})[local] = mined
+
+            mines = self._get_mines(*key)
+            mines[local] = mined
+
+        for index in {from_index, to_index}.union(self.get_surrounding_areas(from_index), self.get_surrounding_areas(to_index)):
+            self._update_count(index)
+
+        self._update_counters(from_index, self._states[from_index], 1)
+        self._update_counters(to_index, self._states[to_index], 1)
+
+    def _update_count(self, index):
+        """Compute the nearby mines count of an area again, if its chunk is in memory."""
+        x, y = index % self.width, index // self.width
+        key = (x // CHUNK_SIZE, y // CHUNK_SIZE)
+        chunk = self._played_chunks.get(key) or self._chunks.get(key)
+
+        if chunk:
+            count = 0 if self._mines[index] else sum(self._mines[surrounding] for surrounding in self.get_surrounding_areas(index))
+
+            chunk.counts[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE] = count
+
+    def place_mines(self, indexes):
+        """Unsupported: placing all the mines of a huge board would generate all of its chunks."""
+        raise TypeError('Mines can\'t be placed on chunked boards, they are generated chunk by chunk from their seed')
+
+    def clear_surrounding_areas(self, coords):
+        """Try to clear surrounding areas of a specific area designated by its coordinates, then the surrounding areas
+        of every newly cleared area which has no nearby mines, and so on. Return the set of indexes of the areas that
+        were cleared."""
+        start = coords[1] * self.width + coords[0]
+        revealed = set()
+
+        if self._counts[start] != 0:
+            return revealed
+
+        seeds = [start]
+
+        while seeds:
+            for index in self.get_surrounding_areas(seeds.pop()):
+                if self._states[index] != AreaState.INITIAL or self._mines[index]:
+                    continue
+
+                self._states[index] = AreaState.CLEARED
+                revealed.add(index)
+
+                if self._counts[index] == 0:
+                    seeds.append(index)
+
+        self._initial_count -= len(revealed)
+
+        self._changed_areas.update(revealed)
+
+        return revealed
+
+
+_INITIAL_STATES = bytes([AreaState.INITIAL]) * (CHUNK_SIZE * CHUNK_SIZE)
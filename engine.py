@@ -0,0 +1,595 @@
+"""The game engine: mines fields and games rules, in pure Python.
+
+It doesn't depend on PyGame nor on the settings, so it can run without any display, e.g. on servers or for bots."""
+import random
+import re
+
+try:
+    import numpy
+except ImportError: # NumPy is optional, nearby mines counts will be computed in pure Python without it
+    numpy = None
+
+
+DIRECTIONS = (
+    (0, -1), # Top
+    (1, -1), # Top right
+    (1, 0),  # Right
+    (1, 1),  # Bottom right
+    (0, 1),  # Bottom
+    (-1, 1), # Bottom left
+    (-1, 0), # Left
+    (-1, -1) # Top left
+)
+
+
+class AreaState:
+    INITIAL = 2
+    CLEARED = 4 # This area has been cleared, i.e do not contain any mine
+    MARKED = 8 # This area has been marked as mined by the player
+    EXPLODED = 16 # The player tried to walk on a mine and it doesn't ended well
+
+
+class GameState:
+    PLAYING = 2
+    LOST = 4
+    WON = 8
+    SHOW_STATS = 16
+
+
+class FirstClick:
+    ANY = 2 # The first cleared area may be mined
+    SAFE = 4 # The first cleared area is never mined
+    OPENING = 8 # The first cleared area is never mined, nor the ones surrounding it
+
+
+# Used to search the areas buffers
+_INITIAL_BYTE = bytes([AreaState.INITIAL])
+_CLEARED_BYTE = bytes([AreaState.CLEARED])
+_MARKED_BYTE = bytes([AreaState.MARKED])
+_EXPLODED_BYTE = bytes([AreaState.EXPLODED])
+_NOT_INITIAL = re.compile(b'[^' + re.escape(_INITIAL_BYTE) + b']')
+_NOT_NO_NEARBY_MINES = re.compile(b'[^\\x00]')
+
+
+class Board:
+    """A mines field, without any rendering.
+
+    The state of each area is stored in flat, compact buffers indexed by y * width + x: one byte per area for the mine
+    flag, one for the nearby mines count and one for the AreaState."""
+
+    # When enabled, the running areas counts are checked against a full scan of the field each time they are used
+    check_counters = False
+
+    # Whether place_mines() can replace the mines of this kind of board, e.g. by the ones of a no-guess field
+    can_place_mines = True
+
+    def __init__(self, width, height, mines, seed=None):
+        self.width = width
+        self.height = height
+        self.mines = self.mines_left = mines
+
+        self.areas_count = self.width * self.height
+
+        if self.mines > self.areas_count:
+            raise ValueError('Not enough space for {} mines'.format(self.mines))
+
+        # The seed, if known, is enough to generate the same mines positions again
+        if isinstance(seed, random.Random):
+            self.seed = None
+            rng = seed
+        else:
+            self.seed = seed if seed is not None else random.getrandbits(64)
+            rng = random.Random(self.seed)
+
+        self._mines = bytearray(self.areas_count)
+        self._counts = bytearray(self.areas_count)
+        self._states = bytearray([AreaState.INITIAL]) * self.areas_count
+        self._changed_areas = set()
+
+        # Running counts of uncleared areas and of mine markers, so the win condition can be checked in constant time
+        self._initial_count = self.areas_count
+        self._correctly_marked_count = 0
+        self._wrongly_marked_count = 0
+
+        self._populate(rng)
+        self._compute_nearby_mines()
+
+    def __getstate__(self):
+        """Needed by Pickle to give the proper attributes to be picked."""
+        state = self.__dict__.copy()
+
+        del state['_changed_areas']
+
+        return state
+
+    def __setstate__(self, state):
+        """Needed by Pickle to properly initialize this Board instance."""
+        self.__dict__.update(state)
+
+        self._changed_areas = set()
+
+        if 'seed' not in state: # Saved game made before seeds were kept
+            self.seed = None
+
+        if '_initial_count' not in state: # Saved game made before areas counts were kept
+            self._initial_count, self._correctly_marked_count, self._wrongly_marked_count = self._count_areas()
+
+    @classmethod
+    def from_buffers(cls, width, height, mines, mines_left, mines_buffer, states, seed=None):
+        """Create a board from the mines and states buffers of a saved one, without generating anything. Nearby mines
+        counts are computed again."""
+        board = cls.__new__(cls)
+
+        board.__setstate__({
+            'width': width,
+            'height': height,
+            'mines': mines,
+            'mines_left': mines_left,
+            'areas_count': width * height,
+            'seed': seed,
+            '_mines': mines_buffer,
+            '_counts': bytearray(width * height),
+            '_states': states
+        })
+
+        board._compute_nearby_mines()
+
+        return board
+
+    def toggle_mine_marker(self, coords):
+        """Try to toggle the mine marker of the area at the given coordinates."""
+        x, y = coords
+        index = y * self.width + x
+
+        if self._states[index] == AreaState.INITIAL:
+            if self.mines_left > 0:
+                self._set_state(index, AreaState.MARKED)
+                self.mines_left -= 1
+            else:
+                return False
+        elif self._states[index] == AreaState.MARKED:
+            self._set_state(index, AreaState.INITIAL)
+            self.mines_left += 1
+        else:
+            return False
+
+        return True
+
+    def mark_as_clear(self, coords):
+        """Try to mark the area at the given coordinates as clear."""
+        x, y = coords
+        index = y * self.width + x
+
+        if self._states[index] != AreaState.INITIAL:
+            return False
+
+        if self._mines[index]:
+            self._set_state(index, AreaState.EXPLODED)
+        else:
+            self._set_state(index, AreaState.CLEARED)
+
+        return True
+
+    def pop_changed_areas(self):
+        """Return the set of indexes of the areas which changed since the last call, e.g. to draw them again."""
+        changed_areas = self._changed_areas
+        self._changed_areas = set()
+
+        return changed_areas
+
+    def _set_state(self, index, value):
+        """Change the state of the area at the given index."""
+        self._update_counters(index, self._states[index], -1)
+        self._update_counters(index, value, 1)
+
+        self._states[index] = value
+
+        self._changed_areas.add(index)
+
+    def _update_counters(self, index, state, delta):
+        """Add delta to the running count matching the given state of the area at the given index."""
+        if state == AreaState.INITIAL:
+            self._initial_count += delta
+        elif state == AreaState.MARKED:
+            if self._mines[index]:
+                self._correctly_marked_count += delta
+            else:
+                self._wrongly_marked_count += delta
+
+    def _count_areas(self):
+        """Count the uncleared, correctly marked and wrongly marked areas by scanning the whole field."""
+        initial_count = self._states.count(AreaState.INITIAL)
+        correctly_marked_count = 0
+        wrongly_marked_count = 0
+
+        index = self._states.find(_MARKED_BYTE)
+
+        while index != -1:
+            if self._mines[index]:
+                correctly_marked_count += 1
+            else:
+                wrongly_marked_count += 1
+
+            index = self._states.find(_MARKED_BYTE, index + 1)
+
+        return initial_count, correctly_marked_count, wrongly_marked_count
+
+    def has_cleared_areas(self):
+        """Determine if any area was cleared, i.e. if the game played on this field was started."""
+        return self._states.find(_CLEARED_BYTE) != -1
+
+    def has_exploded(self):
+        """Determine if a mine exploded, i.e. if the game played on this field was lost."""
+        return self._states.find(_EXPLODED_BYTE) != -1
+
+    def is_clear(self):
+        """Determine if the field has been cleared of all of its mines (win condition)."""
+        if self.check_counters:
+            counters = (self._initial_count, self._correctly_marked_count, self._wrongly_marked_count)
+
+            assert counters == self._count_areas(), 'Running areas counts {} differ from the field ones {}'.format(counters, self._count_areas())
+
+        return self._initial_count == 0 and self._correctly_marked_count == self.mines and self._wrongly_marked_count == 0
+
+    def clear_surrounding_areas(self, coords):
+        """Try to clear surrounding areas of a specific area designated by its coordinates, then the surrounding areas
+        of every newly cleared area which has no nearby mines, and so on.
+
+        This is an iterative scanline flood fill: runs of areas without nearby mines are cleared one row span at a time,
+        so opening a large empty region neither hits the recursion limit nor renders anything. Return the set of indexes
+        (y * width + x) of the areas that were cleared."""
+        x, y = coords
+        start = y * self.width + x
+
+        revealed = set()
+        seeds = [start]
+
+        while seeds:
+            seed = seeds.pop()
+            row_start = seed - seed % self.width
+            row_end = row_start + self.width
+
+            if seed == start:
+                left, right = start, start + 1
+                expand = self._counts[start] == 0
+            elif self._states[seed] == AreaState.INITIAL: # Not already cleared with another span
+                left, right = seed, seed + 1
+                expand = True
+            else:
+                continue
+
+            if expand: # Stretch the span to the whole run of uncleared areas without nearby mines around the seed
+                right = self._find_run_end(right, row_end)
+
+                while left > row_start and self._states[left - 1] == AreaState.INITIAL and self._counts[left - 1] == 0:
+                    left -= 1
+
+                self._states[left:right] = _CLEARED_BYTE * (right - left)
+                revealed.update(range(left, right))
+
+            # Then look for areas to clear alongside the span, and in the rows above and below it
+            scan_left = max(left - 1, row_start)
+            scan_right = min(right + 1, row_end)
+
+            ranges = [(scan_left, left), (right, scan_right)]
+
+            if row_start > 0:
+                ranges.append((scan_left - self.width, scan_right - self.width))
+
+            if row_end < self.areas_count:
+                ranges.append((scan_left + self.width, scan_right + self.width))
+
+            for range_start, range_end in ranges:
+                self._scan_for_areas_to_clear(range_start, range_end, seeds, revealed)
+
+        revealed.discard(start)
+
+        self._initial_count -= len(revealed)
+
+        self._changed_areas.update(revealed)
+
+        return revealed
+
+    def _scan_for_areas_to_clear(self, start, end, seeds, revealed):
+        """Clear the uncleared areas between the start and end indexes (same row) with nearby mines, and add the runs of
+        uncleared areas without nearby mines to the flood fill seeds."""
+        row_end = start - start % self.width + self.width
+        index = self._states.find(_INITIAL_BYTE, start, end)
+
+        while index != -1:
+            if self._counts[index] == 0 and not self._mines[index]:
+                seeds.append(index)
+
+                index = self._find_run_end(index + 1, row_end)
+            else:
+                self._states[index] = AreaState.CLEARED
+                revealed.add(index)
+
+                index += 1
+
+            index = self._states.find(_INITIAL_BYTE, index, end) if index < end else -1
+
+    def _find_run_end(self, start, end):
+        """Return the index following the run of uncleared areas without nearby mines beginning at start, up to end."""
+        match = _NOT_NO_NEARBY_MINES.search(self._counts, start, end)
+
+        if match:
+            end = match.start()
+
+        match = _NOT_INITIAL.search(self._states, start, end)
+
+        return match.start() if match else end
+
+    def get_surrounding_areas(self, index):
+        """Return the indexes of the areas surrounding the area at the given index."""
+        x, y = index % self.width, index // self.width
+        surrounding_areas = []
+
+        for dir_x, dir_y in DIRECTIONS:
+            if not self._are_coords_outside_field((x + dir_x, y + dir_y)):
+                surrounding_areas.append(index + dir_y * self.width + dir_x)
+
+        return surrounding_areas
+
+    def _are_coords_outside_field(self, coords):
+        """Determine if the given coords are outside of the field."""
+        x, y = coords
+
+        if x < 0 or x > self.width - 1 or y < 0 or y > self.height - 1:
+            return True
+
+        return False
+
+    def _generate_areas_with_mine(self, rng):
+        """Generate random mines position for the current field, without any repetition, in O(mines) time (O(areas)
+        when the field is densely mined)."""
+        return rng.sample(range(0, self.areas_count), self.mines)
+
+    def _populate(self, rng):
+        """Generate and place random mines for the current field."""
+        for area_number in self._generate_areas_with_mine(rng):
+            self._mines[area_number] = 1
+
+    def place_mines(self, indexes):
+        """Replace the mines of this field, which must not have been played yet, by mines at the given indexes."""
+        if len(indexes) != self.mines:
+            raise ValueError('Expected {} mines, got {}'.format(self.mines, len(indexes)))
+
+        self._mines = bytearray(self.areas_count)
+
+        for index in indexes:
+            self._mines[index] = 1
+
+        self.seed = None # The seed doesn't give these mines positions anymore
+
+        self._compute_nearby_mines()
+
+    def move_mine(self, from_index, to_index):
+        """Move the mine at the given index to the given unmined area, and update the nearby mines counts of both areas
+        and of the ones surrounding them."""
+        if not self._mines[from_index] or self._mines[to_index]:
+            raise ValueError('Can\'t move a mine from area {} to area {}'.format(from_index, to_index))
+
+        # The mine markers counts depend on the mines
+        self._update_counters(from_index, self._states[from_index], -1)
+        self._update_counters(to_index, self._states[to_index], -1)
+
+        self._mines[from_index] = 0
+        count = 0
+
+        for index in self.get_surrounding_areas(from_index):
+            if self._mines[index]:
+                count += 1
+            else:
+                self._counts[index] -= 1
+
+        self._counts[from_index] = count
+
+        self._mines[to_index] = 1
+        self._counts[to_index] = 0 # Mined areas have no nearby mines count
+
+        for index in self.get_surrounding_areas(to_index):
+            if not self._mines[index]:
+                self._counts[index] += 1
+
+        self._update_counters(from_index, self._states[from_index], 1)
+        self._update_counters(to_index, self._states[to_index], 1)
+
+        self.seed = None # The seed doesn't give these mines positions anymore
+
+    def clear_mines_around(self, index, opening=False):
+        """Move the mine of the area at the given index, if any, and the ones of its surrounding areas if opening is
+        True, to random unmarked areas elsewhere. Only the nearby mines counts around the moved mines are updated."""
+        protected_areas = {index}
+
+        if opening:
+            protected_areas.update(
+                surrounding_index for surrounding_index in self.get_surrounding_areas(index)
+                if self._states[surrounding_index] == AreaState.INITIAL
+            )
+
+        sources = [protected_index for protected_index in protected_areas if self._mines[protected_index]]
+
+        if not sources:
+            return
+
+        # Mines are moved the same way each time the same board is played the same way
+        rng = random.Random(self.seed * self.areas_count + index) if self.seed is not None else random.Random()
+        destinations = self._find_unmined_areas(len(sources), protected_areas, rng)
+
+        if len(destinations) < len(sources):
+            if opening: # Not enough space for an opening, make the area itself safe at least
+                self.clear_mines_around(index)
+
+            return
+
+        for from_index, to_index in zip(sorted(sources), destinations):
+            self.move_mine(from_index, to_index)
+
+    def _find_unmined_areas(self, count, excluded_areas, rng):
+        """Return up to count random unmined, unmarked areas outside of the given ones. Areas are picked at random
+        first, which is O(1) per area unless the field is densely mined, then searched in order."""
+        found = []
+
+        for _ in range(0, count * 32):
+            if len(found) == count:
+                return found
+
+            index = rng.randrange(0, self.areas_count)
+
+            if not self._mines[index] and self._states[index] == AreaState.INITIAL and index not in excluded_areas and index not in found:
+                found.append(index)
+
+        for index in range(0, self.areas_count):
+            if len(found) == count:
+                break
+
+            if not self._mines[index] and self._states[index] == AreaState.INITIAL and index not in excluded_areas and index not in found:
+                found.append(index)
+
+        return found
+
+    def _compute_nearby_mines(self):
+        """For each area that aren't mined, compute the surrounding areas that are mined."""
+        if numpy is not None:
+            self._compute_nearby_mines_numpy()
+        else:
+            self._compute_nearby_mines_python()
+
+    def _compute_nearby_mines_numpy(self):
+        """Compute all nearby mines counts at once, straight into the counts buffer: the padded mines grid is summed
+        by 3 areas horizontally, then these sums by 3 rows."""
+        mines = numpy.frombuffer(self._mines, dtype=numpy.uint8).reshape(self.height, self.width)
+        padded = numpy.pad(mines, 1)
+        rows = padded[:, :-2] + padded[:, 1:-1]
+        rows += padded[:, 2:]
+
+        self._counts = bytearray(self.areas_count)
+
+        counts = numpy.frombuffer(self._counts, dtype=numpy.uint8).reshape(self.height, self.width)
+
+        numpy.add(rows[:-2], rows[1:-1], out=counts)
+        counts += rows[2:]
+        counts -= mines # The area itself was summed too
+        counts *= 1 - mines
+
+    def _compute_nearby_mines_python(self):
+        """Compute all nearby mines counts row by row: each row of horizontal 3-areas sums is added to the ones of the
+        rows above and below it."""
+        width = self.width
+        sums = []
+
+        for y in range(0, self.height):
+            padded = b'\x00' + self._mines[y * width:(y + 1) * width] + b'\x00'
+
+            sums.append([padded[x] + padded[x + 1] + padded[x + 2] for x in range(0, width)])
+
+        no_sums = [0] * width
+        counts = bytearray(self.areas_count)
+
+        for y in range(0, self.height):
+            above = sums[y - 1] if y > 0 else no_sums
+            below = sums[y + 1] if y < self.height - 1 else no_sums
+            row = self._mines[y * width:(y + 1) * width]
+
+            counts[y * width:(y + 1) * width] = bytes(
+                0 if has_mine else total for has_mine, total in zip(row, map(sum, zip(above, sums[y], below)))
+            )
+
+        self._counts = counts
+
+    def __str__(self):
+        """Return a text representation of this field."""
+        ret = []
+
+        for y in range(0, self.height):
+            ret_row = '{:>2}|'.format(y)
+
+            for x in range(0, self.width):
+                index = y * self.width + x
+
+                if self._mines[index]:
+                    out = 'X'
+                elif self._counts[index] > 0:
+                    out = str(self._counts[index])
+                else:
+                    out = ' '
+
+                ret_row += out
+
+            ret.append(ret_row)
+
+        return '\n'.join(ret)
+
+
+class Session:
+    """A game on a Board: the games rules, its state and its duration."""
+    def __init__(self, board, duration=0, first_click=FirstClick.ANY):
+        self.board = board
+        self.duration = duration
+        self.first_click = first_click
+
+        self.seed = board.seed # The seed the board was generated from, before any mine was moved
+        self.moves = 0 # Areas cleared or marked by the player
+
+        # Mines are only moved away from the first cleared area if no area was cleared yet
+        self._first_reveal = not board.has_cleared_areas()
+
+        if board.has_exploded():
+            self.state = GameState.LOST
+        elif board.is_clear():
+            self.state = GameState.WON
+        else:
+            self.state = GameState.PLAYING
+
+    def reveal(self, coords):
+        """Try to clear the area at the given coordinates and, if it has no nearby mines, its surrounding areas. Return
+        the set of indexes of the areas that were cleared (or exploded)."""
+        if self.state != GameState.PLAYING:
+            return set()
+
+        x, y = coords
+        index = y * self.board.width + x
+
+        if self._first_reveal and self.first_click != FirstClick.ANY and self.board._states[index] == AreaState.INITIAL:
+            self.board.clear_mines_around(index, opening=self.first_click == FirstClick.OPENING)
+
+        if not self.board.mark_as_clear(coords):
+            return set()
+
+        self._first_reveal = False
+        self.moves += 1
+        revealed = {index}
+
+        if self.board._states[index] == AreaState.EXPLODED:
+            self.state = GameState.LOST
+
+            return revealed
+
+        if self.board._counts[index] == 0:
+            revealed.update(self.board.clear_surrounding_areas(coords))
+
+        self._check_win_condition()
+
+        return revealed
+
+    def toggle_mine_marker(self, coords):
+        """Try to toggle the mine marker of the area at the given coordinates."""
+        if self.state != GameState.PLAYING or not self.board.toggle_mine_marker(coords):
+            return False
+
+        self.moves += 1
+
+        self._check_win_condition()
+
+        return True
+
+    def tick(self, seconds=1):
+        """Count the duration of the game, while it's being played."""
+        if self.state == GameState.PLAYING:
+            self.duration += seconds
+
+    def _check_win_condition(self):
+        """Check if the player won the game."""
+        if self.board.is_clear():
+            self.state = GameState.WON
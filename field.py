@@ -1,315 +1,380 @@
+from chunked_board import ChunkedBoard, CHUNK_SIZE
+from mapped_board import MappedBoard
+from engine import Board, AreaState
 import settings
-import random
 import pygame
+import os
 
 
-DIRECTIONS = (
-    (0, -1), # Top
-    (1, -1), # Top right
-    (1, 0),  # Right
-    (1, 1),  # Bottom right
-    (0, 1),  # Bottom
-    (-1, 1), # Bottom left
-    (-1, 0), # Left
-    (-1, -1) # Top left
-)
+_tile_caches = {}
 
 
-class AreaState:
-    INITIAL = 2
-    CLEARED = 4 # This area has been cleared, i.e do not contain any mine
-    MARKED = 8 # This area has been marked as mined by the player
-    EXPLODED = 16 # The player tried to walk on a mine and it doesn't ended well
+class TileCache:
+    """The images of the areas.
 
-
-class Area(pygame.sprite.Sprite):
-    def __init__(self, field, has_mine, images, fonts):
-        super(Area, self).__init__()
-
-        self.field = field
-        self.has_mine = has_mine
+    There's only a handful of different looks an area can have (its state, its nearby mines count and whether its mine
+    is shown or not), so each of them is rendered once, on the window background, and shared by every area showing it.
+    The same goes for their scaled copies, one per zoom level."""
+    def __init__(self, images, fonts):
         self.images = images
         self.fonts = fonts
 
-        self.nearby_mines_count = 0
-        self.state = AreaState.INITIAL
+        self._tiles = {}
+        self._scaled_tiles = {}
+        self._looks = {} # Side: _Looks
 
-    def __getstate__(self):
-        """Needed by Pickle to give the proper attributes to be picked."""
-        state = self.__dict__.copy()
+    def get(self, state, nearby_mines_count, show_mine, side=None):
+        """Return the image of an area in the given state, with the given nearby mines count and with its mine shown or
+        not, scaled to the given side in pixels if any."""
+        if state != AreaState.CLEARED:
+            nearby_mines_count = 0
 
-        del state['field']
-        del state['images']
-        del state['fonts']
-        del state['image']
-        del state['rect']
+        if state == AreaState.EXPLODED:
+            show_mine = False
 
-        return state
-
-    def __setstate__(self, state):
-        """Needed by Pickle to properly initialize this Area instance."""
-        self.__dict__.update(state)
-
-    @property
-    def state(self):
-        """state getter."""
-        return self._state
+        key = (state, nearby_mines_count, show_mine)
+        tile = self._tiles.get(key)
 
-    @state.setter
-    def state(self, value):
-        """state setter."""
-        self._state = value
+        if tile is None:
+            tile = self._tiles[key] = self._render(state, nearby_mines_count, show_mine)
 
-        self.draw()
+        if side is None or side == tile.get_width():
+            return tile
 
-    def toggle_mine_marker(self):
-        """Try to toggle this area's mine marker."""
-        if self.state not in [AreaState.INITIAL, AreaState.MARKED]:
-            return False
+        scaled_key = key + (side,)
+        scaled_tile = self._scaled_tiles.get(scaled_key)
 
-        if self.state == AreaState.INITIAL:
-            if self.field.mines_left > 0:
-                self.state = AreaState.MARKED
-                self.field.mines_left -= 1
-            else:
-                return False
-        else:
-            self.state = AreaState.INITIAL
-            self.field.mines_left += 1
+        if scaled_tile is None:
+            scaled_tile = self._scaled_tiles[scaled_key] = pygame.transform.smoothscale(tile, (side, side))
 
-        return True
+        return scaled_tile
 
-    def mark_as_clear(self):
-        """Try to mark this area as clear."""
-        if self.state != AreaState.INITIAL:
-            return False
+    def get_many(self, states, nearby_mines_counts, show_mines, side=None):
+        """Return the images of areas given by buffers of their states, nearby mines counts and whether their mine is
+        shown (1) or not (0), scaled to the given side in pixels if any."""
+        looks = self._looks.get(side)
 
-        if self.has_mine:
-            self.state = AreaState.EXPLODED
-        else:
-            self.state = AreaState.CLEARED
+        if looks is None:
+            looks = self._looks[side] = _Looks(self, side)
 
-        return True
+        return list(map(looks.__getitem__, zip(states, nearby_mines_counts, show_mines)))
 
-    def draw(self):
-        """Draw this area."""
-        if self.state in [AreaState.INITIAL, AreaState.MARKED, AreaState.EXPLODED]:
+    def _render(self, state, nearby_mines_count, show_mine):
+        """Render the image of an area."""
+        if state in [AreaState.INITIAL, AreaState.MARKED, AreaState.EXPLODED]:
             background = self.images['area_uncleared']
-        elif self.state == AreaState.CLEARED:
+        elif state == AreaState.CLEARED:
             background = self.images['area_cleared']
 
-        # Create an empty surface and assign it to this area
+        # Create an empty surface
         background_rect = background.get_rect()
 
-        self.image = pygame.Surface(background_rect.size, pygame.SRCALPHA, 32).convert_alpha()
-        self.rect = self.image.get_rect()
+        tile = pygame.Surface(background_rect.size, pygame.SRCALPHA, 32).convert_alpha()
+        tile_rect = tile.get_rect()
 
         # Blit the area background on the empty surface
-        background_rect.center = self.rect.center
+        background_rect.center = tile_rect.center
 
-        self.image.blit(background, background_rect)
+        tile.blit(background, background_rect)
 
         # Game over: show all mines
-        if self.field.show_mines and self.has_mine and self.state != AreaState.EXPLODED:
+        if show_mine:
             mine_rect = self.images['mine'].get_rect()
-            mine_rect.center = self.rect.center
+            mine_rect.center = tile_rect.center
 
-            self.image.blit(self.images['mine'], mine_rect)
+            tile.blit(self.images['mine'], mine_rect)
 
-        if self.state == AreaState.MARKED: # Blit the mine marker, if any
+        if state == AreaState.MARKED: # Blit the mine marker, if any
             mine_marker_rect = self.images['mine_marker'].get_rect()
-            mine_marker_rect.center = self.rect.center
+            mine_marker_rect.center = tile_rect.center
 
-            self.image.blit(self.images['mine_marker'], mine_marker_rect)
-        elif self.state == AreaState.CLEARED and self.nearby_mines_count > 0: # Blit the nearby mines count if > 0
-            nearby_mines_text = self.fonts['nearby_mines_count'].render(str(self.nearby_mines_count), True, self.nearby_mines_count_color)
+            tile.blit(self.images['mine_marker'], mine_marker_rect)
+        elif state == AreaState.CLEARED and nearby_mines_count > 0: # Blit the nearby mines count if > 0
+            nearby_mines_text = self.fonts['nearby_mines_count'].render(str(nearby_mines_count), True, get_nearby_mines_count_color(nearby_mines_count))
             nearby_mines_text_rect = nearby_mines_text.get_rect()
-            nearby_mines_text_rect.center = self.rect.center
+            nearby_mines_text_rect.center = tile_rect.center
 
-            self.image.blit(nearby_mines_text, nearby_mines_text_rect)
-        elif self.state == AreaState.EXPLODED: # The player walked on a mine (game over)
+            tile.blit(nearby_mines_text, nearby_mines_text_rect)
+        elif state == AreaState.EXPLODED: # The player walked on a mine (game over)
             mine_exploded_rect = self.images['mine_exploded'].get_rect()
-            mine_exploded_rect.center = self.rect.center
+            mine_exploded_rect.center = tile_rect.center
 
-            self.image.blit(self.images['mine_exploded'], mine_exploded_rect)
+            tile.blit(self.images['mine_exploded'], mine_exploded_rect)
 
-    @property
-    def nearby_mines_count_color(self):
-        """Return the color corresponding to the nearby mines count of this area."""
-        return settings.NEARBY_MINES_COUNT_COLORS[self.nearby_mines_count] if self.nearby_mines_count in settings.NEARBY_MINES_COUNT_COLORS else None
+        # Flatten the tile on the window background, so it's blitted without any alpha blending
+        opaque_tile = pygame.Surface(tile_rect.size).convert()
+        opaque_tile.fill(settings.WINDOW_BACKGROUND_COLOR)
+        opaque_tile.blit(tile, tile_rect)
 
+        return opaque_tile
 
-class Field:
-    _show_mines = False
 
-    def __init__(self, width, height, mines, images, fonts):
-        self.width = width
-        self.height = height
-        self.mines = self.mines_left = mines
-        self.images = images
-        self.fonts = fonts
+class _Looks(dict):
+    """The images of areas of a given side, by (state, nearby mines count, mine shown) bytes, filled on demand."""
+    def __init__(self, tiles, side):
+        super(_Looks, self).__init__()
 
-        self.areas_count = self.width * self.height
+        self.tiles = tiles
+        self.side = side
 
-        if self.mines > self.areas_count:
-            raise ValueError('Not enough space for {} mines'.format(self.mines))
+    def __missing__(self, look):
+        image = self[look] = self.tiles.get(look[0], look[1], look[2] == 1, self.side)
 
-        self.field = []
+        return image
 
-        self._populate()
-        self._compute_nearby_mines()
 
-    def __getstate__(self):
-        """Needed by Pickle to give the proper attributes to be picked."""
-        state = self.__dict__.copy()
+def get_tile_cache(images, fonts):
+    """Return the tile cache of the given images and fonts, creating it the first time."""
+    key = (id(images), id(fonts))
 
-        del state['images']
-        del state['fonts']
+    if key not in _tile_caches: # Tile caches keep a reference to their images and fonts, so their ids can't be reused
+        _tile_caches[key] = TileCache(images, fonts)
 
-        return state
+    return _tile_caches[key]
+
+
+def get_nearby_mines_count_color(nearby_mines_count):
+    """Return the color corresponding to the given nearby mines count."""
+    return settings.NEARBY_MINES_COUNT_COLORS[nearby_mines_count] if nearby_mines_count in settings.NEARBY_MINES_COUNT_COLORS else None
+
+
+class Area(pygame.sprite.Sprite):
+    """A thin view on a single area of a Field.
+
+    Areas don't hold any data by themselves: everything lives in the compact buffers of their Field. They are created on
+    demand by Field.get_area() and can be thrown away at any time."""
+    def __init__(self, field, x, y):
+        super(Area, self).__init__()
+
+        self.field = field
+        self.x = x
+        self.y = y
+        self.index = y * field.width + x
 
     def __setstate__(self, state):
-        """Needed by Pickle to properly initialize this Field instance."""
+        """Needed by Pickle to load Area instances from saved games made before areas were views. These legacy instances
+        are then converted by Field.__setstate__()."""
         self.__dict__.update(state)
 
-    def post_set_state(self, images, fonts):
-        """Update attributes in this Field instance and all of its Area children."""
-        self.images = images
-        self.fonts = fonts
+    @property
+    def has_mine(self):
+        """has_mine getter."""
+        return self.field._mines[self.index] == 1
 
-        for row in self.field:
-            for area in row:
-                area.field = self
-                area.images = images
-                area.fonts = fonts
+    @property
+    def nearby_mines_count(self):
+        """nearby_mines_count getter."""
+        return self.field._counts[self.index]
 
-                area.draw()
+    @property
+    def state(self):
+        """state getter."""
+        return self.field._states[self.index]
+
+    @state.setter
+    def state(self, value):
+        """state setter."""
+        self.field._set_state(self.index, value)
 
     @property
-    def show_mines(self):
-        """show_mines getter."""
-        return self._show_mines
+    def image(self):
+        """The rendered image of this area."""
+        return self.field.get_image(self.index)
 
-    @show_mines.setter
-    def show_mines(self, value):
-        """show_mines setter."""
-        self._show_mines = value
+    def toggle_mine_marker(self):
+        """Try to toggle this area's mine marker."""
+        return self.field.toggle_mine_marker((self.x, self.y))
 
-        if self._show_mines:
-            for row in self.field:
-                for area in row:
-                    if area.has_mine:
-                        area.draw()
+    def mark_as_clear(self):
+        """Try to mark this area as clear."""
+        return self.field.mark_as_clear((self.x, self.y))
 
-    def is_clear(self):
-        """Determine if the field has been cleared of all of its mines (win condition)."""
-        for row in self.field:
-            for area in row:
-                if (area.has_mine and area.state != AreaState.MARKED) or area.state == AreaState.INITIAL:
-                    return False
+    def draw(self):
+        """Return the image of this area, from the tiles shared by all areas."""
+        return self.field.get_image(self.index)
 
-        return True
+    @property
+    def nearby_mines_count_color(self):
+        """Return the color corresponding to the nearby mines count of this area."""
+        return get_nearby_mines_count_color(self.nearby_mines_count)
 
-    def clear_surrounding_areas(self, coords):
-        """Try to clear surrounding areas of a specific area designated by its coordinates."""
-        for direction in DIRECTIONS:
-            coords_x, coords_y = coords
-            dir_x, dir_y = direction
 
-            x = coords_x + dir_x
-            y = coords_y + dir_y
+class _AreaRow:
+    """A read-only, list-like row of areas, so field.field[y][x] keeps working."""
+    def __init__(self, field, y):
+        self.field = field
+        self.y = y
 
-            if self._are_coords_outside_field((x, y)):
-                continue
+    def __len__(self):
+        return self.field.width
 
-            area = self.field[y][x]
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.field.width
 
-            if area.state == AreaState.INITIAL:
-                area.state = AreaState.CLEARED
+        if x < 0 or x > self.field.width - 1:
+            raise IndexError('Area index out of range')
 
-                if area.nearby_mines_count == 0:
-                    self.clear_surrounding_areas((x, y))
+        return self.field.get_area(x, self.y)
 
-    def _are_coords_outside_field(self, coords):
-        """Determine if the given coords are outside of the field."""
-        x, y = coords
+    def __iter__(self):
+        for x in range(0, self.field.width):
+            yield self.field.get_area(x, self.y)
 
-        if x < 0 or x > self.width - 1 or y < 0 or y > self.height - 1:
-            return True
 
-        return False
+class _AreaRows:
+    """A read-only, list-like grid of areas, so field.field[y][x] keeps working."""
+    def __init__(self, field):
+        self.field = field
 
-    def _generate_areas_with_mine(self):
-        """Generate random mines position for the current field."""
-        areas_with_mine = []
+    def __len__(self):
+        return self.field.height
 
-        for _ in range(0, self.mines):
-            while True:
-                random_area_number = random.randint(0, self.areas_count - 1)
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.field.height
 
-                if random_area_number not in areas_with_mine:
-                    areas_with_mine.append(random_area_number)
+        if y < 0 or y > self.field.height - 1:
+            raise IndexError('Row index out of range')
 
-                    break
+        return _AreaRow(self.field, y)
 
-        return areas_with_mine
+    def __iter__(self):
+        for y in range(0, self.field.height):
+            yield _AreaRow(self.field, y)
 
-    def _populate(self):
-        """Generate and place random mines for the current field."""
-        areas_with_mine = self._generate_areas_with_mine()
-        area_number = 0
 
-        for y in range(0, self.height):
-            row = []
+class Field(Board):
+    """A mines field, rendered with PyGame.
 
-            for x in range(0, self.width):
-                row.append(Area(
-                    field=self,
-                    has_mine=area_number in areas_with_mine,
-                    images=self.images,
-                    fonts=self.fonts
-                ))
+    Area instances are only views on the buffers of the Board, and their images come from a TileCache shared by all
+    areas."""
+    _show_mines = False
 
-                area_number += 1
+    def __init__(self, width, height, mines, images=None, fonts=None, seed=None):
+        super(Field, self).__init__(width, height, mines, seed=seed)
 
-            self.field.append(row)
+        self.images = images
+        self.fonts = fonts
+        self.tiles = get_tile_cache(images, fonts) if images is not None else None
+
+    def __getstate__(self):
+        """Needed by Pickle to give the proper attributes to be picked."""
+        state = super(Field, self).__getstate__()
+
+        del state['images']
+        del state['fonts']
+        del state['tiles']
 
-    def _compute_nearby_mines(self):
-        """For each area that aren't mined, compute the surrounding areas that are mined."""
-        for y, row in enumerate(self.field):
+        return state
+
+    def __setstate__(self, state):
+        """Needed by Pickle to properly initialize this Field instance."""
+        self.tiles = None
+
+        if 'field' in state: # Saved game made when fields were lists of Area objects
+            rows = state.pop('field')
+
+            self.__dict__.update(state)
+            self._migrate_legacy_areas(rows)
+
+            state = self.__dict__.copy()
+
+        super(Field, self).__setstate__(state)
+
+    def _migrate_legacy_areas(self, rows):
+        """Fill the buffers of this Field from a list of lists of legacy Area objects."""
+        self._mines = bytearray(self.areas_count)
+        self._counts = bytearray(self.areas_count)
+        self._states = bytearray(self.areas_count)
+
+        for y, row in enumerate(rows):
             for x, area in enumerate(row):
-                if area.has_mine:
-                    continue
+                index = y * self.width + x
+
+                self._mines[index] = 1 if area.__dict__['has_mine'] else 0
+                self._counts[index] = area.__dict__['nearby_mines_count']
+                self._states[index] = area.__dict__['_state']
+
+    def post_set_state(self, images, fonts):
+        """Update attributes in this Field instance after it was unpickled."""
+        self.images = images
+        self.fonts = fonts
+        self.tiles = get_tile_cache(images, fonts)
+
+    @property
+    def field(self):
+        """A list-like grid of Area views, indexed by [y][x]."""
+        return _AreaRows(self)
 
-                for direction in DIRECTIONS:
-                    dir_x, dir_y = direction
+    @property
+    def show_mines(self):
+        """show_mines getter."""
+        return self._show_mines
 
-                    nearby_x = x + dir_x
-                    nearby_y = y + dir_y
+    @show_mines.setter
+    def show_mines(self, value):
+        """show_mines setter."""
+        self._show_mines = value
 
-                    if self._are_coords_outside_field((nearby_x, nearby_y)):
-                        continue
+        index = self._mines.find(1)
 
-                    if self.field[nearby_y][nearby_x].has_mine:
-                        area.nearby_mines_count += 1
+        while index != -1:
+            self._changed_areas.add(index)
 
-    def __str__(self):
-        """Return a text representation of this field."""
-        ret = []
+            index = self._mines.find(1, index + 1)
 
-        for y, row in enumerate(self.field):
-            ret_row = '{:>2}|'.format(y)
+    def get_area(self, x, y):
+        """Return a view on the area at the given coordinates."""
+        return Area(self, x, y)
 
-            for area in row:
-                if area.has_mine:
-                    out = 'X'
-                elif area.nearby_mines_count > 0:
-                    out = str(area.nearby_mines_count)
-                else:
-                    out = ' '
+    def get_image(self, index, side=None):
+        """Return the image of the area at the given index, scaled to the given side in pixels if any."""
+        return self.tiles.get(self._states[index], self._counts[index], self._show_mines and self._mines[index] == 1, side)
 
-                ret_row += out
+    def get_images(self, start, end, side=None):
+        """Return the images of the areas from the start index to the end one (excluded), scaled to the given side in
+        pixels if any. Much faster than calling get_image() for each of them when there are many."""
+        mines = self._mines[start:end] if self._show_mines else bytes(end - start)
 
-            ret.append(ret_row)
+        return self.tiles.get_many(self._states[start:end], self._counts[start:end], mines, side)
 
-        return '\n'.join(ret)
+
+class ChunkedField(Field, ChunkedBoard):
+    """A mines field generated chunk by chunk as it's explored, rendered with PyGame."""
+    @property
+    def show_mines(self):
+        """show_mines getter."""
+        return self._show_mines
+
+    @show_mines.setter
+    def show_mines(self, value):
+        """show_mines setter. Only the mines of the chunks in memory are searched: the others were never drawn."""
+        self._show_mines = value
+
+        for (chunk_x, chunk_y), chunk in list(self._played_chunks.items()) + list(self._chunks.items()):
+            local = chunk.mines.find(1)
+
+            while local != -1:
+                self._changed_areas.add((chunk_y * CHUNK_SIZE + local // CHUNK_SIZE) * self.width + chunk_x * CHUNK_SIZE + local % CHUNK_SIZE)
+
+                local = chunk.mines.find(1, local + 1)
+
+
+class MappedField(Field, MappedBoard):
+    """A mines field kept in a memory-mapped file, rendered with PyGame."""
+    @property
+    def directory(self):
+        """Where new fields files are created: next to the saved game, which gives the name of the one it was played on."""
+        return os.path.dirname(os.path.abspath(settings.SAVE_FILE_NAME))
+
+    @property
+    def show_mines(self):
+        """show_mines getter."""
+        return self._show_mines
+
+    @show_mines.setter
+    def show_mines(self, value):
+        """show_mines setter. The mines aren't searched: they're only shown once the game ended, which draws the whole
+        field again anyway."""
+        self._show_mines = value
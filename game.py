@@ -1,9 +1,20 @@
-from collections import OrderedDict
-from field import Field, AreaState
+from collections import OrderedDict, deque
+from itertools import repeat
+from persistence import PersistenceWorker
+from board_pool import BoardPool
+from replay import Recorder, Replay
+from history import GameHistory
+from engine import Session
+from solver import Solver
+from field import Field, ChunkedField, MappedField
+from mapped_board import MappedBoard
+from minimap import Minimap
 import save_game_manager
 import stats_manager
 import settings
 import logging
+import generator
+import replay
 import helpers
 import random
 import pygame
@@ -12,12 +23,10 @@ import sys
 import os
 
 
-class Game:
-    save_data = [
-        'field',
-        'duration'
-    ]
+GAME_DURATION_EVENT = pygame.USEREVENT + 1
+
 
+class Game:
     stats = OrderedDict([
         ('play_time', {'name': 'Play time', 'value': 0, 'format': helpers.humanize_seconds}),
         ('longest_game', {'name': 'Longest game', 'value': 0, 'format': helpers.humanize_seconds}),
@@ -26,12 +35,70 @@ class Game:
         ('games_lost', {'name': 'Total games lost', 'value': 0, 'format': helpers.humanize_integer})
     ])
 
-    def __init__(self):
+    def __init__(self, replay_filename=None, replay_speed=1):
         self.clock = pygame.time.Clock()
         self.window = pygame.display.set_mode(settings.WINDOW_SIZE, pygame.DOUBLEBUF)
         self.window_rect = self.window.get_rect()
+        self.field_rect = pygame.Rect(0, settings.INFO_PANEL_HEIGHT, self.window_rect.w, self.window_rect.h - settings.INFO_PANEL_HEIGHT)
 
         self.started_playing_at = None
+        self.duration_counter_next_tick_at = None
+
+        # CPU time used by the game during each of the last 60 minutes
+        self.cpu_time_per_minute = deque(maxlen=60)
+        self._minute_started_at = time.monotonic()
+        self._minute_started_cpu_time = time.process_time()
+
+        # Position of the window in the field, in pixels, and the scale at which the field is displayed
+        self.camera = [0, 0]
+        self.zoom = 1
+        self._drag_started_at = None # Mouse position and camera when the field started to be dragged
+
+        # Overview of fields larger than the window, and where it was drawn if it was
+        self.minimap = Minimap(settings.MINIMAP_SIZE) if settings.MINIMAP_SIZE else None
+        self.minimap_rect = None
+        self._dragging_minimap = False
+
+        # What was drawn on the previous frame, used to only draw again what changed since then
+        self._drawn_field = None
+        self._drawn_state = None
+        self._drawn_view = None
+        self._drawn_info_panel = None
+
+        # Static layers of the window, by name
+        self._layers = {}
+
+        # Fields are generated at once or chunk by chunk, as they are explored, or kept in a file
+        self.field_class = MappedField if settings.MAPPED else ChunkedField if settings.CHUNKED else Field
+
+        # Solver of the current game, created on the first hint request, and index of the hinted area
+        self.solver = None
+        self.hint_index = None
+
+        # Pool of processes searching no-guess fields, whose mines are then placed on the new fields
+        self.generator_executor = generator.create_executor() if settings.NO_GUESS and self.field_class.can_place_mines else None
+
+        if settings.NO_GUESS and not self.field_class.can_place_mines:
+            logging.warning('No-guess fields can\'t be played with chunked fields, playing random ones')
+
+        # Saved game and stats are written in a background thread, the game in progress every AUTOSAVE_INTERVAL seconds
+        self.persistence = PersistenceWorker()
+        self.next_autosave_at = time.monotonic() + settings.AUTOSAVE_INTERVAL
+        self._unsaved_changes = False
+
+        # The current game, and the file of the mapped field the saved game was played on, if any
+        self.session = None
+        self.saved_field_filename = None
+
+        # Moves of the current game, and the replayed game if any
+        self.recorder = None
+        self.replay = None
+        self.replay_speed = replay_speed # Speed factor of the replay, or 0 to show its final state at once
+        self.replay_started_at = None
+        self.replay_next_move = 0
+
+        # New fields built ahead of time in a background thread
+        self.field_pool = BoardPool(self._create_field, settings.FIELD_POOL_SIZE, self._discard_field) if settings.FIELD_POOL_SIZE else None
 
         pygame.display.set_caption('Minesweeper')
         pygame.display.set_icon(helpers.load_image('icon.png'))
@@ -40,19 +107,31 @@ class Game:
         self._load_images()
         self._load_sounds()
 
+        self.texts = helpers.TextCache()
+
         stats_manager.load_stats(settings.STATS_FILE_NAME, self.stats)
 
-        if os.path.isfile(settings.SAVE_FILE_NAME):
-            save_game_manager.load_game(settings.SAVE_FILE_NAME, self, self.save_data)
+        self.history = GameHistory(settings.HISTORY_FILE_NAME)
+
+        saved_game = save_game_manager.load_game(settings.SAVE_FILE_NAME, self.field_class)
+
+        if saved_game:
+            self.field, self.duration = saved_game
+
+            if isinstance(self.field, MappedBoard):
+                self.saved_field_filename = self.field.filename
 
             self.field.post_set_state(images=self.images, fonts=self.fonts)
 
-            self.state = settings.GameState.PLAYING
+            self.state = self.session.state
 
-            self._toggle_duration_counter(True)
+            self._toggle_duration_counter(self.state == settings.GameState.PLAYING)
         else:
             self._start_new_game()
 
+        if replay_filename:
+            self._start_replay(Replay.load(replay_filename))
+
     def _load_fonts(self):
         """Load the fonts."""
         logging.info('Loading fonts')
@@ -97,19 +176,102 @@ class Game:
 
         self._update_play_time()
 
-        self.field = Field(
-            width=settings.WIDTH,
-            height=settings.HEIGHT,
-            mines=settings.MINES,
-            images=self.images,
-            fonts=self.fonts
-        )
+        new_field = self.field_pool.pop() if self.field_pool else None
+
+        if not new_field:
+            new_field = self._create_field()
+
+        field, start = new_field
+
+        field.post_set_state(images=self.images, fonts=self.fonts)
+
+        self._close_field()
+
+        self.session = Session(field, first_click=settings.FIRST_CLICK)
+        self.recorder = Recorder(self.session)
+        self.replay = None
+
+        if start:
+            self.recorder.record(replay.REVEAL, start)
+            self.session.reveal(start)
+
+        if self.field_pool:
+            logging.info('Fields pool: {} ready, {} taken, {} built on demand, {} failed to build'.format(
+                self.field_pool.depth,
+                self.field_pool.hits,
+                self.field_pool.misses,
+                self.field_pool.failures
+            ))
 
-        self.duration = 0
         self.state = settings.GameState.PLAYING
         self.started_playing_at = int(time.time())
+        self.hint_index = None
 
         self._toggle_duration_counter(True)
+        self._save_game()
+
+    def _create_field(self):
+        """Build a new field, without images so it can be built outside of the main thread. Return it along with the
+        coordinates of the area to reveal when the game starts, if any."""
+        field = self.field_class(
+            width=settings.WIDTH,
+            height=settings.HEIGHT,
+            mines=settings.MINES
+        )
+
+        if not settings.NO_GUESS or not field.can_place_mines: # No-guess fields are generated at once, then their mines placed on the field
+            return field, None
+
+        start = generator.get_start_area(field.width, field.height)
+        started_at = time.perf_counter()
+
+        mines_indexes = generator.generate_no_guess_mines(
+            field.width,
+            field.height,
+            field.mines,
+            start=start,
+            executor=self.generator_executor
+        )
+
+        if mines_indexes is None:
+            logging.warning('No no-guess field found, playing a random one')
+
+            return field, None
+
+        logging.info('No-guess field generated in {:.3f} s'.format(time.perf_counter() - started_at))
+
+        field.place_mines(mines_indexes)
+
+        return field, start
+
+    def _discard_field(self, new_field):
+        """Remove the file of a field built by _create_field() which won't be played, if it's kept in a file."""
+        field, _ = new_field
+
+        if isinstance(field, MappedBoard):
+            field.close()
+
+            os.remove(field.filename)
+
+    @property
+    def field(self):
+        """The mines field of the current game."""
+        return self.session.board
+
+    @field.setter
+    def field(self, value):
+        """field setter, which starts a new game session on the given field."""
+        self.session = Session(value, first_click=settings.FIRST_CLICK)
+
+    @property
+    def duration(self):
+        """The duration of the current game, in seconds."""
+        return self.session.duration
+
+    @duration.setter
+    def duration(self, value):
+        """duration setter."""
+        self.session.duration = value
 
     def _update_play_time(self):
         """Update the play time in the stats."""
@@ -128,13 +290,131 @@ class Game:
 
         self._update_play_time()
 
+    def _save_game(self):
+        """Save a snapshot of the current game in the background, or remove the saved game if it was lost. Mapped fields
+        are flushed to their file in the background too, and the saved game only points to it."""
+        if self.state == settings.GameState.LOST:
+            self.persistence.remove(settings.SAVE_FILE_NAME)
+        else:
+            snapshot = save_game_manager.GameSnapshot(self.field, self.duration)
+
+            self.persistence.write(settings.SAVE_FILE_NAME, lambda: save_game_manager.dump_game(snapshot, snapshot.duration))
+
+        previous_filename = self.saved_field_filename
+        self.saved_field_filename = self.field.filename if isinstance(self.field, MappedBoard) and self.state != settings.GameState.LOST else None
+
+        # The file of the field the saved game was played on is removed once replaced, unless it's still played
+        if previous_filename not in (None, self.saved_field_filename, getattr(self.field, 'filename', None)):
+            self.persistence.remove(previous_filename)
+
+        self._unsaved_changes = False
+        self.next_autosave_at = time.monotonic() + settings.AUTOSAVE_INTERVAL
+
+    def _close_field(self):
+        """Unmap the field of the current game if it's kept in a file, before it's replaced. The file is removed in the
+        background if the saved game wasn't played on it (e.g. the one of a replay)."""
+        if self.session and isinstance(self.field, MappedBoard):
+            self.field.close()
+
+            if self.field.filename != self.saved_field_filename:
+                self.persistence.remove(self.field.filename)
+
+    def _save_stats(self):
+        """Save the stats in the background."""
+        data = stats_manager.dump_stats(self.stats)
+
+        self.persistence.write(settings.STATS_FILE_NAME, lambda: data)
+
+    def _start_replay(self, recorded_game):
+        """Replace the current game by the given recorded one, which is then played back."""
+        logging.info('Replaying game')
+
+        self._update_play_time()
+        self._close_field()
+
+        self.session = recorded_game.create_session(Field, ChunkedField, MappedField)
+        self.field.post_set_state(images=self.images, fonts=self.fonts)
+
+        self.recorder = None
+        self.replay = recorded_game
+        self.replay_started_at = time.monotonic()
+        self.replay_next_move = 0
+        self.state = settings.GameState.PLAYING
+        self.hint_index = None
+
+        self._toggle_duration_counter(False)
+
+    def _update_replay(self):
+        """Play the moves of the replayed game which are due. Return True if any was."""
+        if not self.replay or self.replay_next_move >= len(self.replay.moves):
+            return False
+
+        if self.replay_speed:
+            elapsed = (time.monotonic() - self.replay_started_at) * 1000 * self.replay_speed
+            due = self.replay_next_move
+
+            while due < len(self.replay.moves) and self.replay.moves[due][0] <= elapsed:
+                due += 1
+        else:
+            due = len(self.replay.moves)
+
+        if due == self.replay_next_move:
+            return False
+
+        moves = self.replay.moves[self.replay_next_move:due]
+
+        self.replay.play(self.session, moves)
+        self.replay_next_move = due
+        self.session.duration = moves[-1][0] // 1000
+
+        if self.session.state != settings.GameState.PLAYING:
+            self.state = self.session.state
+
+            if self.state == settings.GameState.LOST:
+                self.field.show_mines = True
+
+        return True
+
+    def _get_replay_next_move_at(self):
+        """Return when the next move of the replayed game is due, or None if there's none."""
+        if not self.replay or not self.replay_speed or self.replay_next_move >= len(self.replay.moves):
+            return None
+
+        return self.replay_started_at + self.replay.moves[self.replay_next_move][0] / 1000 / self.replay_speed
+
+    def _save_replay(self):
+        """Save the moves of the game that just ended in the background, so it can be replayed."""
+        if self.recorder:
+            data = self.recorder.dump()
+
+            self.persistence.write(settings.REPLAY_FILE_NAME, lambda: data)
+
+    def _record_game(self):
+        """Append the game that just ended to the games history."""
+        self.history.record(
+            self.field.width,
+            self.field.height,
+            self.field.mines,
+            self.session.seed,
+            self.duration,
+            self.session.state == settings.GameState.WON,
+            self.session.moves
+        )
+
+    def _autosave(self):
+        """Save the game in progress if it changed and it wasn't saved for AUTOSAVE_INTERVAL seconds."""
+        if self._unsaved_changes and time.monotonic() >= self.next_autosave_at:
+            self._save_game()
+
     def _toggle_duration_counter(self, enable=True):
         """Update the game duration counter event."""
-        pygame.time.set_timer(settings.GAME_DURATION_EVENT, 1000 if enable else 0) # Every seconds
+        pygame.time.set_timer(GAME_DURATION_EVENT, 1000 if enable else 0) # Every seconds
+
+        self.duration_counter_next_tick_at = time.monotonic() + 1 if enable else None
 
     def _check_win_condition(self):
         """Check if the player won the game."""
-        if self.field.is_clear():
+        if self.session.state == settings.GameState.WON:
             logging.info('Game won')
 
             random.choice(self.sounds['win']).play()
@@ -146,11 +426,16 @@ class Game:
 
             self.stats['games_won']['value'] += 1
 
+            self._record_game()
+            self._save_replay()
+            self._save_game()
+            self._save_stats()
+
     def _toggle_stats(self, force=None):
         if force is False or (force is None and self.state == settings.GameState.SHOW_STATS):
             self.state = settings.GameState.PLAYING
 
-            self._toggle_duration_counter(True)
+            self._toggle_duration_counter(not self.replay) # Replays have their own duration
 
             logging.info('Hiding stats')
         elif force is True or (force is None and self.state != settings.GameState.SHOW_STATS):
@@ -165,9 +450,19 @@ class Game:
         Also known as the game loop."""
 
         # Events handling
-        for event in pygame.event.get():
+        if settings.EVENT_DRIVEN: # Sleep until an event happens
+            events = [pygame.event.wait(self._get_event_wait_timeout())] + pygame.event.get()
+        else:
+            events = pygame.event.get()
+
+        handled = False
+
+        for event in events:
             event_handlers = [
                 self._event_quit,
+                self._event_window_exposed,
+                self._event_camera,
+                self._event_minimap,
                 self._event_area_left_click,
                 self._event_area_right_click,
                 self._event_game_key,
@@ -176,26 +471,54 @@ class Game:
 
             for handler in event_handlers:
                 if handler(event):
+                    handled = True
+
                     break
 
+        if self._update_replay():
+            handled = True
+
+        self._autosave()
+
         # Drawings
-        self.window.fill(settings.WINDOW_BACKGROUND_COLOR)
+        if handled or not settings.EVENT_DRIVEN:
+            self._draw()
 
-        self._draw_info_panel()
-        self._draw_grid()
-        self._draw_field()
+        self._update_cpu_time()
 
-        if self.state == settings.GameState.LOST:
-            self._draw_lost_screen()
-        elif self.state == settings.GameState.WON:
-            self._draw_won_screen()
-        elif self.state == settings.GameState.SHOW_STATS:
-            self._draw_stats_screen()
+        if not settings.EVENT_DRIVEN:
+            self.clock.tick(settings.FPS)
+
+    def _get_event_wait_timeout(self):
+        """Return the maximum time to wait for an event, in milliseconds: until the next game duration counter event or
+        the end of the current minute of CPU time measurement, whichever comes first."""
+        wake_up_at = self._minute_started_at + 60
+
+        if self.duration_counter_next_tick_at:
+            wake_up_at = min(wake_up_at, self.duration_counter_next_tick_at)
+
+        replay_next_move_at = self._get_replay_next_move_at()
 
-        # PyGame-related updates
-        pygame.display.update()
+        if replay_next_move_at:
+            wake_up_at = min(wake_up_at, replay_next_move_at)
 
-        self.clock.tick(settings.FPS)
+        return max(1, int((wake_up_at - time.monotonic()) * 1000))
+
+    def _update_cpu_time(self):
+        """Record the CPU time used by the game every minute."""
+        now = time.monotonic()
+
+        if now - self._minute_started_at < 60:
+            return
+
+        cpu_time = time.process_time()
+
+        self.cpu_time_per_minute.append(cpu_time - self._minute_started_cpu_time)
+
+        logging.info('CPU time used during the last minute: {:.2f} s'.format(self.cpu_time_per_minute[-1]))
+
+        self._minute_started_at = now
+        self._minute_started_cpu_time = cpu_time
 
     # --------------------------------------------------------------------------
     # Events handlers
@@ -203,26 +526,168 @@ class Game:
     def _event_quit(self, event):
         """Called when the game must be closed."""
         if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-            if self.state != settings.GameState.LOST:
-                save_game_manager.save_game(settings.SAVE_FILE_NAME, self, self.save_data)
+            if self.state != settings.GameState.LOST and not self.replay: # Replays don't replace the saved game
+                self._save_game()
 
             self._update_play_time()
-            stats_manager.save_stats(settings.STATS_FILE_NAME, self.stats)
+            self._save_stats()
+            self._close_field()
+
+            self.persistence.stop() # The pending writes are done before quitting
+            self.history.close()
+
+            if self.field_pool:
+                self.field_pool.stop()
+
+            if self.generator_executor: # Pending no-guess field searches are cancelled instead of run
+                self.generator_executor.shutdown(wait=False, cancel_futures=True)
+
+            logging.info('Text cache: {} hits, {} misses'.format(self.texts.hits, self.texts.misses))
 
             pygame.quit()
             sys.exit()
 
         return False
 
+    def _event_window_exposed(self, event):
+        """Draw the whole window again when it was exposed."""
+        if event.type != pygame.VIDEOEXPOSE:
+            return False
+
+        self._drawn_state = None
+
+        return True
+
+    def _event_camera(self, event):
+        """Scroll the field with the arrow keys or by dragging it with the middle mouse button, and zoom it with the mouse
+        wheel or the +/- keys."""
+        if event.type == pygame.KEYDOWN:
+            if event.key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN):
+                self._move_camera(
+                    {pygame.K_LEFT: -settings.SCROLL_STEP, pygame.K_RIGHT: settings.SCROLL_STEP}.get(event.key, 0),
+                    {pygame.K_UP: -settings.SCROLL_STEP, pygame.K_DOWN: settings.SCROLL_STEP}.get(event.key, 0)
+                )
+            elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                self._change_zoom(1)
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                self._change_zoom(-1)
+            else:
+                return False
+
+            return True
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == settings.MOUSE_WHEEL_UP:
+                self._change_zoom(1, event.pos)
+            elif event.button == settings.MOUSE_WHEEL_DOWN:
+                self._change_zoom(-1, event.pos)
+            elif event.button == settings.MOUSE_BUTTON_MIDDLE:
+                self._drag_started_at = (event.pos, tuple(self.camera))
+            else:
+                return False
+
+            return True
+        elif event.type == pygame.MOUSEMOTION and self._drag_started_at:
+            (start_x, start_y), (camera_x, camera_y) = self._drag_started_at
+
+            self.camera = [camera_x, camera_y]
+
+            self._move_camera(start_x - event.pos[0], start_y - event.pos[1])
+
+            return True
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == settings.MOUSE_BUTTON_MIDDLE:
+            self._drag_started_at = None
+
+            return True
+
+        return False
+
+    def _event_minimap(self, event):
+        """Jump to the part of the field clicked on its overview, or dragged over it with the left mouse button."""
+        if not self.minimap_rect: # The whole field is in the window now, e.g. after zooming out while dragging
+            self._dragging_minimap = False
+
+            return False
+
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == settings.MOUSE_BUTTON_LEFT and self.minimap_rect.collidepoint(event.pos):
+            self._dragging_minimap = True
+        elif event.type == pygame.MOUSEMOTION and self._dragging_minimap:
+            pass
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == settings.MOUSE_BUTTON_LEFT and (self._dragging_minimap or self.minimap_rect.collidepoint(event.pos)):
+            self._dragging_minimap = False
+        else:
+            return False
+
+        self._center_camera(self.minimap.get_area_coords(self.minimap_rect, event.pos))
+
+        return True
+
+    def _center_camera(self, coords):
+        """Scroll the field so the area at the given coordinates is in the middle of the window, if possible."""
+        _, pitch = self._get_area_sizes()
+
+        self.camera = [
+            coords[0] * pitch + pitch // 2 - self.field_rect.w // 2,
+            coords[1] * pitch + pitch // 2 - self.field_rect.h // 2
+        ]
+
+        self._move_camera(0, 0)
+
+    def _move_camera(self, x, y):
+        """Scroll the field by the given number of pixels, without going past its edges."""
+        _, pitch = self._get_area_sizes()
+
+        max_x = max(0, self.field.width * pitch - settings.GRID_SPACING - self.field_rect.w)
+        max_y = max(0, self.field.height * pitch - settings.GRID_SPACING - self.field_rect.h)
+
+        self.camera = [
+            min(max(0, int(self.camera[0] + x)), max_x),
+            min(max(0, int(self.camera[1] + y)), max_y)
+        ]
+
+    def _change_zoom(self, step, anchor=None):
+        """Zoom in (positive step) or out (negative step) by the given number of zoom levels, keeping the field still at
+        the given window position (the center of the field by default)."""
+        levels = settings.ZOOM_LEVELS
+        level = min(range(0, len(levels)), key=lambda i: abs(levels[i] - self.zoom))
+        zoom = levels[min(max(0, level + step), len(levels) - 1)]
+
+        if zoom == self.zoom:
+            return
+
+        anchor_x, anchor_y = anchor or self.field_rect.center
+        anchor_y -= self.field_rect.top
+
+        _, previous_pitch = self._get_area_sizes()
+
+        self.zoom = zoom
+
+        _, pitch = self._get_area_sizes()
+
+        self.camera = [
+            (self.camera[0] + anchor_x) * pitch / previous_pitch - anchor_x,
+            (self.camera[1] + anchor_y) * pitch / previous_pitch - anchor_y
+        ]
+
+        self._move_camera(0, 0)
+
     def _event_area_left_click(self, event):
         """Left click handler on an area."""
-        area, coords = self._get_clicked_area(event, settings.MOUSE_BUTTON_LEFT)
+        _, coords = self._get_clicked_area(event, settings.MOUSE_BUTTON_LEFT)
 
-        if not area:
+        if not coords:
             return False
 
-        if area.mark_as_clear():
-            if area.state == AreaState.EXPLODED:
+        revealed_areas = self.session.reveal(coords)
+
+        if revealed_areas:
+            self._unsaved_changes = True
+
+            if self.recorder:
+                self.recorder.record(replay.REVEAL, coords)
+
+            self._update_solver(revealed_areas)
+
+            if self.session.state == settings.GameState.LOST:
                 logging.info('Game lost')
 
                 random.choice(self.sounds['explosions']).play()
@@ -235,13 +700,10 @@ class Game:
 
                 self.stats['games_lost']['value'] += 1
 
-                stats_manager.save_stats(settings.STATS_FILE_NAME, self.stats)
-
-                if os.path.isfile(settings.SAVE_FILE_NAME):
-                    os.remove(settings.SAVE_FILE_NAME)
-            elif area.state == AreaState.CLEARED and area.nearby_mines_count == 0:
-                self.field.clear_surrounding_areas(coords)
-                self._check_win_condition()
+                self._record_game()
+                self._save_replay()
+                self._save_game()
+                self._save_stats()
             else:
                 self._check_win_condition()
 
@@ -249,22 +711,33 @@ class Game:
 
     def _event_area_right_click(self, event):
         """Right click handler on an area."""
-        area, _ = self._get_clicked_area(event, settings.MOUSE_BUTTON_RIGHT)
+        _, coords = self._get_clicked_area(event, settings.MOUSE_BUTTON_RIGHT)
 
-        if not area:
+        if not coords:
             return False
 
-        if area.toggle_mine_marker():
+        if self.session.toggle_mine_marker(coords):
+            self._unsaved_changes = True
+
+            if self.recorder:
+                self.recorder.record(replay.TOGGLE_MINE_MARKER, coords)
+
+            self._update_solver([coords[1] * self.field.width + coords[0]])
             self._check_win_condition()
 
         return True
 
     def _event_game_duration(self, event):
         """Count the duration of the current game."""
-        if event.type != settings.GAME_DURATION_EVENT:
+        if event.type != GAME_DURATION_EVENT:
             return False
 
-        self.duration += 1
+        self.session.tick()
+
+        self._unsaved_changes = True
+
+        if self.duration_counter_next_tick_at:
+            self.duration_counter_next_tick_at += 1
 
         return True
 
@@ -278,29 +751,214 @@ class Game:
             elif event.key == pygame.K_F2:
                 self._toggle_stats()
 
+                return True
+            elif event.key == pygame.K_F3:
+                self._show_hint()
+
                 return True
 
         return False
 
+    def _show_hint(self):
+        """Highlight a safe area to clear, or the one with the lowest mine probability if there's no safe one."""
+        if self.state != settings.GameState.PLAYING:
+            return
+
+        if not self.solver or self.solver.board is not self.field:
+            self.solver = Solver(self.field)
+
+        self._clear_hint()
+
+        coords = self.solver.solve().hint()
+
+        if not coords:
+            return
+
+        self.hint_index = coords[1] * self.field.width + coords[0]
+        self.field._changed_areas.add(self.hint_index)
+
+        logging.info('Hint: {}, mine probability {:.2f}'.format(coords, self.solver.get_probability(self.hint_index)))
+
+    def _clear_hint(self):
+        """Remove the highlight of the hinted area, if any."""
+        if self.hint_index is not None:
+            if self.hint_index < self.field.areas_count:
+                self.field._changed_areas.add(self.hint_index)
+
+            self.hint_index = None
+
+    def _update_solver(self, indexes):
+        """Tell the solver which areas changed after a move."""
+        self._clear_hint()
+
+        if self.solver and self.solver.board is self.field:
+            self.solver.update(indexes)
+
     def _get_clicked_area(self, event, required_button):
         """Return the area that was clicked."""
-        if self.state != settings.GameState.PLAYING or event.type != pygame.MOUSEBUTTONUP or event.button != required_button:
+        if self.state != settings.GameState.PLAYING or self.replay or event.type != pygame.MOUSEBUTTONUP or event.button != required_button:
+            return False, False
+
+        coords = self._get_area_coords_at(event.pos)
+
+        if not coords:
             return False, False
 
-        for y, row in enumerate(self.field.field):
-            for x, area in enumerate(row):
-                if area.rect.collidepoint(event.pos):
-                    return area, (x, y)
+        return self.field.get_area(*coords), coords
+
+    def _get_area_coords_at(self, pos):
+        """Return the coordinates of the area at the given window position, or None if there's no area there (outside
+        of the field or on the grid)."""
+        pos_x, pos_y = pos
+
+        if pos_y < settings.INFO_PANEL_HEIGHT:
+            return None
+
+        # Window position to field position, in pixels
+        field_x = pos_x + self.camera[0]
+        field_y = pos_y - settings.INFO_PANEL_HEIGHT + self.camera[1]
+
+        if field_x < 0 or field_y < 0:
+            return None
+
+        side, pitch = self._get_area_sizes()
+
+        x, offset_x = divmod(field_x, pitch)
+        y, offset_y = divmod(field_y, pitch)
+
+        # Each area is followed by the grid line separating it from the next one
+        if offset_x >= side or offset_y >= side:
+            return None
+
+        if x > self.field.width - 1 or y > self.field.height - 1:
+            return None
+
+        return x, y
 
-        return False, False
+    def _get_area_position(self, coords):
+        """Return the window position of the top left corner of the area at the given coordinates."""
+        x, y = coords
+        _, pitch = self._get_area_sizes()
+
+        return x * pitch - self.camera[0], y * pitch - self.camera[1] + settings.INFO_PANEL_HEIGHT
+
+    def _get_area_sizes(self):
+        """Return the side of the areas at the current zoom level and the distance between two consecutive ones, in
+        pixels."""
+        side = max(1, int(round(settings.AREAS_SIDE_SIZE * self.zoom)))
+
+        return side, side + settings.GRID_SPACING
+
+    def _get_visible_areas(self):
+        """Return the ranges of columns and rows of the areas which are, at least partially, in the window."""
+        _, pitch = self._get_area_sizes()
+
+        return (
+            range(self.camera[0] // pitch, min(self.field.width, (self.camera[0] + self.field_rect.w) // pitch + 1)),
+            range(self.camera[1] // pitch, min(self.field.height, (self.camera[1] + self.field_rect.h) // pitch + 1))
+        )
 
     # --------------------------------------------------------------------------
     # Drawing handlers
 
+    def _draw(self):
+        """Draw the game window and update the display, only with what changed since the previous frame if possible."""
+        if self.field is not self._drawn_field: # The new field may be smaller than the previous one
+            self._move_camera(0, 0)
+
+        changed_areas = self.field.pop_changed_areas()
+
+        self.minimap_rect = self._get_minimap_rect()
+
+        if self.minimap_rect:
+            self.minimap.update(self.field, changed_areas)
+        elif self.minimap:
+            self.minimap.clear() # It may not be up to date anymore when it's shown again
+
+        info_panel = (self.field.mines_left, self.duration)
+        info_panel_changed = info_panel != self._drawn_info_panel
+        view = (tuple(self.camera), self.zoom)
+        columns, rows = self._get_visible_areas()
+
+        full_redraw = (
+            not settings.DIRTY_RECTS
+            or self.field is not self._drawn_field
+            or self.state != self._drawn_state
+            or view != self._drawn_view
+            or (changed_areas and self.state != settings.GameState.PLAYING) # Overlays are drawn on top of the field
+            or len(changed_areas) > len(columns) * len(rows) // 2
+        )
+
+        self._drawn_field = self.field
+        self._drawn_state = self.state
+        self._drawn_view = view
+        self._drawn_info_panel = info_panel
+
+        if full_redraw:
+            self._draw_window()
+
+            pygame.display.update()
+
+            return
+
+        dirty_rects = []
+
+        if info_panel_changed:
+            info_panel_rect = pygame.Rect((0, 0), (self.window_rect.w, settings.INFO_PANEL_HEIGHT - settings.GRID_SPACING))
+
+            self.window.fill(settings.WINDOW_BACKGROUND_COLOR, info_panel_rect)
+
+            self._draw_info_panel()
+
+            dirty_rects.append(info_panel_rect)
+
+        side, _ = self._get_area_sizes()
+
+        self.window.set_clip(self.field_rect)
+
+        for index in changed_areas:
+            x, y = index % self.field.width, index // self.field.width
+
+            if x not in columns or y not in rows: # Out of the window
+                continue
+
+            image = self.field.get_image(index, side)
+            area_rect = self.window.blit(image, self._get_area_position((x, y)))
+
+            if index == self.hint_index:
+                self._draw_hint()
+
+            dirty_rects.append(area_rect.clip(self.field_rect))
+
+        self.window.set_clip(None)
+
+        if changed_areas and self.minimap_rect: # The areas may have been drawn over it
+            self._draw_minimap()
+
+            dirty_rects.append(self.minimap_rect.inflate(2, 2))
+
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+
+    def _draw_window(self):
+        """Draw the whole game window."""
+        self.window.blit(self._get_layer('background'), (0, 0))
+
+        self._draw_info_panel()
+        self._draw_field()
+        self._draw_minimap()
+
+        if self.state == settings.GameState.LOST:
+            self._draw_lost_screen()
+        elif self.state == settings.GameState.WON:
+            self._draw_won_screen()
+        elif self.state == settings.GameState.SHOW_STATS:
+            self._draw_stats_screen()
+
     def _draw_info_panel(self):
         """Draws the information panel."""
         # Mines left text
-        mines_left_text = self.fonts['info_panel'].render(str(self.field.mines_left), True, settings.TEXT_COLOR)
+        mines_left_text = self.texts.render(self.fonts['info_panel'], str(self.field.mines_left), settings.TEXT_COLOR)
         mines_left_text_rect = mines_left_text.get_rect()
         mines_left_text_rect.left = 25
         mines_left_text_rect.top = 10
@@ -308,58 +966,125 @@ class Game:
         self.window.blit(mines_left_text, mines_left_text_rect)
 
         # Game duration text
-        duration_text = self.fonts['info_panel'].render(helpers.humanize_seconds(self.duration), True, settings.TEXT_COLOR)
+        duration_text = self.texts.render(self.fonts['info_panel'], helpers.humanize_seconds(self.duration), settings.TEXT_COLOR)
         duration_text_rect = duration_text.get_rect()
         duration_text_rect.right = self.window_rect.w - 25
         duration_text_rect.top = 10
 
         self.window.blit(duration_text, duration_text_rect)
 
-    def _draw_grid(self):
-        """Draws the grid which separates the areas."""
-        for x in range(0, settings.WIDTH + 1):
-            pygame.draw.rect(
-                self.window,
-                settings.GRID_COLOR,
-                pygame.Rect(
-                    (x * settings.AREAS_SIDE_SIZE + (x - 1) * settings.GRID_SPACING, settings.INFO_PANEL_HEIGHT),
-                    (settings.GRID_SPACING, self.window_rect.h)
-                )
-            )
+    def _get_layer(self, name):
+        """Return one of the static layers of the window, which are only rendered again when the window or the field
+        size changed."""
+        key = (self.window_rect.size, self.field.width, self.field.height)
+        layer = self._layers.get(name)
 
-        for y in range(0, settings.HEIGHT + 1):
-            pygame.draw.rect(
-                self.window,
-                settings.GRID_COLOR,
-                pygame.Rect(
-                    (0, y * settings.AREAS_SIDE_SIZE + (y - 1) * settings.GRID_SPACING + settings.INFO_PANEL_HEIGHT),
-                    (self.window_rect.w, settings.GRID_SPACING)
-                )
+        if not layer or layer[0] != key:
+            logging.info('Rendering the {} layer'.format(name))
+
+            layer = self._layers[name] = (key, getattr(self, '_render_' + name + '_layer')())
+
+        return layer[1]
+
+    def _render_background_layer(self):
+        """Render the window background."""
+        layer = pygame.Surface(self.window_rect.size).convert()
+        layer.fill(settings.WINDOW_BACKGROUND_COLOR)
+
+        return layer
+
+    def _render_overlay_layer(self):
+        """Render the transparent rect that takes the whole window."""
+        layer = pygame.Surface(self.window_rect.size).convert()
+        layer.set_alpha(150)
+        layer.fill(settings.WINDOW_BACKGROUND_COLOR)
+
+        return layer
+
+    def _draw_grid(self, columns, rows):
+        """Draws the grid which separates the given columns and rows of areas, by filling the space they take: the areas
+        are then drawn on top of it, leaving only the grid lines visible."""
+        left, top = self._get_area_position((columns.start, rows.start))
+        right, bottom = self._get_area_position((columns.stop, rows.stop))
+
+        self.window.fill(
+            settings.GRID_COLOR,
+            pygame.Rect(
+                (left - settings.GRID_SPACING, top - settings.GRID_SPACING),
+                (right - left + settings.GRID_SPACING, bottom - top + settings.GRID_SPACING)
             )
+        )
 
     def _draw_field(self):
-        """Draws each areas of the mines field."""
-        for y, row in enumerate(self.field.field):
-            for x, area in enumerate(row):
-                area.rect.top = y * settings.AREAS_SIDE_SIZE + y * settings.GRID_SPACING + settings.INFO_PANEL_HEIGHT
-                area.rect.left = x * settings.AREAS_SIDE_SIZE + x * settings.GRID_SPACING
+        """Draws the areas of the mines field which are in the window."""
+        columns, rows = self._get_visible_areas()
+        side, pitch = self._get_area_sizes()
+        left, top = self._get_area_position((columns.start, rows.start))
+        lefts = [left + i * pitch for i in range(0, len(columns))]
 
-                self.window.blit(area.image, area.rect)
+        self.window.set_clip(self.field_rect)
 
-    def _draw_fullscreen_transparent_background(self):
-        """Draws a transparent rect that takes the whole window."""
-        rect = pygame.Surface(self.window_rect.size)
-        rect.set_alpha(150)
-        rect.fill(settings.WINDOW_BACKGROUND_COLOR)
+        self._draw_grid(columns, rows)
+
+        # Row by row, as each one is a single run of areas in the field buffers
+        for i, y in enumerate(rows):
+            images = self.field.get_images(y * self.field.width + columns.start, y * self.field.width + columns.stop, side)
+
+            self.window.blits(zip(images, zip(lefts, repeat(top + i * pitch))), doreturn=False)
+
+        self._draw_hint()
+
+        self.window.set_clip(None)
+
+        # The grid line separating the field from the information panel
+        self.window.fill(settings.GRID_COLOR, pygame.Rect((0, settings.INFO_PANEL_HEIGHT - settings.GRID_SPACING), (self.window_rect.w, settings.GRID_SPACING)))
+
+    def _get_minimap_rect(self):
+        """Return where the overview of the field is drawn, or None if it isn't because the whole field is in the
+        window."""
+        _, pitch = self._get_area_sizes()
+
+        if not self.minimap or (self.field.width * pitch - settings.GRID_SPACING <= self.field_rect.w and self.field.height * pitch - settings.GRID_SPACING <= self.field_rect.h):
+            return None
+
+        rect = pygame.Rect((0, 0), self.minimap.get_size(self.field))
+        rect.bottomright = (self.field_rect.right - 10, self.field_rect.bottom - 10)
+
+        return rect
+
+    def _draw_minimap(self):
+        """Draws the overview of the field, with the part of it that's in the window."""
+        if not self.minimap_rect:
+            return
+
+        _, pitch = self._get_area_sizes()
 
-        self.window.blit(
-            rect,
+        self.minimap.draw(self.window, self.minimap_rect, (
+            self.camera[0] / pitch,
+            self.camera[1] / pitch,
+            (self.camera[0] + self.field_rect.w) / pitch,
+            (self.camera[1] + self.field_rect.h) / pitch
+        ))
+
+    def _draw_hint(self):
+        """Draws the highlight of the hinted area."""
+        if self.hint_index is None or self.hint_index >= self.field.areas_count:
+            return
+
+        pygame.draw.rect(
+            self.window,
+            settings.HINT_COLOR,
             pygame.Rect(
-                (0, settings.INFO_PANEL_HEIGHT),
-                (self.window_rect.w, settings.INFO_PANEL_HEIGHT)
-            )
+                self._get_area_position((self.hint_index % self.field.width, self.hint_index // self.field.width)),
+                (self._get_area_sizes()[0],) * 2
+            ),
+            3
         )
 
+    def _draw_fullscreen_transparent_background(self):
+        """Draws a transparent rect that takes the whole window."""
+        self.window.blit(self._get_layer('overlay'), (0, settings.INFO_PANEL_HEIGHT))
+
     def _draw_fullscreen_window(self, title, text):
         """Draws a title and a text in the middle of the screen."""
         if isinstance(text, str):
@@ -368,7 +1093,7 @@ class Game:
         self._draw_fullscreen_transparent_background()
 
         # Title
-        title_label = self.fonts['title'].render(title, True, settings.TEXT_COLOR)
+        title_label = self.texts.render(self.fonts['title'], title, settings.TEXT_COLOR)
         title_label_rect = title_label.get_rect()
         title_label_rect.center = self.window_rect.center
         title_label_rect.centery -= 15
@@ -379,7 +1104,7 @@ class Game:
         spacing = 15
 
         for t in text:
-            text_label = self.fonts['normal'].render(t, True, settings.TEXT_COLOR)
+            text_label = self.texts.render(self.fonts['normal'], t, settings.TEXT_COLOR)
             text_label_rect = text_label.get_rect()
             text_label_rect.center = self.window_rect.center
             text_label_rect.centery += spacing
@@ -411,7 +1136,7 @@ class Game:
         self._draw_fullscreen_transparent_background()
 
         # Title
-        title_label = self.fonts['title'].render('Statistics', True, settings.TEXT_COLOR)
+        title_label = self.texts.render(self.fonts['title'], 'Statistics', settings.TEXT_COLOR)
         title_label_rect = title_label.get_rect()
         title_label_rect.centerx = self.window_rect.centerx
         title_label_rect.top = settings.INFO_PANEL_HEIGHT + 10
@@ -421,9 +1146,9 @@ class Game:
         # The stats themselves
         spacing = title_label_rect.bottom + 30
 
-        for key, stat in self.stats.items():
+        for name, value in self._get_stats_rows():
             # Stat label
-            stat_label = self.fonts['normal'].render(stat['name'], True, settings.TEXT_COLOR)
+            stat_label = self.texts.render(self.fonts['normal'], name, settings.TEXT_COLOR)
             stat_label_rect = stat_label.get_rect()
             stat_label_rect.left = self.window_rect.centerx - 200
             stat_label_rect.top = spacing
@@ -431,9 +1156,7 @@ class Game:
             self.window.blit(stat_label, stat_label_rect)
 
             # Stat value
-            stat_value_format = stat['format'] if 'format' in stat else str
-
-            stat_value = self.fonts['normal'].render(stat_value_format(stat['value']), True, settings.TEXT_COLOR)
+            stat_value = self.texts.render(self.fonts['normal'], value, settings.TEXT_COLOR)
             stat_value_rect = stat_value.get_rect()
             stat_value_rect.right = self.window_rect.centerx + 200
             stat_value_rect.top = spacing
@@ -441,3 +1164,25 @@ class Game:
             self.window.blit(stat_value, stat_value_rect)
 
             spacing += 35
+
+    def _get_stats_rows(self):
+        """Return the name and formatted value of each stat to display: the overall ones, then the ones of the current
+        board configuration, from the precomputed games history aggregates."""
+        rows = []
+
+        for key, stat in self.stats.items():
+            stat_value_format = stat['format'] if 'format' in stat else str
+
+            rows.append((stat['name'], stat_value_format(stat['value'])))
+
+        aggregate = self.history.get_aggregate(self.field.width, self.field.height, self.field.mines)
+        median_duration = aggregate.get_duration_percentile(50)
+
+        rows.extend([
+            ('Win rate ({}x{}, {} mines)'.format(self.field.width, self.field.height, self.field.mines), '{:.1f} %'.format(aggregate.win_rate * 100)),
+            ('Median winning time', helpers.humanize_seconds(median_duration) if median_duration is not None else '-'),
+            ('Current streak', '{} {}'.format(abs(aggregate.current_streak), 'wins' if aggregate.current_streak >= 0 else 'losses')),
+            ('Longest winning streak', helpers.humanize_integer(aggregate.longest_win_streak))
+        ])
+
+        return rows
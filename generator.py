@@ -0,0 +1,173 @@
+"""No-guess mines fields generation.
+
+A no-guess field can be cleared by the solver without any guess, starting from a given area which is guaranteed to have
+no nearby mines. Candidates are placed at random, then played by the solver: when it gets stuck, a mine of the areas it
+couldn't decide is moved somewhere far from what's cleared, and the candidate is played again. Candidates that can't be
+repaired are dropped for new ones, which are searched in parallel in a pool of processes."""
+from concurrent.futures import ProcessPoolExecutor
+from engine import Board, Session, AreaState, DIRECTIONS
+from solver import Solver
+import multiprocessing
+import random
+
+
+def get_start_area(width, height):
+    """Return the coordinates of the area no-guess fields of the given size are started from."""
+    return width // 2, height // 2
+
+
+def play_without_guessing(board, start):
+    """Clear the unplayed given board from the area at the given coordinates, as far as the solver can without
+    guessing. Return the solver in its final position."""
+    session = Session(board)
+    solver = Solver(board)
+
+    solver.update(session.reveal(start))
+
+    while True:
+        solver.solve()
+
+        safe = [index for index in solver.safe if board._states[index] == AreaState.INITIAL]
+
+        if not safe:
+            return solver
+
+        for index in safe:
+            solver.update(session.reveal((index % board.width, index // board.width)))
+
+
+def is_solvable_without_guessing(board, start):
+    """Determine if the solver can clear the unplayed given board from the area at the given coordinates without
+    guessing."""
+    play_without_guessing(board, start)
+
+    return board._initial_count == board.mines
+
+
+def _repair(board, solver, mines, protected_areas, rng):
+    """Move one of the mines the solver couldn't find to an unplayed area that gives no information yet. Return False if
+    there's no such move."""
+    frontier = set()
+
+    for cells, _ in solver._constraints.values():
+        frontier.update(cells)
+
+    if not frontier: # The solver is stuck in areas that are fully surrounded by mines
+        frontier = set(index for index in range(0, board.areas_count) if board._states[index] == AreaState.INITIAL)
+
+    sources = [index for index in frontier if board._mines[index] and index not in solver.mines]
+    destinations = [
+        index for index in range(0, board.areas_count)
+        if board._states[index] == AreaState.INITIAL and not board._mines[index]
+        and index not in frontier and index not in protected_areas
+    ]
+
+    if not sources or not destinations:
+        return False
+
+    mines.remove(rng.choice(sorted(sources)))
+    mines.append(rng.choice(destinations))
+
+    return True
+
+
+def find_no_guess_mines(width, height, mines, start, seed, max_repairs=50):
+    """Try to build a no-guess field from the given seed. Return the mines indexes, or None if the candidate couldn't
+    be repaired."""
+    rng = random.Random(seed)
+    start_index = start[1] * width + start[0]
+
+    # The start area and the ones surrounding it are kept free of mines, so the first click opens up the field
+    protected_areas = set(
+        (start[1] + dir_y) * width + start[0] + dir_x for dir_x, dir_y in DIRECTIONS + ((0, 0),)
+        if 0 <= start[0] + dir_x < width and 0 <= start[1] + dir_y < height
+    )
+
+    if mines > width * height - len(protected_areas):
+        raise ValueError('Not enough space for {} mines'.format(mines))
+
+    mines_indexes = rng.sample([index for index in range(0, width * height) if index not in protected_areas], mines)
+
+    for _ in range(0, max_repairs + 1):
+        board = Board(width, height, mines, seed=rng)
+        board.place_mines(mines_indexes)
+
+        solver = play_without_guessing(board, start)
+
+        if board._initial_count == board.mines:
+            return sorted(mines_indexes)
+
+        if not _repair(board, solver, mines_indexes, protected_areas, rng):
+            return None
+
+    return None
+
+
+def _find_no_guess_mines_batch(width, height, mines, start, seeds, max_repairs):
+    """Try each of the given seeds in turn. Return the mines indexes of the first no-guess field found, or None."""
+    for seed in seeds:
+        mines_indexes = find_no_guess_mines(width, height, mines, start, seed, max_repairs)
+
+        if mines_indexes is not None:
+            return mines_indexes
+
+    return None
+
+
+def generate_no_guess_mines(width, height, mines, start=None, seed=None, executor=None, max_attempts=1000,
+                            attempts_per_task=4, max_repairs=50):
+    """Return the mines indexes of a no-guess field, or None if none was found in max_attempts candidates.
+
+    Candidates are searched in batches of attempts_per_task, in the given executor (e.g. a ProcessPoolExecutor) or
+    in the current process if there's none. The result only depends on the seed: batches are looked at in the order
+    they were submitted."""
+    if start is None:
+        start = get_start_area(width, height)
+
+    rng = random.Random(seed)
+    batches = []
+
+    for _ in range(0, (max_attempts + attempts_per_task - 1) // attempts_per_task):
+        batches.append([rng.getrandbits(64) for _ in range(0, attempts_per_task)])
+
+    if not executor:
+        for seeds in batches:
+            mines_indexes = _find_no_guess_mines_batch(width, height, mines, start, seeds, max_repairs)
+
+            if mines_indexes is not None:
+                return mines_indexes
+
+        return None
+
+    # Keep a few batches ahead of the one being waited for, so all the processes are busy
+    window_size = getattr(executor, '_max_workers', 1) * 2
+    futures = []
+
+    try:
+        for seeds in batches:
+            futures.append(executor.submit(_find_no_guess_mines_batch, width, height, mines, start, seeds, max_repairs))
+
+            if len(futures) < window_size:
+                continue
+
+            mines_indexes = futures.pop(0).result()
+
+            if mines_indexes is not None:
+                return mines_indexes
+
+        for future in futures:
+            mines_indexes = future.result()
+
+            if mines_indexes is not None:
+                return mines_indexes
+    finally:
+        for future in futures:
+            future.cancel()
+
+    return None
+
+
+def create_executor(processes=None):
+    """Create the pool of processes no-guess fields are searched in. Processes are spawned rather than forked so they
+    don't inherit the state of the game (PyGame, SDL)."""
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from random import choice
 import settings
 import pygame
@@ -60,6 +61,38 @@ def load_font(filename, size):
     return pygame.font.Font(path, size)
 
 
+class TextCache:
+    """A bounded LRU cache of rendered texts, keyed by font, text and color."""
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._texts = OrderedDict()
+
+    def render(self, font, text, color):
+        """Return the given text rendered (antialiased) with the given font and color, rendering it only if needed."""
+        key = (font, text, color)
+        rendered = self._texts.get(key)
+
+        if rendered is not None:
+            self.hits += 1
+
+            self._texts.move_to_end(key)
+
+            return rendered
+
+        self.misses += 1
+
+        rendered = self._texts[key] = font.render(text, True, color)
+
+        if len(self._texts) > self.max_size: # Forget the least recently used text
+            self._texts.popitem(last=False)
+
+        return rendered
+
+
 def humanize_seconds(seconds):
     """Return a human-readable representation of the given number of seconds."""
     if not seconds:
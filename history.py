@@ -0,0 +1,218 @@
+"""The history of every game played, in an append-only SQLite database.
+
+Each finished game is appended to the games table. Aggregates (games and wins counts, streaks) and a histogram of the
+games durations are kept up to date along with it, by board configuration (width, height and mines count), so stats
+never have to scan the games table. They are also kept in memory, and the database is written in a background thread."""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import sqlite3
+import time
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    ended_at INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    mines INTEGER NOT NULL,
+    seed INTEGER,
+    duration INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    moves INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS games_config ON games (width, height, mines, ended_at);
+
+CREATE TABLE IF NOT EXISTS aggregates (
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    mines INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    current_streak INTEGER NOT NULL,
+    longest_win_streak INTEGER NOT NULL,
+    longest_loss_streak INTEGER NOT NULL,
+    PRIMARY KEY (width, height, mines)
+);
+
+CREATE TABLE IF NOT EXISTS durations (
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    mines INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    duration INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    PRIMARY KEY (width, height, mines, won, duration)
+);
+'''
+
+
+class Aggregate:
+    """The aggregated history of the games played with a board configuration."""
+    def __init__(self, games=0, wins=0, current_streak=0, longest_win_streak=0, longest_loss_streak=0):
+        self.games = games
+        self.wins = wins
+        self.current_streak = current_streak # Positive for consecutive wins, negative for consecutive losses
+        self.longest_win_streak = longest_win_streak
+        self.longest_loss_streak = longest_loss_streak
+
+        self.durations = ({}, {}) # Lost and won games, by duration
+
+    @property
+    def win_rate(self):
+        """The ratio of games won."""
+        return self.wins / self.games if self.games else 0.0
+
+    def add(self, duration, won):
+        """Count a finished game."""
+        self.games += 1
+
+        if won:
+            self.wins += 1
+            self.current_streak = self.current_streak + 1 if self.current_streak > 0 else 1
+            self.longest_win_streak = max(self.longest_win_streak, self.current_streak)
+        else:
+            self.current_streak = self.current_streak - 1 if self.current_streak < 0 else -1
+            self.longest_loss_streak = max(self.longest_loss_streak, -self.current_streak)
+
+        durations = self.durations[1 if won else 0]
+        durations[duration] = durations.get(duration, 0) + 1
+
+    def get_duration_percentile(self, percentile, won=True):
+        """Return the duration under which the given percentage of the games (won ones by default) were played, or None
+        if there's no such game."""
+        durations = self.durations[1 if won else 0]
+        total = sum(durations.values())
+
+        if not total:
+            return None
+
+        rank = percentile / 100 * (total - 1)
+        seen = 0
+
+        for duration in sorted(durations.keys()):
+            seen += durations[duration]
+
+            if seen > rank:
+                return duration
+
+        return max(durations.keys())
+
+
+def _to_signed(seed):
+    """Convert a 64 bits unsigned seed to the signed integer SQLite can store."""
+    if seed is None:
+        return None
+
+    return seed - (1 << 64) if seed >= 1 << 63 else seed
+
+
+def _to_unsigned(seed):
+    """Convert a seed stored by SQLite back to the original one."""
+    if seed is None:
+        return None
+
+    return seed + (1 << 64) if seed < 0 else seed
+
+
+class GameHistory:
+    def __init__(self, filename):
+        self.filename = filename
+        self.aggregates = {} # (width, height, mines): Aggregate
+
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1) # Writes happen one after the other, in order
+
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+
+        self._load_aggregates()
+
+    def _load_aggregates(self):
+        """Read the aggregates of all the boards configurations."""
+        with self._lock:
+            for width, height, mines, *values in self._connection.execute('SELECT * FROM aggregates'):
+                self.aggregates[(width, height, mines)] = Aggregate(*values)
+
+            for width, height, mines, won, duration, games in self._connection.execute('SELECT * FROM durations'):
+                self.aggregates[(width, height, mines)].durations[won][duration] = games
+
+    def get_aggregate(self, width, height, mines):
+        """Return the aggregated history of a board configuration."""
+        return self.aggregates.get((width, height, mines)) or Aggregate()
+
+    def record(self, width, height, mines, seed, duration, won, moves, ended_at=None):
+        """Append a finished game to the history. Aggregates are updated at once, the database in the background."""
+        self.record_many([(width, height, mines, seed, duration, won, moves, ended_at)])
+
+    def record_many(self, games, wait=False):
+        """Append finished games to the history, as (width, height, mines, seed, duration, won, moves, ended_at)
+        tuples. If wait is True, only return once they are written to the database."""
+        rows = []
+        changed = set()
+
+        for width, height, mines, seed, duration, won, moves, ended_at in games:
+            config = (width, height, mines)
+
+            self.aggregates.setdefault(config, Aggregate()).add(int(duration), won)
+
+            changed.add((config, int(duration), 1 if won else 0))
+            rows.append((
+                int(ended_at if ended_at is not None else time.time()),
+                width,
+                height,
+                mines,
+                _to_signed(seed),
+                int(duration),
+                1 if won else 0,
+                moves
+            ))
+
+        aggregates = [
+            config + (a.games, a.wins, a.current_streak, a.longest_win_streak, a.longest_loss_streak)
+            for config, a in ((config, self.aggregates[config]) for config in set(config for config, _, _ in changed))
+        ]
+
+        durations = [
+            config + (won, duration, self.aggregates[config].durations[won][duration])
+            for config, duration, won in changed
+        ]
+
+        future = self._writer.submit(self._write, rows, aggregates, durations)
+
+        if wait:
+            future.result()
+
+    def _write(self, rows, aggregates, durations):
+        """Append games and update the aggregates in the database, in a single transaction."""
+        try:
+            with self._lock, self._connection:
+                self._connection.executemany('INSERT INTO games (ended_at, width, height, mines, seed, duration, won, moves) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self._connection.executemany('INSERT OR REPLACE INTO aggregates VALUES (?, ?, ?, ?, ?, ?, ?, ?)', aggregates)
+                self._connection.executemany('INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?, ?, ?)', durations)
+        except sqlite3.Error:
+            logging.exception('Could not write the games history')
+
+    def get_games(self, width, height, mines, limit=100):
+        """Return the last games played with a board configuration, most recent first."""
+        self._writer.submit(lambda: None).result() # Wait for the pending writes
+
+        with self._lock:
+            cursor = self._connection.execute(
+                'SELECT ended_at, seed, duration, won, moves FROM games WHERE width = ? AND height = ? AND mines = ? ORDER BY ended_at DESC, id DESC LIMIT ?',
+                (width, height, mines, limit)
+            )
+
+            return [
+                {'ended_at': ended_at, 'seed': _to_unsigned(seed), 'duration': duration, 'won': bool(won), 'moves': moves}
+                for ended_at, seed, duration, won, moves in cursor
+            ]
+
+    def close(self):
+        """Wait for the pending writes, then close the database."""
+        self._writer.shutdown(wait=True)
+
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,361 @@
+"""Boards kept in a memory-mapped file instead of in memory, so they can be much larger than the memory and survive a
+crash of the game without their areas ever being saved.
+
+The file starts with a header: the MAGIC bytes, the format version, the board dimensions, mines count and the offsets of
+its buffers, followed by the values which change while the game is played (mines left, seed, whether an area was
+cleared or exploded and running areas counts). Then come the mines, nearby mines counts and areas states buffers, one byte per area in the
+y * width + x order like the ones of a Board, each one aligned on ALIGNMENT bytes so it can be mapped on its own.
+
+Opening a board only maps its file: its areas are read from the disk by the system when they're first used, and every
+change is written to the file as it's made. flush() makes sure the changes reached the disk. New boards are generated
+band of areas by band of areas, so a huge one is never in memory either."""
+from engine import Board, AreaState
+import collections
+import itertools
+import threading
+import tempfile
+import struct
+import array
+import random
+import math
+import mmap
+import sys
+import os
+
+try:
+    import numpy
+except ImportError: # NumPy is optional, mines will be placed in pure Python without it
+    numpy = None
+
+MAGIC = b'MSWF'
+VERSION = 1
+
+ALIGNMENT = 64 * 1024 # The largest memory mapping granularity (Windows), so files can be opened on any system
+
+_HEADER = struct.Struct('<4sBxxxIIIQQQ') # Magic, version, width, height, mines, offsets of the mines, counts and states
+_HEADER_SIZE = 128
+
+_BLOCK_SIZE = 16 * 1024 * 1024 # Buffers are scanned and filled by blocks of this many areas
+_MINES_BAND_SIZE = 1024 * 1024 # Mines are placed by bands of this many areas
+
+
+def _hypergeometric(rng, draws, successes, population):
+    """Return how many of the successes are among draws items taken at random from the population, e.g. how many mines
+    a band of areas gets. The distribution is searched from its mode, so it takes O(standard deviation) time."""
+    failures = population - successes
+    low = max(0, draws - failures)
+    high = min(draws, successes)
+
+    if low == high:
+        return low
+
+    mode = min(max(low, (draws + 1) * (successes + 1) // (population + 2)), high)
+
+    probability = math.exp(
+        math.lgamma(successes + 1) - math.lgamma(mode + 1) - math.lgamma(successes - mode + 1)
+        + math.lgamma(failures + 1) - math.lgamma(draws - mode + 1) - math.lgamma(failures - draws + mode + 1)
+        - math.lgamma(population + 1) + math.lgamma(draws + 1) + math.lgamma(population - draws + 1)
+    )
+
+    left = rng.random() - probability
+
+    if left <= 0:
+        return mode
+
+    up, up_probability = mode, probability
+    down, down_probability = mode, probability
+
+    while up < high or down > low: # Alternate between both sides of the mode, most likely values first
+        if up < high:
+            up_probability *= (successes - up) * (draws - up) / ((up + 1) * (failures - draws + up + 1))
+            up += 1
+            left -= up_probability
+
+            if left <= 0:
+                return up
+
+        if down > low:
+            down_probability *= down * (failures - draws + down) / ((successes - down + 1) * (draws - down + 1))
+            down -= 1
+            left -= down_probability
+
+            if left <= 0:
+                return down
+
+    return mode # Only reached because of rounding errors
+
+
+def _draw_areas(rng, band, count, value):
+    """Give the given value to count areas of the given band drawn at random among the ones which don't have it yet.
+
+    Random indexes are drawn by batches of 32-bit words masked to the size of the band, then the ones inside it are given
+    the value at once. Drawing the same area twice wastes a word, so batches are drawn until enough areas got the value.
+    The words are the same with or without NumPy, and so are the areas drawn."""
+    size = len(band)
+    mask = (1 << max(1, (size - 1).bit_length())) - 1
+    wanted = band.count(value) + count
+
+    while count:
+        words = rng.getrandbits(32 * count).to_bytes(4 * count, 'little')
+
+        # Each index gives the value to one more area at most, so no more than count of them get it
+        if numpy is not None:
+            indexes = numpy.frombuffer(words, dtype='<u4') & mask
+            areas = numpy.frombuffer(band, dtype=numpy.uint8)
+
+            areas[indexes[indexes < size]] = value
+
+            count = wanted - int(numpy.count_nonzero(areas == value))
+        else:
+            indexes = array.array('I', words)
+
+            if sys.byteorder == 'big':
+                indexes.byteswap()
+
+            collections.deque(map(band.__setitem__, filter(size.__gt__, map(mask.__and__, indexes)), itertools.repeat(value)), maxlen=0)
+
+            count = wanted - band.count(value)
+
+
+class MappedBuffer(mmap.mmap):
+    """A buffer of a MappedBoard, which can be searched and counted like a bytearray."""
+    def find(self, value, *args):
+        """Return the lowest index of the given value, or of the given bytes, between the optional start and end
+        indexes. Return -1 if there's none."""
+        if isinstance(value, int):
+            value = bytes([value])
+
+        return super(MappedBuffer, self).find(value, *args)
+
+    def count(self, value):
+        """Return the number of occurrences of the given value."""
+        return sum(self[start:start + _BLOCK_SIZE].count(value) for start in range(0, len(self), _BLOCK_SIZE))
+
+
+class _HeaderValue:
+    """An attribute of a MappedBoard stored in the header of its file, so it's kept along with its areas."""
+    def __init__(self, format, position):
+        self.struct = struct.Struct(format)
+        self.position = position
+
+    def __get__(self, board, owner=None):
+        if board is None:
+            return self
+
+        return self.struct.unpack_from(board._header, self.position)[0]
+
+    def __set__(self, board, value):
+        self.struct.pack_into(board._header, self.position, value)
+
+
+class MappedBoard(Board):
+    """A mines field whose buffers are mapped from a file."""
+    directory = None # Where boards created without a file name are, the temporary files directory by default
+
+    mines_left = _HeaderValue('<I', 64)
+    _has_seed = _HeaderValue('<B', 68)
+    _has_cleared = _HeaderValue('<B', 69) # So the states don't have to be searched when the board is opened
+    _has_exploded = _HeaderValue('<B', 70)
+    _initial_count = _HeaderValue('<Q', 72)
+    _correctly_marked_count = _HeaderValue('<Q', 80)
+    _wrongly_marked_count = _HeaderValue('<Q', 88)
+    _seed = _HeaderValue('<Q', 96)
+
+    def __init__(self, width, height, mines, seed=None, filename=None):
+        if mines > width * height:
+            raise ValueError('Not enough space for {} mines'.format(mines))
+
+        if filename is None:
+            fd, filename = tempfile.mkstemp(prefix='field.', suffix='.map', dir=self.directory)
+
+            os.close(fd)
+
+        self._create_file(filename, width, height, mines)
+
+        try:
+            self._map(filename)
+
+            self.mines_left = mines
+            self._initial_count = self.areas_count
+
+            # The seed, if known, is enough to generate the same mines positions again (not the ones a Board would get from it)
+            if isinstance(seed, random.Random):
+                self.seed = None
+                rng = seed
+            else:
+                self.seed = seed if seed is not None else random.getrandbits(64)
+                rng = random.Random(self.seed)
+
+            for start in range(0, self.areas_count, _BLOCK_SIZE):
+                end = min(start + _BLOCK_SIZE, self.areas_count)
+
+                self._states[start:end] = bytes([AreaState.INITIAL]) * (end - start)
+
+            self._populate(rng)
+            self._compute_nearby_mines()
+        except BaseException:
+            self.close()
+
+            os.remove(filename)
+
+            raise
+
+    def __getstate__(self):
+        raise TypeError('Mapped boards are kept in their file only')
+
+    @classmethod
+    def open(cls, filename):
+        """Open a board from its file, without reading its areas."""
+        board = cls.__new__(cls)
+        board._map(filename)
+
+        return board
+
+    @property
+    def seed(self):
+        """The seed the mines of this board were generated from, or None if it doesn't give them anymore."""
+        return self._seed if self._has_seed else None
+
+    @seed.setter
+    def seed(self, value):
+        """seed setter."""
+        self._has_seed = 0 if value is None else 1
+        self._seed = 0 if value is None else value
+
+    def has_cleared_areas(self):
+        """Determine if any area was cleared, i.e. if the game played on this field was started."""
+        return bool(self._has_cleared)
+
+    def has_exploded(self):
+        """Determine if a mine exploded, i.e. if the game played on this field was lost."""
+        return bool(self._has_exploded)
+
+    def _set_state(self, index, value):
+        """Change the state of the area at the given index. Areas cleared around it afterwards don't go through here, but
+        it was cleared itself first."""
+        super(MappedBoard, self)._set_state(index, value)
+
+        if value == AreaState.CLEARED:
+            self._has_cleared = 1
+        elif value == AreaState.EXPLODED:
+            self._has_exploded = 1
+
+    def _create_file(self, filename, width, height, mines):
+        """Create the file of a new board, with its header and room for its buffers."""
+        areas_size = -(-width * height // ALIGNMENT) * ALIGNMENT
+        mines_offset = ALIGNMENT
+        counts_offset = mines_offset + areas_size
+        states_offset = counts_offset + areas_size
+
+        with open(filename, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, width, height, mines, mines_offset, counts_offset, states_offset))
+            f.truncate(states_offset + width * height) # Sparse on most file systems: areas are only written once used
+
+    def _map(self, filename):
+        """Map the header and the buffers of the given board file."""
+        self.filename = filename
+        self._changed_areas = set()
+        self._lock = threading.Lock() # The board may be flushed by another thread, e.g. when the game is saved
+
+        self._file = open(filename, 'r+b')
+        self._header = self._mines = self._counts = self._states = None
+
+        try:
+            if os.fstat(self._file.fileno()).st_size < _HEADER_SIZE:
+                raise ValueError('Truncated board file')
+
+            self._header = mmap.mmap(self._file.fileno(), _HEADER_SIZE)
+
+            magic, version, self.width, self.height, self.mines, mines_offset, counts_offset, states_offset = _HEADER.unpack_from(self._header)
+
+            if magic != MAGIC:
+                raise ValueError('Not a board file')
+
+            if version > VERSION:
+                raise ValueError('Board file made with a newer version of the game (format {})'.format(version))
+
+            self.areas_count = self.width * self.height
+
+            if os.fstat(self._file.fileno()).st_size < states_offset + self.areas_count:
+                raise ValueError('Truncated board file')
+
+            self._mines = MappedBuffer(self._file.fileno(), self.areas_count, offset=mines_offset)
+            self._counts = MappedBuffer(self._file.fileno(), self.areas_count, offset=counts_offset)
+            self._states = MappedBuffer(self._file.fileno(), self.areas_count, offset=states_offset)
+        except BaseException:
+            self.close()
+
+            raise
+
+    def flush(self):
+        """Write the changes made to this board to the disk. Nothing is done if it was closed, which flushed it."""
+        with self._lock:
+            if self._file.closed:
+                return
+
+            for buffer in (self._header, self._mines, self._counts, self._states):
+                buffer.flush()
+
+    def close(self):
+        """Flush then unmap this board. It can't be used anymore afterwards."""
+        with self._lock:
+            for buffer in (self._header, self._mines, self._counts, self._states):
+                if buffer is not None and not buffer.closed:
+                    buffer.flush()
+                    buffer.close()
+
+            self._file.close()
+
+    def _populate(self, rng):
+        """Generate and place random mines band of areas by band of areas: the number of mines of each band is drawn
+        first, then their positions in the band, which is written at once. Only a band is ever in memory."""
+        mines_left = self.mines
+
+        for start in range(0, self.areas_count, _MINES_BAND_SIZE):
+            size = min(_MINES_BAND_SIZE, self.areas_count - start)
+            mines = _hypergeometric(rng, size, mines_left, self.areas_count - start)
+            mines_left -= mines
+
+            if mines * 2 <= size:
+                band = bytearray(size)
+
+                _draw_areas(rng, band, mines, 1)
+            else: # Densely mined band: the unmined areas are drawn instead
+                band = bytearray(b'\x01') * size
+
+                _draw_areas(rng, band, size - mines, 0)
+
+            self._mines[start:start + size] = band
+
+    def place_mines(self, indexes):
+        """Replace the mines of this field, which must not have been played yet, by mines at the given indexes."""
+        if len(indexes) != self.mines:
+            raise ValueError('Expected {} mines, got {}'.format(self.mines, len(indexes)))
+
+        for start in range(0, self.areas_count, _BLOCK_SIZE):
+            end = min(start + _BLOCK_SIZE, self.areas_count)
+
+            self._mines[start:end] = bytes(end - start)
+
+        for index in indexes:
+            self._mines[index] = 1
+
+        self.seed = None # The seed doesn't give these mines positions anymore
+
+        self._compute_nearby_mines()
+
+    def _compute_nearby_mines(self):
+        """Compute the nearby mines counts band of rows by band of rows, each one along with the rows surrounding it, so
+        the whole board is never in memory at once."""
+        width = self.width
+        rows = max(1, _BLOCK_SIZE // width)
+
+        for top in range(0, self.height, rows):
+            bottom = min(top + rows, self.height)
+            first = max(top - 1, 0)
+            last = min(bottom + 1, self.height)
+
+            band = Board.from_buffers(width, last - first, 0, 0, bytearray(self._mines[first * width:last * width]), bytearray((last - first) * width))
+            start = (top - first) * width
+
+            self._counts[top * width:bottom * width] = band._counts[start:start + (bottom - top) * width]
@@ -0,0 +1,239 @@
+"""The overview of fields larger than the window.
+
+Each pixel of the overview shows an area, or a square block of areas on fields larger than the overview. The looks of
+the areas are ordered by priority, so a block shows the most important one among its areas: a single cleared area makes
+its block show as cleared, a single mine marker as marked, and so on.
+
+The pixels are a buffer of looks codes, one byte per pixel, displayed by an 8-bit surface sharing it and whose palette
+gives the color of each look. They are computed from the buffers of the field, all at once when needed, then only for
+the areas which changed after each move."""
+from chunked_board import ChunkedBoard, CHUNK_SIZE
+from engine import AreaState
+import settings
+import pygame
+
+try:
+    import numpy
+except ImportError: # NumPy is optional, the whole overview will be computed in pure Python without it
+    numpy = None
+
+
+class Look:
+    UNCLEARED = 0
+    MINE = 1 # An uncleared area whose mine is shown, once the game ended
+    CLEARED = 2
+    MARKED = 3
+    EXPLODED = 4
+
+
+_STATE_TO_LOOK = bytes({
+    AreaState.CLEARED: Look.CLEARED,
+    AreaState.MARKED: Look.MARKED,
+    AreaState.EXPLODED: Look.EXPLODED
+}.get(value, Look.UNCLEARED) for value in range(0, 256))
+
+
+class Minimap:
+    def __init__(self, max_size):
+        self.max_size = max_size # In pixels
+
+        self.field = None
+        self.show_mines = False
+        self.areas_per_pixel = 1 # Side of the blocks of areas shown by each pixel
+        self.pixel_side = 1 # Side of each pixel on the screen
+        self.surface = None
+
+        self.renders = 0 # Number of times the whole overview was computed
+
+        self._pixels = bytearray()
+
+    def get_layout(self, field):
+        """Return the side of the blocks of areas shown by each pixel of the overview of the given field, the size of
+        the overview in pixels and the side of each pixel on the screen."""
+        max_width, max_height = self.max_size
+        areas_per_pixel = max(1, -(-field.width // max_width), -(-field.height // max_height))
+        size = (-(-field.width // areas_per_pixel), -(-field.height // areas_per_pixel))
+
+        return areas_per_pixel, size, max(1, min(max_width // size[0], max_height // size[1]))
+
+    def get_size(self, field):
+        """Return the size the overview of the given field takes on the screen, in pixels."""
+        _, (width, height), pixel_side = self.get_layout(field)
+
+        return width * pixel_side, height * pixel_side
+
+    def clear(self):
+        """Forget the field, so its overview is computed again entirely the next time it's updated."""
+        self.field = None
+
+    def update(self, field, indexes):
+        """Update the overview of the given field after the areas at the given indexes changed. It's computed again
+        entirely if it's another field, or if its mines were shown or hidden."""
+        if field is not self.field or field.show_mines != self.show_mines:
+            self.render(field)
+        elif indexes:
+            self._update_areas(indexes)
+
+    def render(self, field):
+        """Compute the whole overview of the given field."""
+        self.field = field
+        self.show_mines = field.show_mines
+        self.areas_per_pixel, size, self.pixel_side = self.get_layout(field)
+
+        self._pixels = bytearray(size[0] * size[1])
+
+        self.surface = pygame.image.frombuffer(self._pixels, size, 'P') # Shares the pixels buffer
+        self.surface.set_palette(settings.MINIMAP_COLORS)
+
+        if isinstance(field, ChunkedBoard):
+            self._update_areas(self._get_chunks_areas())
+        elif numpy is not None:
+            self._render_numpy(size)
+        else:
+            self._render_python(size)
+
+        self.renders += 1
+
+    def _render_numpy(self, size):
+        """Compute the looks of all the areas at once, then the highest one of each block of areas."""
+        field = self.field
+        width, height = size
+
+        looks = numpy.frombuffer(_STATE_TO_LOOK, dtype=numpy.uint8)[numpy.frombuffer(field._states, dtype=numpy.uint8)]
+
+        if self.show_mines:
+            looks[(numpy.frombuffer(field._mines, dtype=numpy.uint8) == 1) & (looks == Look.UNCLEARED)] = Look.MINE
+
+        blocks = numpy.zeros((height * self.areas_per_pixel, width * self.areas_per_pixel), dtype=numpy.uint8)
+        blocks[:field.height, :field.width] = looks.reshape(field.height, field.width)
+
+        self._pixels[:] = blocks.reshape(height, self.areas_per_pixel, width, self.areas_per_pixel).max(axis=(1, 3)).tobytes()
+
+    def _render_python(self, size):
+        """Compute the highest look of each block of areas, row of blocks by row of blocks: the looks of each row of
+        areas are computed at once, then merged with the ones of the other rows of the block."""
+        field = self.field
+        width, height = size
+        step = self.areas_per_pixel
+
+        for pixel_y in range(0, height):
+            pixels = bytes(width)
+
+            for y in range(pixel_y * step, min((pixel_y + 1) * step, field.height)):
+                looks = self._get_looks(y, 0, field.width)
+
+                if step > 1:
+                    looks = bytes(max(looks[x:x + step]) for x in range(0, field.width, step))
+
+                pixels = bytes(map(max, pixels, looks))
+
+            self._pixels[pixel_y * width:(pixel_y + 1) * width] = pixels
+
+    def _get_chunks_areas(self, left=0, top=0, right=None, bottom=None):
+        """Return the indexes of the areas of a chunked field which may not look uncleared, from the left and top
+        coordinates to the right and bottom ones (excluded, the whole field by default): the ones of the played chunks,
+        and the mines of the chunks in memory if they're shown. The other chunks were never played nor drawn."""
+        field = self.field
+        right = field.width if right is None else right
+        bottom = field.height if bottom is None else bottom
+        chunks = list(field._played_chunks.items())
+
+        if self.show_mines:
+            chunks += list(field._chunks.items())
+
+        for (chunk_x, chunk_y), chunk in chunks:
+            chunk_left, chunk_top = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+
+            if chunk_left >= right or chunk_top >= bottom or chunk_left + CHUNK_SIZE <= left or chunk_top + CHUNK_SIZE <= top:
+                continue
+
+            looks = chunk.states.translate(_STATE_TO_LOOK)
+
+            for local in range(0, len(looks)):
+                if looks[local] != Look.UNCLEARED or (self.show_mines and chunk.mines[local]):
+                    x, y = chunk_left + local % CHUNK_SIZE, chunk_top + local // CHUNK_SIZE
+
+                    if left <= x < right and top <= y < bottom:
+                        yield y * field.width + x
+
+    def _update_areas(self, indexes):
+        """Update the pixels showing the areas at the given indexes."""
+        width = self.surface.get_width()
+        stale = set()
+
+        for index in indexes:
+            x, y = index % self.field.width, index // self.field.width
+            pixel = (y // self.areas_per_pixel) * width + x // self.areas_per_pixel
+            look = self._get_look(index)
+
+            if look >= self._pixels[pixel]:
+                self._pixels[pixel] = look
+            else: # The area may be the one which gave its look to the pixel
+                stale.add(pixel)
+
+        for pixel in stale:
+            self._pixels[pixel] = self._get_block_look(pixel % width, pixel // width)
+
+    def _get_look(self, index):
+        """Return the look of the area at the given index."""
+        look = _STATE_TO_LOOK[self.field._states[index]]
+
+        if look == Look.UNCLEARED and self.show_mines and self.field._mines[index]:
+            return Look.MINE
+
+        return look
+
+    def _get_looks(self, y, start_x, end_x):
+        """Return the looks of the areas of the given row, from the start column to the end one (excluded)."""
+        start = y * self.field.width + start_x
+        looks = bytearray(bytes(self.field._states[start:start + end_x - start_x]).translate(_STATE_TO_LOOK))
+
+        if self.show_mines:
+            mines = bytes(self.field._mines[start:start + end_x - start_x])
+            index = mines.find(1)
+
+            while index != -1:
+                if looks[index] == Look.UNCLEARED:
+                    looks[index] = Look.MINE
+
+                index = mines.find(1, index + 1)
+
+        return looks
+
+    def _get_block_look(self, pixel_x, pixel_y):
+        """Return the highest look of the areas shown by the given pixel."""
+        start_x = pixel_x * self.areas_per_pixel
+        start_y = pixel_y * self.areas_per_pixel
+        end_x = min(start_x + self.areas_per_pixel, self.field.width)
+        end_y = min(start_y + self.areas_per_pixel, self.field.height)
+
+        if isinstance(self.field, ChunkedBoard): # Reading the areas of the block would generate all its chunks
+            return max(map(self._get_look, self._get_chunks_areas(start_x, start_y, end_x, end_y)), default=Look.UNCLEARED)
+
+        return max(max(self._get_looks(y, start_x, end_x)) for y in range(start_y, end_y))
+
+    def get_area_coords(self, rect, pos):
+        """Return the coordinates of the area shown at the given window position by the overview drawn in the given
+        rect."""
+        return (
+            min(max(0, (pos[0] - rect.left) * self.areas_per_pixel // self.pixel_side), self.field.width - 1),
+            min(max(0, (pos[1] - rect.top) * self.areas_per_pixel // self.pixel_side), self.field.height - 1)
+        )
+
+    def draw(self, surface, rect, view):
+        """Draw the overview in the given rect of the given surface, with a frame around the part of the field that's in
+        the window, given as (left, top, right, bottom) areas coordinates."""
+        surface.blit(pygame.transform.scale(self.surface, rect.size), rect)
+
+        left, top, right, bottom = view
+        scale = self.pixel_side / self.areas_per_pixel
+
+        view_rect = pygame.Rect(
+            rect.left + int(left * scale),
+            rect.top + int(top * scale),
+            max(2, int((right - left) * scale)),
+            max(2, int((bottom - top) * scale))
+        )
+
+        pygame.draw.rect(surface, settings.MINIMAP_VIEW_COLOR, view_rect.clip(rect), 1)
+        pygame.draw.rect(surface, settings.GRID_COLOR, rect.inflate(2, 2), 1)
@@ -0,0 +1,131 @@
+"""Files writing in a background thread, so the game loop never waits for the disk.
+
+Files are written atomically: in a temporary file next to the final one, flushed to the disk, then renamed over it. A
+crash in the middle of a write thus leaves the previous version of the file untouched. Writes to the same file that are
+requested while a previous one is still waiting are merged: only the latest content is written."""
+from collections import deque
+import threading
+import tempfile
+import logging
+import time
+import stat
+import os
+
+# Reading the umask means setting it, which isn't thread-safe: it's done once, before any write thread is started
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomically(filename, data):
+    """Write the given bytes to the given file, replacing it at once."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_filename = tempfile.mkstemp(prefix='.' + os.path.basename(filename) + '.', suffix='.tmp', dir=directory)
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Temporary files are only readable by their owner: give it the mode of the file it replaces, or the one of a new
+        # file
+        try:
+            mode = stat.S_IMODE(os.stat(filename).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+
+        os.chmod(temp_filename, mode)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+
+        raise
+
+
+class PersistenceWorker:
+    def __init__(self, delay=0.1):
+        self.delay = delay # Time to wait for other writes to merge with, in seconds
+
+        self.writes = 0 # Files written or removed
+        self.merged = 0 # Writes replaced by a later one before they happened
+        self.write_durations = deque(maxlen=100) # Time it took to perform each of the last writes, in seconds
+
+        self._pending = {} # File name: function returning the bytes to write, or None to remove the file
+        self._condition = threading.Condition()
+        self._busy = False
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._run, name='PersistenceWorker', daemon=True)
+        self._thread.start()
+
+    def write(self, filename, produce):
+        """Write the bytes returned by the given function to the given file. The function is called by the worker
+        thread, so it must only use data that won't change in the meantime (e.g. a snapshot)."""
+        self._submit(filename, produce)
+
+    def remove(self, filename):
+        """Remove the given file, if it exists."""
+        self._submit(filename, None)
+
+    def flush(self):
+        """Wait for all the pending writes to be done."""
+        with self._condition:
+            while (self._pending or self._busy) and self._thread.is_alive():
+                self._condition.wait(0.1)
+
+    def stop(self):
+        """Perform all the pending writes, then stop the worker thread."""
+        with self._condition:
+            self._stopped = True
+
+            self._condition.notify_all()
+
+        self._thread.join()
+
+    def _submit(self, filename, produce):
+        """Queue a write, replacing the pending one of the same file if any."""
+        with self._condition:
+            if filename in self._pending:
+                self.merged += 1
+
+            self._pending[filename] = produce
+
+            self._condition.notify_all()
+
+    def _run(self):
+        """Perform the pending writes, in batches."""
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+
+                if not self._pending and self._stopped:
+                    return
+
+            if not self._stopped:
+                time.sleep(self.delay) # More writes of the same files may come in bursts
+
+            with self._condition:
+                pending = self._pending
+                self._pending = {}
+                self._busy = True
+
+            for filename, produce in pending.items():
+                started_at = time.perf_counter()
+
+                try:
+                    if produce is None:
+                        if os.path.isfile(filename):
+                            os.remove(filename)
+                    else:
+                        write_atomically(filename, produce())
+                except Exception:
+                    logging.exception('Could not write {}'.format(filename))
+
+                self.writes += 1
+                self.write_durations.append(time.perf_counter() - started_at)
+
+            with self._condition:
+                self._busy = False
+
+                self._condition.notify_all()
@@ -0,0 +1,236 @@
+"""Games recording and replaying.
+
+A replay is the board a game was played on, given by its seed (or by its mines if it has none, e.g. no-guess fields)
+and by how it was generated from it, followed by the moves of the player. Each move is two variable-length integers: the time elapsed since the previous move
+in milliseconds, and the index of the area shifted left by one bit, the lowest bit telling if the area was cleared (0) or
+if its mine marker was toggled (1). Most moves thus take 3 to 5 bytes.
+
+Replays can be played back in the game window at any speed, or instantly without any display:
+
+    python replay.py last_game.replay"""
+from save_game_manager import pack_bits, unpack_bits
+from chunked_board import ChunkedBoard
+from mapped_board import MappedBoard
+from engine import Board, Session, GameState
+import argparse
+import struct
+import time
+import os
+
+MAGIC = b'MSWR'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sBBBIIIQ')
+
+_FLAG_HAS_SEED = 1
+_FLAG_CHUNKED = 2 # The board was generated chunk by chunk from the seed
+_FLAG_MAPPED = 4 # The board was generated band of areas by band of areas from the seed, in a file
+
+REVEAL = 0
+TOGGLE_MINE_MARKER = 1
+
+
+def _write_varint(buffer, value):
+    """Append an unsigned integer to the given buffer, 7 bits per byte."""
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    buffer.append(value)
+
+
+def _read_varint(data, position):
+    """Read an unsigned integer written by _write_varint(). Return it along with the position following it."""
+    value = 0
+    shift = 0
+
+    while True:
+        byte = data[position]
+        position += 1
+
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if byte < 0x80:
+            return value, position
+
+
+class Recorder:
+    """Records the moves of a game, from its start."""
+    def __init__(self, session):
+        board = session.board
+
+        self.width = board.width
+        self.height = board.height
+        self.mines = board.mines
+        self.first_click = session.first_click
+        self.seed = board.seed
+        self.chunked = isinstance(board, ChunkedBoard)
+        self.mapped = isinstance(board, MappedBoard)
+        self.mines_buffer = bytes(board._mines) if board.seed is None else None
+
+        self.moves = 0
+
+        self._moves = bytearray()
+        self._started_at = time.monotonic()
+        self._last_move_at = 0
+
+    def record(self, kind, coords):
+        """Record a move of the given kind (REVEAL or TOGGLE_MINE_MARKER) on the area at the given coordinates."""
+        now = int((time.monotonic() - self._started_at) * 1000)
+
+        _write_varint(self._moves, now - self._last_move_at)
+        _write_varint(self._moves, ((coords[1] * self.width + coords[0]) << 1) | kind)
+
+        self._last_move_at = now
+        self.moves += 1
+
+    def dump(self):
+        """Return the recorded game as saved."""
+        header = _HEADER.pack(
+            MAGIC,
+            VERSION,
+            (_FLAG_HAS_SEED if self.seed is not None else 0) | (_FLAG_CHUNKED if self.chunked else 0) | (_FLAG_MAPPED if self.mapped else 0),
+            self.first_click,
+            self.width,
+            self.height,
+            self.mines,
+            self.seed if self.seed is not None else 0
+        )
+
+        return header + (pack_bits(self.mines_buffer, 1) if self.seed is None else b'') + bytes(self._moves)
+
+
+class Replay:
+    """A recorded game."""
+    def __init__(self, width, height, mines, first_click, seed, mines_buffer, moves, chunked=False, mapped=False):
+        self.width = width
+        self.height = height
+        self.mines = mines
+        self.first_click = first_click
+        self.seed = seed
+        self.chunked = chunked
+        self.mapped = mapped
+        self.mines_buffer = mines_buffer
+        self.moves = moves # List of (milliseconds since the start of the game, kind, coordinates)
+
+    @classmethod
+    def loads(cls, data):
+        """Read a replay from the bytes returned by Recorder.dump()."""
+        if len(data) < _HEADER.size or data[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a replay')
+
+        _, version, flags, first_click, width, height, mines, seed = _HEADER.unpack_from(data)
+
+        if version > VERSION:
+            raise ValueError('Replay made with a newer version of the game (format {})'.format(version))
+
+        position = _HEADER.size
+        mines_buffer = None
+
+        if not flags & _FLAG_HAS_SEED:
+            mines_size = (width * height + 7) // 8
+            mines_buffer = unpack_bits(data[position:position + mines_size], 1, width * height)
+            position += mines_size
+
+        moves = []
+        elapsed = 0
+
+        try:
+            while position < len(data):
+                delay, position = _read_varint(data, position)
+                move, position = _read_varint(data, position)
+
+                elapsed += delay
+                index = move >> 1
+
+                moves.append((elapsed, move & 1, (index % width, index // width)))
+        except IndexError:
+            raise ValueError('Truncated replay')
+
+        return cls(width, height, mines, first_click, seed if flags & _FLAG_HAS_SEED else None, mines_buffer, moves, bool(flags & _FLAG_CHUNKED), bool(flags & _FLAG_MAPPED))
+
+    @classmethod
+    def load(cls, filename):
+        """Read a replay from a file."""
+        with open(filename, 'rb') as f:
+            return cls.loads(f.read())
+
+    def create_session(self, board_class=Board, chunked_board_class=ChunkedBoard, mapped_board_class=MappedBoard):
+        """Create the session the game was started with, on a board of the given Board class (or of the given
+        ChunkedBoard or MappedBoard class if the game was played on a chunked or mapped board)."""
+        if self.chunked:
+            board_class = chunked_board_class
+        elif self.mapped:
+            board_class = mapped_board_class
+
+        board = board_class(self.width, self.height, self.mines, seed=self.seed)
+
+        if self.seed is None: # The mines weren't generated from a seed, e.g. the ones of a no-guess field
+            if not board_class.can_place_mines:
+                raise ValueError('The mines of the replayed game can\'t be placed on a {}'.format(board_class.__name__))
+
+            board.place_mines([index for index, mined in enumerate(self.mines_buffer) if mined])
+
+        return Session(board, first_click=self.first_click)
+
+    def play(self, session, moves=None):
+        """Apply the given moves (all of them by default) to the given session, without waiting between them. Return the
+        indexes of the areas that changed."""
+        changed_areas = set()
+
+        for _, kind, coords in self.moves if moves is None else moves:
+            if kind == REVEAL:
+                changed_areas.update(session.reveal(coords))
+            elif session.toggle_mine_marker(coords):
+                changed_areas.add(coords[1] * self.width + coords[0])
+
+        return changed_areas
+
+    def play_instantly(self, board_class=Board, chunked_board_class=ChunkedBoard, mapped_board_class=MappedBoard):
+        """Rebuild the final state of the game. Return its session."""
+        session = self.create_session(board_class, chunked_board_class, mapped_board_class)
+
+        self.play(session)
+
+        if self.moves:
+            session.duration = self.moves[-1][0] // 1000
+
+        return session
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Replay a recorded Minesweeper game instantly, without any display.')
+    parser.add_argument('filename', help='Replay file')
+    parser.add_argument('--board', action='store_true', help='Print the final board')
+
+    args = parser.parse_args()
+
+    replay = Replay.load(args.filename)
+
+    start = time.perf_counter()
+    session = replay.play_instantly()
+    elapsed = time.perf_counter() - start
+
+    if args.board:
+        print(session.board)
+
+    print('{}x{}, {} mines, {}: {} moves in {} s of play, replayed in {:.3f} ms ({:.0f} moves/s)'.format(
+        replay.width,
+        replay.height,
+        replay.mines,
+        {GameState.PLAYING: 'unfinished', GameState.WON: 'won', GameState.LOST: 'lost'}[session.state],
+        len(replay.moves),
+        session.duration,
+        elapsed * 1000,
+        len(replay.moves) / elapsed if elapsed else 0
+    ))
+
+    if isinstance(session.board, MappedBoard): # Its file was only needed to replay the game
+        session.board.close()
+
+        os.remove(session.board.filename)
+
+
+if __name__ == '__main__':
+    run()
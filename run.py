@@ -1,4 +1,7 @@
+import multiprocessing
+import argparse
 import logging
+import settings
 import pygame
 import game
 import sys
@@ -6,6 +9,12 @@ import os
 
 
 def run():
+    parser = argparse.ArgumentParser(description='The Minesweeper game.')
+    parser.add_argument('--replay', metavar='FILE', help='Play back a recorded game, e.g. {}'.format(settings.REPLAY_FILE_NAME))
+    parser.add_argument('--speed', type=float, default=1, help='Speed factor of the played back game, or 0 to show its end at once')
+
+    args = parser.parse_args()
+
     if 'SDL_VIDEO_WINDOW_POS' not in os.environ:
         os.environ['SDL_VIDEO_CENTERED'] = '1' # This makes the window centered on the screen
 
@@ -27,7 +36,7 @@ def run():
 
     logging.info('Initializing game')
 
-    g = game.Game()
+    g = game.Game(replay_filename=args.replay, replay_speed=args.speed)
 
     logging.info('Running game')
 
@@ -36,4 +45,6 @@ def run():
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support() # Needed by the no-guess fields generation processes once frozen by PyInstaller
+
     run()
@@ -1,32 +1,421 @@
+"""Saved games, in a compact and versioned binary format:
+
+  - a header: the MAGIC bytes, the format version, flags, the board dimensions, mines count, mines left, game duration
+    and board seed,
+  - the body: the mines of the board as a bitmap (one bit per area), then the states of the areas (two bits per area),
+    both in the y * width + x order and optionally compressed with zlib.
+
+Chunked boards (format version 2) only save what can't be generated again from their seed: the mines moved since their
+chunks were generated, then the states of the areas of the chunks that were played, by chunk. Nearby mines counts aren't
+saved as they are computed again from the mines when loading. Saved games made with the
+previous pickle-based format are still loaded, then saved again in this format.
+
+Mapped boards (format version 3) are already kept in their own file, next to the saved game (see mapped_board.py): the
+body is only the name of this file, which is flushed when the game is saved."""
+from chunked_board import ChunkedBoard, CHUNK_SIZE
+from persistence import write_atomically
+from mapped_board import MappedBoard
+from engine import AreaState
+import functools
 import logging
+import struct
 import pickle
+import zlib
 import os
 
+try:
+    import numpy
+except ImportError: # NumPy is optional, buffers will be packed in pure Python without it
+    numpy = None
+
+MAGIC = b'MSWS'
+VERSION = 3
+
+_HEADER = struct.Struct('<4sBBIIIIIQ')
+
+_FLAG_COMPRESSED = 1
+_FLAG_HAS_SEED = 2
+_FLAG_CHUNKED = 4
+_FLAG_MAPPED = 8
+
+_CHUNKS_COUNT = struct.Struct('<I')
+_MOVED_MINE = struct.Struct('<IIHB') # Chunk x, chunk y, area index in the chunk, mined
+_CHUNK = struct.Struct('<II') # Chunk x, chunk y, followed by the states of its areas
+
+_CHUNK_SIZE = 64 * 1024
+
+# Areas states to 2-bits codes, and back
+_STATES = (AreaState.INITIAL, AreaState.CLEARED, AreaState.MARKED, AreaState.EXPLODED)
+_STATE_TO_CODE = bytes(_STATES.index(value) if value in _STATES else 0 for value in range(0, 256))
+_CODE_TO_STATE = bytes(_STATES[value & 3] for value in range(0, 256))
+
+# The only classes legacy saved games may contain
+_LEGACY_CLASSES = {
+    ('field', 'Field'),
+    ('field', 'Area'),
+    ('builtins', 'bytearray'),
+    ('builtins', 'set')
+}
+
+
+def pack_bits(values, bits):
+    """Pack the given buffer of small values (smaller than 2 ** bits) into a buffer of 8 // bits values per byte, the
+    first value in the lowest bits."""
+    per_byte = 8 // bits
+    values = bytes(values) + bytes(-len(values) % per_byte)
+
+    if numpy is not None:
+        grouped = numpy.frombuffer(values, dtype=numpy.uint8).reshape(-1, per_byte)
+        packed = numpy.zeros(len(grouped), dtype=numpy.uint8)
+
+        for position in range(0, per_byte):
+            packed |= grouped[:, position] << (position * bits)
+
+        return packed.tobytes()
+
+    packed = 0
+
+    # Each shifted slice only sets its own bits in each byte, so they can be added up as big integers
+    for position in range(0, per_byte):
+        table = bytes((value << (position * bits)) & 0xFF for value in range(0, 256))
+
+        packed += int.from_bytes(values[position::per_byte].translate(table), 'big')
+
+    return packed.to_bytes(len(values) // per_byte, 'big')
+
+
+@functools.lru_cache()
+def _unpack_tables(bits, values):
+    """The values of each packed byte by position in it, mapped by the given values if any, and the same as a NumPy
+    (256, values per byte) array if NumPy is available."""
+    per_byte = 8 // bits
+    mask = (1 << bits) - 1
+    table = [bytes((value >> (position * bits)) & mask for value in range(0, 256)) for position in range(0, per_byte)]
+
+    if values is not None:
+        table = [bytes(values[value] for value in position_table) for position_table in table]
+
+    if numpy is None:
+        return table, None
+
+    return table, numpy.frombuffer(b''.join(table), dtype=numpy.uint8).reshape(per_byte, 256).T.copy()
+
+
+def unpack_bits(packed, bits, count, out=None, values=None):
+    """Unpack count values from a buffer made by pack_bits(), into the given writable buffer of count bytes if any (a new
+    bytearray otherwise), which is returned. Each value is replaced by the one at its index in the given values, if any
+    (e.g. a 2-bits code by the area state it stands for)."""
+    per_byte = 8 // bits
+    full = min(count // per_byte, len(packed)) # Packed bytes whose values are all unpacked
+    table, lookup = _unpack_tables(bits, values)
+
+    if out is None:
+        out = bytearray(count)
+
+    if numpy is not None:
+        codes = numpy.frombuffer(packed, dtype=numpy.uint8)
+        result = numpy.frombuffer(out, dtype=numpy.uint8)
+
+        numpy.take(lookup, codes[:full], axis=0, out=result[:full * per_byte].reshape(full, per_byte))
+    else:
+        for position in range(0, per_byte):
+            out[position:full * per_byte:per_byte] = bytes(packed[:full]).translate(table[position])
+
+    for position in range(0, count - full * per_byte): # Values of the last packed byte, which holds padding too
+        out[full * per_byte + position] = table[position][packed[full]]
+
+    return out
+
+
+class GameSnapshot:
+    """A copy of what's saved of a game, which can be saved while the game goes on."""
+    def __init__(self, field, duration):
+        self.width = field.width
+        self.height = field.height
+        self.mines = field.mines
+        self.mines_left = field.mines_left
+        self.seed = field.seed
+        self.duration = duration
+        self.chunked = isinstance(field, ChunkedBoard)
+        self.mapped_board = field if isinstance(field, MappedBoard) else None # Its areas are already in its file
+
+        if self.chunked: # Copying the buffers of the whole board would generate all its chunks
+            self.moved_mines = field.get_moved_mines()
+            self.played_states = field.get_played_states()
+        elif not self.mapped_board:
+            self._mines = bytes(field._mines)
+            self._states = bytes(field._states)
+
+
+def save_game(filename, field, duration, compress=True):
+    """Save the current game."""
+    logging.info('Saving current game')
+
+    write_atomically(filename, dump_game(field, duration, compress))
+
+
+def dump_game(field, duration, compress=True):
+    """Return the current game as saved."""
+    if isinstance(field, (ChunkedBoard, MappedBoard)):
+        field = GameSnapshot(field, duration)
+
+    if getattr(field, 'chunked', False):
+        body = _pack_chunks(field.moved_mines, field.played_states)
+        flags = _FLAG_CHUNKED
+    elif getattr(field, 'mapped_board', None):
+        field.mapped_board.flush() # Its changes must reach the disk before the saved game points to it
+
+        body = os.path.basename(field.mapped_board.filename).encode('utf-8')
+        flags = _FLAG_MAPPED
+    else:
+        body = pack_bits(field._mines, 1) + pack_bits(field._states.translate(_STATE_TO_CODE), 2)
+        flags = 0
+
+    if compress:
+        body = zlib.compress(body, 1) # Fastest level, the packed buffers are already small
+        flags |= _FLAG_COMPRESSED
+
+    if field.seed is not None:
+        flags |= _FLAG_HAS_SEED
+
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION if flags & _FLAG_MAPPED else 2 if flags & _FLAG_CHUNKED else 1, # Other games can still be read by previous versions of the game
+        flags,
+        field.width,
+        field.height,
+        field.mines,
+        field.mines_left,
+        int(duration),
+        field.seed if field.seed is not None else 0
+    )
+
+    return header + body
+
+
+def _pack_chunks(moved_mines, played_states):
+    """Return the body of a saved chunked game."""
+    body = bytearray()
+
+    body += _CHUNKS_COUNT.pack(sum(len(moved) for moved in moved_mines.values()))
+
+    for (chunk_x, chunk_y), moved in sorted(moved_mines.items()):
+        for local, mined in sorted(moved.items()):
+            body += _MOVED_MINE.pack(chunk_x, chunk_y, local, mined)
+
+    body += _CHUNKS_COUNT.pack(len(played_states))
+
+    for (chunk_x, chunk_y), states in sorted(played_states.items()):
+        body += _CHUNK.pack(chunk_x, chunk_y) + pack_bits(states.translate(_STATE_TO_CODE), 2)
+
+    return bytes(body)
+
 
-def load_game(filename, obj, attrs):
-    """Load a saved game."""
+def _unpack_chunks(body):
+    """Return the moved mines and the states of the played chunks of a saved chunked game."""
+    states_size = CHUNK_SIZE * CHUNK_SIZE // 4
+    moved_mines = {}
+    played_states = {}
+
+    try:
+        count, = _CHUNKS_COUNT.unpack_from(body)
+        position = _CHUNKS_COUNT.size
+
+        for _ in range(0, count):
+            chunk_x, chunk_y, local, mined = _MOVED_MINE.unpack_from(body, position)
+            position += _MOVED_MINE.size
+
+            moved_mines.setdefault((chunk_x, chunk_y), {})[local] = mined
+
+        count, = _CHUNKS_COUNT.unpack_from(body, position)
+        position += _CHUNKS_COUNT.size
+
+        for _ in range(0, count):
+            chunk_x, chunk_y = _CHUNK.unpack_from(body, position)
+            position += _CHUNK.size
+
+            if position + states_size > len(body):
+                raise ValueError('truncated body')
+
+            played_states[(chunk_x, chunk_y)] = bytes(unpack_bits(body[position:position + states_size], 2, CHUNK_SIZE * CHUNK_SIZE).translate(_CODE_TO_STATE))
+            position += states_size
+    except struct.error:
+        raise ValueError('truncated body')
+
+    return moved_mines, played_states
+
+
+def load_game(filename, board_class):
+    """Load a saved game. Return the board, as an instance of the given Board class, and the game duration, or None if
+    there's no saved game or if it couldn't be read."""
     if not os.path.isfile(filename):
         logging.info('Save file does not exists')
-        return
+        return None
 
     logging.info('Loading saved game')
 
     with open(filename, 'rb') as f:
-        data = pickle.load(f)
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
 
-    for attr in attrs:
-        if attr in data:
-            setattr(obj, attr, data[attr])
+            saved_game = _load_legacy_game(f)
+        else:
+            f.seek(0)
 
+            try:
+                saved_game = _read_game(f, board_class)
+            except ValueError as e:
+                logging.warning('Saved game can\'t be read: {}'.format(e))
 
-def save_game(filename, obj, attrs):
-    """Save the current game."""
-    logging.info('Saving current game')
+                return None
+
+    if saved_game and saved_game[2]:
+        logging.info('Migrating saved game to the current format')
+
+        save_game(filename, saved_game[0], saved_game[1])
+
+    return saved_game[:2] if saved_game else None
+
+
+def _read_game(f, board_class):
+    """Read a saved game from the given file, streaming its body into the board buffers."""
+    header = f.read(_HEADER.size)
+
+    if len(header) != _HEADER.size:
+        raise ValueError('truncated header')
+
+    _, version, flags, width, height, mines, mines_left, duration, seed = _HEADER.unpack(header)
+
+    if version > VERSION:
+        raise ValueError('made with a newer version of the game (format {})'.format(version))
+
+    if bool(flags & _FLAG_CHUNKED) != issubclass(board_class, ChunkedBoard):
+        raise ValueError('chunked fields are {}'.format('disabled' if flags & _FLAG_CHUNKED else 'enabled'))
+
+    if bool(flags & _FLAG_MAPPED) != issubclass(board_class, MappedBoard):
+        raise ValueError('mapped fields are {}'.format('disabled' if flags & _FLAG_MAPPED else 'enabled'))
+
+    if flags & (_FLAG_CHUNKED | _FLAG_MAPPED):
+        body = f.read()
+
+        if flags & _FLAG_COMPRESSED:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error as e:
+                raise ValueError(str(e))
+
+        if flags & _FLAG_MAPPED:
+            return _open_mapped_board(os.path.dirname(os.path.abspath(f.name)), body, board_class, width, height, mines), duration, False
+
+        board = board_class.from_chunks(width, height, mines, mines_left, seed, *_unpack_chunks(body))
+
+        return board, duration, False
+
+    # The body is read and decompressed chunk by chunk, each one being unpacked straight into the board buffers
+    areas_count = width * height
+    mines_buffer = bytearray(areas_count)
+    states = bytearray(areas_count)
+    chunks = iter(lambda: f.read(_CHUNK_SIZE), b'')
+
+    if flags & _FLAG_COMPRESSED:
+        decompressor = zlib.decompressobj()
+        chunks = map(decompressor.decompress, chunks)
+
+    try:
+        _unpack_body(chunks, mines_buffer, states)
+    except zlib.error as e:
+        raise ValueError(str(e))
+
+    board = board_class.from_buffers(
+        width,
+        height,
+        mines,
+        mines_left,
+        mines_buffer,
+        states,
+        seed=seed if flags & _FLAG_HAS_SEED else None
+    )
+
+    return board, duration, False
+
+
+def _unpack_body(chunks, mines_buffer, states):
+    """Unpack the body of a saved game, given by consecutive chunks of bytes, into the given mines and states buffers:
+    the mines bitmap first, then the states codes."""
+    areas_count = len(states)
+    mines_size = (areas_count + 7) // 8
+    body_size = mines_size + (areas_count + 3) // 4
+    position = 0
+
+    for chunk in chunks:
+        if position + len(chunk) > body_size:
+            raise ValueError('body too large')
+
+        chunk = memoryview(chunk)
+
+        if position < mines_size:
+            part = chunk[:mines_size - position]
+            first = position * 8
+            count = min(len(part) * 8, areas_count - first)
+
+            unpack_bits(part, 1, count, memoryview(mines_buffer)[first:first + count])
+
+        if position + len(chunk) > mines_size:
+            part = chunk[max(0, mines_size - position):]
+            first = max(0, position - mines_size) * 4
+            count = min(len(part) * 4, areas_count - first)
+
+            unpack_bits(part, 2, count, memoryview(states)[first:first + count], _STATES)
+
+        position += len(chunk)
+
+    if position != body_size:
+        raise ValueError('truncated body')
+
+
+def _open_mapped_board(directory, body, board_class, width, height, mines):
+    """Open the board file of a saved mapped game, whose name is the body, from the given directory. Its areas and mines
+    left are the ones of the file, which may have been played after the game was saved."""
+    try:
+        name = body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ValueError('invalid board file name')
+
+    if not name or os.path.basename(name) != name:
+        raise ValueError('invalid board file name')
+
+    try:
+        board = board_class.open(os.path.join(directory, name))
+    except OSError as e:
+        raise ValueError('board file can\'t be opened: {}'.format(e))
+
+    if (board.width, board.height, board.mines) != (width, height, mines):
+        board.close()
+
+        raise ValueError('board file doesn\'t match')
+
+    return board
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Only allows the classes saved games made with the pickle-based format contain."""
+    def find_class(self, module, name):
+        if (module, name) not in _LEGACY_CLASSES:
+            raise pickle.UnpicklingError('{}.{} is not allowed in saved games'.format(module, name))
+
+        return super(_LegacyUnpickler, self).find_class(module, name)
+
+
+def _load_legacy_game(f):
+    """Load a saved game made with the pickle-based format."""
+    try:
+        data = _LegacyUnpickler(f).load()
+    except (pickle.UnpicklingError, EOFError, AttributeError, ValueError) as e:
+        logging.warning('Legacy saved game can\'t be read: {}'.format(e))
 
-    data = {}
+        return None
 
-    for attr in attrs:
-        data[attr] = getattr(obj, attr)
+    if 'field' not in data:
+        return None
 
-    with open(filename, 'wb') as f:
-        pickle.dump(data, f)
+    return data['field'], data.get('duration', 0), True
@@ -1,4 +1,4 @@
-import pygame
+from engine import GameState, FirstClick
 import sys
 import os
 
@@ -6,14 +6,28 @@ import os
 # Editable settings
 
 FPS = 30
+EVENT_DRIVEN = True # Sleep until something happens instead of running at FPS frames per second. Set to False to always run at FPS
+DIRTY_RECTS = True # Only draw again what changed since the previous frame. Set to False to always draw the whole window
+FIELD_POOL_SIZE = 2 # Number of new fields built ahead of time in the background. Set to 0 to build them when needed
 
 AREAS_SIDE_SIZE = 25
+MAX_WINDOW_SIZE = (1280, 800) # Larger fields are scrolled with the arrow keys or by dragging them with the middle mouse button
+ZOOM_LEVELS = (0.5, 0.75, 1, 1.5, 2) # Scales the field can be displayed at, changed with the mouse wheel or the +/- keys
+SCROLL_STEP = 100 # Number of pixels the field is scrolled by with the arrow keys
+MINIMAP_SIZE = (200, 150) # Maximum size of the overview shown over fields larger than the window, in pixels. Set to None to hide it
 SAVE_FILE_NAME = 'save.dat'
 STATS_FILE_NAME = 'stats.json'
+HISTORY_FILE_NAME = 'history.db'
+REPLAY_FILE_NAME = 'last_game.replay'
+AUTOSAVE_INTERVAL = 10 # Seconds between two automatic saves of the game in progress
 
 WIDTH = 30
 HEIGHT = 16
 MINES = 99
+FIRST_CLICK = FirstClick.ANY # FirstClick.ANY (the first cleared area may be mined), FirstClick.SAFE (the first cleared area is never mined) or FirstClick.OPENING (nor the ones surrounding it)
+NO_GUESS = False # Only play fields that can be cleared without guessing, starting from the area revealed in the middle
+CHUNKED = False # Generate fields chunk by chunk, as they are explored, instead of all at once. Needed to play huge fields
+MAPPED = False # Keep the field in its own file, next to SAVE_FILE_NAME, instead of in memory: huge fields are opened at once and survive crashes without being saved
 
 GRID_SPACING = 1
 GRID_COLOR = (63, 137, 78)
@@ -34,6 +48,16 @@ SOUNDS_VOLUME = 0.3
 
 WINDOW_BACKGROUND_COLOR = (227, 228, 230)
 TEXT_COLOR = (90, 91, 92)
+HINT_COLOR = (230, 126, 34)
+
+MINIMAP_COLORS = (
+    (63, 137, 78), # Uncleared
+    (40, 40, 40), # Mine, shown once the game ended
+    (205, 206, 208), # Cleared
+    (230, 126, 34), # Marked
+    (200, 30, 30) # Exploded
+)
+MINIMAP_VIEW_COLOR = (255, 255, 255)
 
 # ----------------------------------------------------------------------
 # Game constants - do not edit anything after this line
@@ -41,21 +65,15 @@ TEXT_COLOR = (90, 91, 92)
 # When frozen by PyInstaller, the path to the resources is different
 RESOURCES_ROOT = os.path.join(sys._MEIPASS, 'resources') if getattr(sys, 'frozen', False) else 'resources'
 
-GAME_DURATION_EVENT = pygame.USEREVENT + 1
-
-
-class GameState:
-    PLAYING = 2
-    LOST = 4
-    WON = 8
-    SHOW_STATS = 16
-
 MOUSE_BUTTON_LEFT = 1
+MOUSE_BUTTON_MIDDLE = 2
 MOUSE_BUTTON_RIGHT = 3
+MOUSE_WHEEL_UP = 4
+MOUSE_WHEEL_DOWN = 5
 
 INFO_PANEL_HEIGHT = 55
 
 WINDOW_SIZE = (
-    WIDTH * AREAS_SIDE_SIZE + (WIDTH - 1) * GRID_SPACING,
-    INFO_PANEL_HEIGHT + HEIGHT * AREAS_SIDE_SIZE + (HEIGHT - 1) * GRID_SPACING
+    min(MAX_WINDOW_SIZE[0], WIDTH * AREAS_SIDE_SIZE + (WIDTH - 1) * GRID_SPACING),
+    min(MAX_WINDOW_SIZE[1], INFO_PANEL_HEIGHT + HEIGHT * AREAS_SIDE_SIZE + (HEIGHT - 1) * GRID_SPACING)
 )
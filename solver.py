@@ -0,0 +1,480 @@
+"""A Minesweeper solver working on what the player can see of a Board: cleared areas and their nearby mines counts, and
+mine markers.
+
+Each cleared area with nearby mines gives a constraint: among its uncleared surrounding areas, there are exactly that
+many mines. The solver finds the areas which are surely safe or surely mined with, in order:
+
+  - single constraint rules (no mines left, or as many mines as areas),
+  - subset and difference rules between overlapping constraints,
+  - exact enumeration of the mines placements of each group of linked constraints, if small enough.
+
+The enumeration also gives the mine probability of each area, weighted with the number of mines left on the board.
+
+The solver is incremental: it's told which areas changed after each move, and only updates the constraints around them.
+Enumeration results are kept as long as the constraints of their group don't change."""
+from engine import AreaState
+import math
+
+
+class Solver:
+    def __init__(self, board, max_group_size=20):
+        self.board = board
+        self.max_group_size = max_group_size # Groups with more areas than that are not enumerated
+
+        self.safe = set() # Uncleared areas that are surely safe
+        self.mines = set() # Unmarked areas that are surely mined
+
+        self.probabilities = {} # Mine probability of the areas with constraints
+        self.unconstrained_probability = None # Mine probability of the other uncleared areas
+
+        self._constraints = {} # Cleared area index: (frozenset of uncleared surrounding areas indexes, mines among them)
+        self._dirty = set() # Cleared areas whose constraint must be computed again
+        self._enumerations = {} # Group of constraints: enumeration result
+
+        index = board._states.find(AreaState.CLEARED)
+
+        while index != -1:
+            self._dirty.add(index)
+
+            index = board._states.find(AreaState.CLEARED, index + 1)
+
+    def update(self, indexes):
+        """Tell the solver that the areas at the given indexes changed. They will be taken into account by the next
+        solve() call."""
+        for index in indexes:
+            self._dirty.add(index)
+            self._dirty.update(self.board.get_surrounding_areas(index))
+
+    def solve(self):
+        """Find the areas which are surely safe or surely mined, and the mine probabilities of the others."""
+        self.safe = set(index for index in self.safe if self.board._states[index] == AreaState.INITIAL)
+        self.mines = set(index for index in self.mines if self.board._states[index] == AreaState.INITIAL)
+
+        queue = set()
+
+        for index in self._dirty:
+            self._refresh_constraint(index, queue)
+
+        self._dirty.clear()
+
+        while True:
+            self._propagate(queue)
+
+            queue = self._enumerate()
+
+            if not queue:
+                break
+
+        return self
+
+    def hint(self):
+        """Return the coordinates of a safe area to clear, or the one with the lowest mine probability if there's no safe
+        one. Return None if there's nothing left to clear."""
+        candidates = [index for index in self.safe if self.board._states[index] == AreaState.INITIAL]
+
+        if not candidates:
+            candidates = sorted(self.probabilities.keys(), key=lambda index: self.probabilities[index])[:1]
+
+            if self.unconstrained_probability is not None and (not candidates or self.unconstrained_probability < self.probabilities[candidates[0]]):
+                index = self._find_unconstrained_area()
+
+                if index is not None:
+                    candidates = [index]
+
+        if not candidates:
+            return None
+
+        index = min(candidates)
+
+        return index % self.board.width, index // self.board.width
+
+    def get_probability(self, index):
+        """Return the mine probability of the uncleared area at the given index."""
+        if index in self.safe:
+            return 0.0
+
+        if index in self.mines or self.board._states[index] in (AreaState.MARKED, AreaState.EXPLODED):
+            return 1.0
+
+        if index in self.probabilities:
+            return self.probabilities[index]
+
+        return self.unconstrained_probability
+
+    # --------------------------------------------------------------------------
+    # Constraints
+
+    def _is_unknown(self, index):
+        """Determine if nothing is known about the area at the given index."""
+        return self.board._states[index] == AreaState.INITIAL and index not in self.safe and index not in self.mines
+
+    def _is_known_mine(self, index):
+        """Determine if the area at the given index is known to be mined (marked, exploded or deduced)."""
+        if index in self.safe:
+            return False
+
+        return index in self.mines or self.board._states[index] in (AreaState.MARKED, AreaState.EXPLODED)
+
+    def _refresh_constraint(self, index, queue):
+        """Compute again the constraint given by the area at the given index, and queue it if it changed."""
+        if self.board._states[index] != AreaState.CLEARED or self.board._counts[index] == 0:
+            self._constraints.pop(index, None)
+
+            return
+
+        cells = []
+        mines = self.board._counts[index]
+
+        for surrounding_index in self.board.get_surrounding_areas(index):
+            if self._is_unknown(surrounding_index):
+                cells.append(surrounding_index)
+            elif self._is_known_mine(surrounding_index):
+                mines -= 1
+
+        if not cells or mines < 0 or mines > len(cells): # Nothing left to find, or wrong mine markers
+            self._constraints.pop(index, None)
+
+            return
+
+        constraint = (frozenset(cells), mines)
+
+        if self._constraints.get(index) != constraint:
+            self._constraints[index] = constraint
+
+            queue.add(index)
+
+    def _set_known(self, cells, mined, queue):
+        """Record the given areas as surely mined or surely safe, and compute again the constraints around them."""
+        for index in cells:
+            if not self._is_unknown(index):
+                continue
+
+            (self.mines if mined else self.safe).add(index)
+
+            self.probabilities.pop(index, None)
+
+            for surrounding_index in self.board.get_surrounding_areas(index):
+                self._refresh_constraint(surrounding_index, queue)
+
+    def _propagate(self, queue):
+        """Apply the single constraint, subset and difference rules until nothing new is found."""
+        while queue:
+            index = queue.pop()
+            constraint = self._constraints.get(index)
+
+            if not constraint:
+                continue
+
+            cells, mines = constraint
+
+            if mines == 0:
+                self._set_known(cells, False, queue)
+
+                continue
+
+            if mines == len(cells):
+                self._set_known(cells, True, queue)
+
+                continue
+
+            # Constraints which may share areas with this one are given by the cleared areas up to two areas away
+            x, y = index % self.board.width, index // self.board.width
+
+            for other_y in range(max(0, y - 2), min(self.board.height, y + 3)):
+                for other_x in range(max(0, x - 2), min(self.board.width, x + 3)):
+                    other_index = other_y * self.board.width + other_x
+                    other_constraint = self._constraints.get(other_index)
+
+                    if other_index == index or not other_constraint:
+                        continue
+
+                    other_cells, other_mines = other_constraint
+
+                    if cells.isdisjoint(other_cells):
+                        continue
+
+                    only_cells = cells - other_cells
+                    only_other_cells = other_cells - cells
+
+                    # The areas only in one of the constraints hold all the mines the other constraint can't hold
+                    if mines - other_mines == len(only_cells):
+                        self._set_known(only_cells, True, queue)
+                        self._set_known(only_other_cells, False, queue)
+                    elif other_mines - mines == len(only_other_cells):
+                        self._set_known(only_other_cells, True, queue)
+                        self._set_known(only_cells, False, queue)
+
+                    if self._constraints.get(index) != constraint: # This constraint changed meanwhile
+                        queue.add(index)
+
+                        break
+                else:
+                    continue
+
+                break
+
+    # --------------------------------------------------------------------------
+    # Enumeration and probabilities
+
+    def _get_groups(self):
+        """Split the constraints in groups sharing areas."""
+        parents = {}
+
+        def find(cell):
+            while parents[cell] != cell:
+                parents[cell] = parents[parents[cell]]
+                cell = parents[cell]
+
+            return cell
+
+        for cells, _ in self._constraints.values():
+            first = next(iter(cells))
+
+            parents.setdefault(first, first)
+
+            for cell in cells:
+                parents.setdefault(cell, cell)
+                parents[find(cell)] = find(first)
+
+        groups = {}
+
+        for constraint in self._constraints.values():
+            groups.setdefault(find(next(iter(constraint[0]))), set()).add(constraint)
+
+        return [frozenset(group) for group in groups.values()]
+
+    def _enumerate(self):
+        """Compute the mine probabilities of the areas by enumerating the mines placements of each group of constraints.
+        Record the areas with a probability of 0 or 1 as known, and return the constraints to propagate again."""
+        groups = self._get_groups()
+        enumerations = {}
+
+        for group in groups:
+            enumerations[group] = self._enumerations[group] if group in self._enumerations else self._enumerate_group(group)
+
+        self._enumerations = enumerations
+
+        frontier = set()
+
+        for cells, _ in self._constraints.values():
+            frontier.update(cells)
+
+        exact = [enumerations[group] for group in groups if enumerations[group] is not None]
+        enumerated = set().union(*(cells for cells, _ in exact))
+
+        # The areas of the groups too large to be enumerated count as unconstrained: ignoring their constraints only
+        # allows more placements, so what's certain without them is certain with them too
+        unmarked_mines = len(self.mines)
+        mines_left = self.board.mines - unmarked_mines - self.board._states.count(AreaState.MARKED) - self.board._states.count(AreaState.EXPLODED)
+        unconstrained = self.board._states.count(AreaState.INITIAL) - len(self.safe) - unmarked_mines - len(enumerated)
+
+        weights = self._get_mines_count_weights(exact, unconstrained, mines_left)
+
+        self.probabilities = {}
+
+        safe = set()
+        mines = set()
+
+        for i, (cells, solutions) in enumerate(exact):
+            others = self._convolve([enumeration[1] for j, enumeration in enumerate(exact) if j != i])
+
+            total = 0
+            cells_mines = [0] * len(cells)
+
+            # Certainties are given by the placements consistent with the mines left, not by the weights of the
+            # probabilities, which may be rounded to 0
+            possible = 0
+            possible_cells_mines = [0] * len(cells)
+
+            for group_mines, (count, cell_counts) in solutions.items():
+                weight = sum(others_count * weights.get(group_mines + others_mines, 0) for others_mines, others_count in others.items())
+
+                total += count * weight
+
+                for j, cell_count in enumerate(cell_counts):
+                    cells_mines[j] += cell_count * weight
+
+                if any(group_mines + others_mines in weights for others_mines in others):
+                    possible += count
+
+                    for j, cell_count in enumerate(cell_counts):
+                        possible_cells_mines[j] += cell_count
+
+            if not possible: # No placement is consistent with the mines left, due to wrong mine markers
+                continue
+
+            for cell, cell_mines, possible_cell_mines in zip(cells, cells_mines, possible_cells_mines):
+                self.probabilities[cell] = cell_mines / total if total else possible_cell_mines / possible
+
+                if possible_cell_mines == 0:
+                    safe.add(cell)
+                elif possible_cell_mines == possible:
+                    mines.add(cell)
+
+        # Groups too large to be enumerated only get a rough estimate
+        for group in groups:
+            if enumerations[group] is None:
+                for cells, group_mines in group:
+                    for cell in cells:
+                        self.probabilities.setdefault(cell, group_mines / len(cells))
+
+        self.unconstrained_probability = self._get_unconstrained_probability(exact, weights, unconstrained, mines_left)
+
+        # Possible numbers of mines in the unconstrained areas, which are all safe or all mined if it's always 0 or all
+        # of them. Only when they don't include areas of groups too large to be enumerated, whose constraints were ignored
+        unconstrained_mines = set(mines_left - mines for mines in weights)
+
+        if unconstrained and unconstrained_mines in ({0}, {unconstrained}) and self._is_total_exact(groups, enumerations):
+            for index in self._find_unconstrained_areas(frontier):
+                (safe if unconstrained_mines == {0} else mines).add(index)
+
+        queue = set()
+
+        self._set_known(safe, False, queue)
+        self._set_known(mines, True, queue)
+
+        return queue
+
+    def _is_total_exact(self, groups, enumerations):
+        """Determine if every group was enumerated."""
+        return all(enumerations[group] is not None for group in groups)
+
+    def _enumerate_group(self, group):
+        """Enumerate the mines placements of a group of constraints. Return the group areas and, by number of mines in
+        them, the number of placements and how many of them have a mine in each area. Return None if the group is too
+        large."""
+        cells = sorted(set().union(*(cells for cells, _ in group)))
+
+        if len(cells) > self.max_group_size:
+            return None
+
+        positions = dict((cell, i) for i, cell in enumerate(cells))
+        constraints = [([positions[cell] for cell in group_cells], mines) for group_cells, mines in group]
+        cells_constraints = [[] for _ in cells]
+
+        for i, (constraint_cells, _) in enumerate(constraints):
+            for position in constraint_cells:
+                cells_constraints[position].append(i)
+
+        needed = [mines for _, mines in constraints]
+        remaining = [len(constraint_cells) for constraint_cells, _ in constraints]
+        assignment = [0] * len(cells)
+        solutions = {}
+
+        def assign(position, mines):
+            if position == len(cells):
+                count, cell_counts = solutions.setdefault(mines, [0, [0] * len(cells)])
+
+                solutions[mines][0] = count + 1
+
+                for i, value in enumerate(assignment):
+                    cell_counts[i] += value
+
+                return
+
+            for value in (0, 1):
+                if any(needed[i] - value < 0 or needed[i] - value > remaining[i] - 1 for i in cells_constraints[position]):
+                    continue
+
+                for i in cells_constraints[position]:
+                    needed[i] -= value
+                    remaining[i] -= 1
+
+                assignment[position] = value
+
+                assign(position + 1, mines + value)
+
+                for i in cells_constraints[position]:
+                    needed[i] += value
+                    remaining[i] += 1
+
+            assignment[position] = 0
+
+        assign(0, 0)
+
+        return cells, dict((mines, (count, cell_counts)) for mines, (count, cell_counts) in solutions.items())
+
+    def _convolve(self, solutions_list):
+        """Return, by total number of mines, the number of combined placements of the given groups."""
+        totals = {0: 1}
+
+        for solutions in solutions_list:
+            combined = {}
+
+            for total_mines, total_count in totals.items():
+                for mines, (count, _) in solutions.items():
+                    combined[total_mines + mines] = combined.get(total_mines + mines, 0) + total_count * count
+
+            totals = combined
+
+        return totals
+
+    def _get_mines_count_weights(self, exact, unconstrained, mines_left):
+        """Return, by number of mines in the enumerated groups, the number of ways to place the other mines left in the
+        unconstrained areas, relative to the largest one. Only ratios matter, and exact binomials of large boards are huge
+        integers which are very slow to compute."""
+        logarithms = {}
+
+        for mines in self._convolve([solutions for _, solutions in exact]):
+            if 0 <= mines_left - mines <= unconstrained:
+                logarithms[mines] = _log_binomial(unconstrained, mines_left - mines)
+
+        if not logarithms:
+            return {}
+
+        largest = max(logarithms.values())
+
+        return dict((mines, math.exp(logarithm - largest)) for mines, logarithm in logarithms.items())
+
+    def _get_unconstrained_probability(self, exact, weights, unconstrained, mines_left):
+        """Return the mine probability of the uncleared areas without any constraint."""
+        if not unconstrained:
+            return None
+
+        totals = self._convolve([solutions for _, solutions in exact])
+
+        total = sum(count * weights.get(mines, 0) for mines, count in totals.items())
+
+        if not total:
+            return max(0.0, min(1.0, mines_left / unconstrained))
+
+        expected = sum(count * weights.get(mines, 0) * (mines_left - mines) for mines, count in totals.items())
+
+        return expected / (total * unconstrained)
+
+    def _find_unconstrained_areas(self, frontier):
+        """Return the indexes of the unknown areas which are not in any constraint."""
+        return [index for index in range(0, self.board.areas_count) if index not in frontier and self._is_unknown(index)]
+
+    def _find_unconstrained_area(self):
+        """Return the index of an unknown area which is not in any constraint, preferably a corner one."""
+        frontier = set()
+
+        for cells, _ in self._constraints.values():
+            frontier.update(cells)
+
+        corners = (0, self.board.width - 1, self.board.areas_count - self.board.width, self.board.areas_count - 1)
+
+        for index in corners:
+            if index not in frontier and self._is_unknown(index):
+                return index
+
+        index = self.board._states.find(AreaState.INITIAL)
+
+        while index != -1:
+            if index not in frontier and self._is_unknown(index):
+                return index
+
+            index = self.board._states.find(AreaState.INITIAL, index + 1)
+
+        return None
+
+
+def _log_binomial(n, k):
+    """Return the natural logarithm of the number of ways to choose k items among n."""
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+
+def solve(board):
+    """Solve the given board as it's seen by the player, and return the Solver holding the results."""
+    return Solver(board).solve()
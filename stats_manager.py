@@ -1,3 +1,4 @@
+from persistence import write_atomically
 import logging
 import json
 import os
@@ -22,10 +23,14 @@ def save_stats(filename, stats_dict):
     """Load stats from a JSON file."""
     logging.info('Saving stats')
 
+    write_atomically(filename, dump_stats(stats_dict))
+
+
+def dump_stats(stats_dict):
+    """Return the current stats as saved."""
     data = {}
 
     for key, stat in stats_dict.items():
         data[key] = stat['value']
 
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f)
+    return json.dumps(data).encode('utf-8')
@@ -0,0 +1,298 @@
+"""Tests of the game engine.
+
+    python -m unittest test_engine"""
+from engine import Board, Session, GameState, AreaState
+from chunked_board import ChunkedBoard, CHUNK_SIZE
+from mapped_board import MappedBoard
+import save_game_manager
+import unittest
+import tempfile
+import random
+import engine
+import os
+
+
+class NearbyMinesCountsTest(unittest.TestCase):
+    """The NumPy and pure Python nearby mines counts must be the same."""
+    def _assert_same_counts(self, width, height, mines, seed):
+        board = Board(width, height, mines, seed=seed)
+
+        board._compute_nearby_mines_python()
+        python_counts = bytes(board._counts)
+
+        board._compute_nearby_mines_numpy()
+        numpy_counts = bytes(board._counts)
+
+        self.assertEqual(python_counts, numpy_counts, '{}x{} with {} mines, seed {}'.format(width, height, mines, seed))
+
+    @unittest.skipIf(engine.numpy is None, 'NumPy is not installed')
+    def test_random_boards(self):
+        rng = random.Random(0)
+
+        for width, height in ((30, 16), (7, 3), (64, 65), (200, 150)):
+            for seed in range(0, 5):
+                self._assert_same_counts(width, height, rng.randrange(0, width * height // 3), seed)
+
+    @unittest.skipIf(engine.numpy is None, 'NumPy is not installed')
+    def test_single_row_and_column(self):
+        for width, height in ((1, 1), (1, 20), (20, 1)):
+            for mines in (0, 1, width * height // 2):
+                self._assert_same_counts(width, height, mines, mines)
+
+    @unittest.skipIf(engine.numpy is None, 'NumPy is not installed')
+    def test_fully_mined(self):
+        for width, height in ((1, 1), (1, 7), (7, 1), (9, 9)):
+            self._assert_same_counts(width, height, width * height, 0)
+
+            self.assertEqual(bytes(Board(width, height, width * height)._counts), bytes(width * height)) # Mined areas have no count
+
+    def test_known_counts(self):
+        board = Board(3, 3, 2)
+        board.place_mines([0, 8])
+
+        self.assertEqual(bytes(board._counts), bytes([0, 1, 0, 1, 2, 1, 0, 1, 0]))
+
+
+class FloodFillTest(unittest.TestCase):
+    """The scanline flood fill must clear the same areas as a plain breadth-first one."""
+    def _reference_clear(self, board, start):
+        """Clear the areas around the given one like the original recursive algorithm, one area at a time."""
+        revealed = set()
+        queue = [start]
+
+        while queue:
+            for index in board.get_surrounding_areas(queue.pop(0)):
+                if board._states[index] != AreaState.INITIAL or index in revealed:
+                    continue
+
+                revealed.add(index)
+
+                if board._counts[index] == 0 and not board._mines[index]:
+                    queue.append(index)
+
+        for index in revealed:
+            board._states[index] = AreaState.CLEARED
+
+        revealed.discard(start)
+
+        return revealed
+
+    def test_random_boards(self):
+        rng = random.Random(0)
+
+        for width, height, mines in ((9, 9, 10), (30, 16, 40), (1, 50, 3), (50, 1, 3), (100, 80, 400)):
+            for seed in range(0, 10):
+                board = Board(width, height, mines, seed=seed)
+                reference = Board.from_buffers(width, height, mines, mines, bytearray(board._mines), bytearray(board._states))
+
+                # Some marked and already cleared areas, which the flood fill must go around
+                for index in rng.sample(range(0, board.areas_count), board.areas_count // 20):
+                    state = AreaState.MARKED if rng.random() < 0.5 else AreaState.CLEARED
+                    board._states[index] = reference._states[index] = state
+
+                for start in range(0, board.areas_count):
+                    if board._states[start] == AreaState.INITIAL and board._counts[start] == 0 and not board._mines[start]:
+                        break
+                else:
+                    continue
+
+                board._states[start] = reference._states[start] = AreaState.CLEARED
+
+                self.assertEqual(board.clear_surrounding_areas((start % width, start // width)), self._reference_clear(reference, start))
+                self.assertEqual(bytes(board._states), bytes(reference._states))
+
+
+class RunningCountersTest(unittest.TestCase):
+    """The running areas counts must match a full scan of the field whatever the moves."""
+    def setUp(self):
+        Board.check_counters = True # is_clear() then compares them itself after each move
+
+    def tearDown(self):
+        Board.check_counters = False
+
+    def test_random_moves(self):
+        rng = random.Random(0)
+
+        for seed in range(0, 20):
+            board = Board(16, 16, 40, seed=seed)
+            session = Session(board)
+
+            for move in range(0, 200):
+                coords = (rng.randrange(0, 16), rng.randrange(0, 16))
+                index = coords[1] * 16 + coords[0]
+
+                if rng.random() < 0.3:
+                    session.toggle_mine_marker(coords)
+                elif not board._mines[index] or move > 150: # Explode once in a while, only late in the game
+                    session.reveal(coords)
+
+                if rng.random() < 0.05 and board._mines[index] and board._states[index] != AreaState.EXPLODED: # Moved mines change the counters too
+                    to_index = rng.choice([to_index for to_index in range(0, board.areas_count) if not board._mines[to_index] and board._states[to_index] != AreaState.CLEARED])
+
+                    board.move_mine(index, to_index)
+
+                counters = (board._initial_count, board._correctly_marked_count, board._wrongly_marked_count)
+
+                self.assertEqual(counters, board._count_areas(), 'Seed {}, move {}'.format(seed, move))
+
+                if session.state != GameState.PLAYING:
+                    break
+
+
+class ChunkedBoardTest(unittest.TestCase):
+    """A chunked board must behave like a board with the same mines, even once its chunks were thrown away."""
+    def _assert_same_areas(self, chunked, board):
+        for name in ('_mines', '_counts', '_states'):
+            self.assertEqual(
+                bytes(getattr(chunked, name)[index] for index in range(0, board.areas_count)),
+                bytes(getattr(board, name)),
+                name
+            )
+
+    def test_same_as_board(self):
+        rng = random.Random(0)
+        width, height = 3 * CHUNK_SIZE - 10, 2 * CHUNK_SIZE + 5 # Partial chunks on the right and bottom borders
+
+        for seed in range(0, 3):
+            chunked = ChunkedBoard(width, height, width * height // 8, seed=seed, max_chunks=2) # Most chunks get evicted
+            mines = bytearray(chunked._mines[index] for index in range(0, chunked.areas_count))
+            board = Board.from_buffers(width, height, chunked.mines, chunked.mines, mines, bytearray([AreaState.INITIAL]) * chunked.areas_count)
+
+            self._assert_same_areas(chunked, board)
+            self._assert_same_areas(chunked, board) # Generated again after being evicted
+
+            chunked_session, session = Session(chunked), Session(board)
+
+            # Moves along the chunk borders, where the counts depend on the mines of the neighbouring chunks
+            border = [x for x in range(0, width) if x % CHUNK_SIZE in (0, CHUNK_SIZE - 1)]
+
+            for move in range(0, 300):
+                coords = (rng.choice(border), rng.randrange(0, height)) if move % 2 else (rng.randrange(0, width), rng.randrange(0, height))
+                index = coords[1] * width + coords[0]
+
+                if board._mines[index]:
+                    self.assertEqual(chunked_session.toggle_mine_marker(coords), session.toggle_mine_marker(coords))
+                else:
+                    self.assertEqual(chunked_session.reveal(coords), session.reveal(coords))
+
+            # Moved mines across a chunk border
+            for from_index in rng.sample([index for index in range(0, board.areas_count) if board._mines[index] and board._states[index] == AreaState.INITIAL], 5):
+                to_index = from_index + 1 if (from_index % width) % CHUNK_SIZE == CHUNK_SIZE - 1 else from_index - 1
+
+                if not board._mines[to_index] and board._states[to_index] == AreaState.INITIAL and to_index // width == from_index // width:
+                    chunked.move_mine(from_index, to_index)
+                    board.move_mine(from_index, to_index)
+
+            self._assert_same_areas(chunked, board)
+            self._assert_same_areas(chunked, board)
+            self.assertEqual(chunked._count_areas(), board._count_areas())
+            self.assertEqual(chunked_session.state, session.state)
+
+
+class SavedGameTest(unittest.TestCase):
+    """Saved games must be loaded as they were, whether their body spans one or many read chunks."""
+    def setUp(self):
+        self.filename = os.path.join(tempfile.mkdtemp(), 'save.dat')
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+        os.rmdir(os.path.dirname(self.filename))
+
+    def _assert_same_board(self, board, compress):
+        save_game_manager.save_game(self.filename, board, 42, compress)
+        loaded, duration = save_game_manager.load_game(self.filename, Board)
+
+        self.assertEqual(duration, 42)
+        self.assertEqual(bytes(loaded._mines), bytes(board._mines))
+        self.assertEqual(bytes(loaded._states), bytes(board._states))
+        self.assertEqual(bytes(loaded._counts), bytes(board._counts))
+
+    def test_round_trip(self):
+        for width, height, mines in ((1, 1, 0), (9, 9, 10), (7, 3, 5), (701, 503, 70000)): # The last one spans chunks
+            board = Board(width, height, mines, seed=width)
+            session = Session(board)
+
+            for index in range(0, board.areas_count, 97):
+                if board._mines[index]:
+                    session.toggle_mine_marker((index % width, index // width))
+                else:
+                    session.reveal((index % width, index // width))
+
+            for compress in (False, True):
+                self._assert_same_board(board, compress)
+
+    def test_unpack_bits_without_numpy(self):
+        packed = bytes(range(0, 256)) * 3
+
+        for bits, values in ((1, None), (2, None), (2, save_game_manager._STATES)):
+            for count in (0, 1, 5, len(packed) * 8 // bits):
+                with_numpy = save_game_manager.unpack_bits(packed, bits, count, values=values)
+
+                numpy, save_game_manager.numpy = save_game_manager.numpy, None
+
+                try:
+                    without_numpy = save_game_manager.unpack_bits(packed, bits, count, values=values)
+                finally:
+                    save_game_manager.numpy = numpy
+
+                self.assertEqual(with_numpy, without_numpy)
+                self.assertEqual(len(with_numpy), count)
+
+    def test_truncated_body(self):
+        board = Board(30, 16, 99, seed=1)
+
+        with open(self.filename, 'wb') as f:
+            f.write(save_game_manager.dump_game(board, 0, False)[:-1])
+
+        self.assertIsNone(save_game_manager.load_game(self.filename, Board))
+
+
+class MappedBoardTest(unittest.TestCase):
+    """Mapped boards keep what's needed to resume their game in the header of their file."""
+    def setUp(self):
+        self.board = MappedBoard(30, 16, 99, seed=1, filename=os.path.join(tempfile.mkdtemp(), 'field.map'))
+
+    def tearDown(self):
+        self.board.close()
+
+        os.remove(self.board.filename)
+        os.rmdir(os.path.dirname(self.board.filename))
+
+    def _reopen(self):
+        self.board.close()
+        self.board = MappedBoard.open(self.board.filename)
+
+        return Session(self.board)
+
+    def test_started_and_exploded(self):
+        session = Session(self.board)
+
+        self.assertFalse(self.board.has_cleared_areas())
+
+        session.toggle_mine_marker((0, 0))
+        session = self._reopen()
+
+        self.assertFalse(self.board.has_cleared_areas())
+        self.assertEqual(session.state, GameState.PLAYING)
+
+        safe = self.board._mines.find(0, 1) # Not the marked area
+        session.reveal((safe % 30, safe // 30))
+        session = self._reopen()
+
+        self.assertTrue(self.board.has_cleared_areas())
+        self.assertFalse(session._first_reveal)
+        self.assertEqual(session.state, GameState.PLAYING)
+
+        mined = self.board._mines.find(1)
+        session.reveal((mined % 30, mined // 30))
+        session = self._reopen()
+
+        self.assertTrue(self.board.has_exploded())
+        self.assertEqual(session.state, GameState.LOST)
+        self.assertEqual(self.board._states.find(AreaState.EXPLODED), mined)
+
+
+if __name__ == '__main__':
+    unittest.main()
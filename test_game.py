@@ -0,0 +1,122 @@
+"""Tests of the game window, run without any display nor sound.
+
+    python -m unittest test_game"""
+from board_pool import BoardPool
+from engine import AreaState
+import unittest
+import time
+import tempfile
+import shutil
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+try:
+    import pygame
+except ImportError: # The game can't run without PyGame, the engine tests still can
+    pygame = None
+
+import settings
+
+
+class BoardPoolTest(unittest.TestCase):
+    def test_refill_after_failures(self):
+        attempts = []
+
+        def factory():
+            attempts.append(None)
+
+            if len(attempts) <= 2:
+                raise OSError('disk full')
+
+            return len(attempts)
+
+        pool = BoardPool(factory, 1, retry_delay=0.01)
+
+        try:
+            deadline = time.monotonic() + 5
+
+            while not pool.depth and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(pool.pop(), 3) # Built once the factory stopped failing
+            self.assertEqual(pool.failures, 2)
+            self.assertIsInstance(pool.last_error, OSError)
+        finally:
+            pool.stop()
+
+
+@unittest.skipIf(pygame is None, 'PyGame is not installed')
+class GameTest(unittest.TestCase):
+    """Games played in a temporary directory, which holds their saved game, stats, history and replay."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = {name: getattr(settings, name) for name in ('SAVE_FILE_NAME', 'STATS_FILE_NAME', 'HISTORY_FILE_NAME', 'REPLAY_FILE_NAME', 'WIDTH', 'HEIGHT', 'MINES', 'WINDOW_SIZE')}
+
+        settings.SAVE_FILE_NAME = os.path.join(self.directory, 'save.dat')
+        settings.STATS_FILE_NAME = os.path.join(self.directory, 'stats.json')
+        settings.HISTORY_FILE_NAME = os.path.join(self.directory, 'history.db')
+        settings.REPLAY_FILE_NAME = os.path.join(self.directory, 'last_game.replay')
+        settings.WIDTH, settings.HEIGHT, settings.MINES = 9, 9, 10
+        settings.WINDOW_SIZE = (9 * settings.AREAS_SIDE_SIZE + 8 * settings.GRID_SPACING, settings.INFO_PANEL_HEIGHT + 9 * settings.AREAS_SIDE_SIZE + 8 * settings.GRID_SPACING)
+
+        pygame.init()
+
+        self.games = []
+
+    def tearDown(self):
+        for game in self.games:
+            self._close(game)
+
+        pygame.quit()
+
+        for name, value in self.settings.items():
+            setattr(settings, name, value)
+
+        shutil.rmtree(self.directory)
+
+    def _create_game(self):
+        import game
+
+        self.games.append(game.Game())
+
+        return self.games[-1]
+
+    def _close(self, game):
+        """Stop the background threads of the given game, once its pending writes are done."""
+        if game in self.games:
+            self.games.remove(game)
+
+        game.persistence.stop()
+        game.history.close()
+
+        if game.field_pool:
+            game.field_pool.stop()
+
+        if game.generator_executor:
+            game.generator_executor.shutdown(wait=False, cancel_futures=True)
+
+    def test_resumed_game_ticks(self):
+        import game
+
+        first = self._create_game()
+
+        first.session.toggle_mine_marker((0, 0)) # Unlike a reveal, it can't end the game
+        first._save_game()
+
+        self._close(first)
+
+        resumed = self._create_game()
+
+        self.assertEqual(resumed.field._states[0], AreaState.MARKED)
+
+        pygame.event.post(pygame.event.Event(game.GAME_DURATION_EVENT))
+
+        resumed.update() # Used to compare the autosave time to None
+
+        self.assertEqual(resumed.duration, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
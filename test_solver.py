@@ -0,0 +1,73 @@
+"""Tests of the solver, against the real mines of the boards it solves.
+
+    python -m unittest test_solver"""
+from engine import Board, Session, GameState, AreaState
+from solver import Solver
+import unittest
+
+
+def play(board, start, max_group_size=20):
+    """Play a game on the given board like a player following the solver: mark the mines it finds, clear the safe areas
+    it finds one by one, or its hint if there's none. Yield the solver after each solve() call."""
+    session = Session(board)
+    solver = Solver(board, max_group_size)
+
+    solver.update(session.reveal(start))
+
+    while session.state == GameState.PLAYING:
+        yield solver.solve()
+
+        for index in sorted(solver.mines):
+            if board._states[index] == AreaState.INITIAL:
+                session.toggle_mine_marker((index % board.width, index // board.width))
+                solver.update([index])
+
+        safe = [index for index in solver.safe if board._states[index] == AreaState.INITIAL]
+        coords = (min(safe) % board.width, min(safe) // board.width) if safe else solver.hint()
+
+        if not coords:
+            break
+
+        solver.update(session.reveal(coords))
+
+
+class SolverTest(unittest.TestCase):
+    def _assert_deductions_right(self, board, solver):
+        """The areas the solver found safe must not be mined, and the ones it found mined must be."""
+        self.assertEqual([index for index in solver.safe if board._mines[index]], [], 'Mined areas found safe')
+        self.assertEqual([index for index in solver.mines if not board._mines[index]], [], 'Safe areas found mined')
+
+    def test_deductions_on_expert_boards(self):
+        for seed in (39, 191) + tuple(range(0, 4)): # The first two used to get global mines count deductions wrong
+            board = Board(30, 16, 99, seed=seed)
+
+            for solver in play(board, (15, 8)):
+                self._assert_deductions_right(board, solver)
+
+    def test_deductions_with_groups_too_large(self):
+        for seed in range(0, 40):
+            board = Board(16, 16, 40, seed=seed)
+
+            for solver in play(board, (8, 8), max_group_size=6): # Most groups are too large to be enumerated
+                self._assert_deductions_right(board, solver)
+
+    def test_deductions_on_small_boards(self):
+        for seed in range(0, 100):
+            board = Board(9, 9, 10, seed=seed)
+
+            for solver in play(board, (4, 4)):
+                self._assert_deductions_right(board, solver)
+
+    def test_incremental_matches_from_scratch(self):
+        for seed in range(0, 20):
+            board = Board(16, 16, 40, seed=seed)
+
+            for solver in play(board, (8, 8)):
+                from_scratch = Solver(board).solve()
+
+                self.assertEqual(set(index for index in solver.safe if board._states[index] == AreaState.INITIAL), from_scratch.safe)
+                self.assertEqual(set(index for index in solver.mines if board._states[index] == AreaState.INITIAL), from_scratch.mines)
+
+
+if __name__ == '__main__':
+    unittest.main()
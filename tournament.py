@@ -0,0 +1,227 @@
+"""Headless bots tournaments: many games played by a strategy in a pool of processes, to measure how often it wins and how
+fast the engine plays them.
+
+Every game is played on a board generated from its own seed, derived from a master seed, so a tournament can be played
+again exactly, whatever the number of processes. Games results are streamed back as they end. Beside the win rate and the
+games played per second, the time spent in each phase of the engine is reported: mines generation, nearby mines
+counting, flood fill and win checks.
+
+    python tournament.py --strategy solver --games 1000 --processes 1 2 4"""
+from engine import Board, Session, AreaState, GameState, FirstClick
+from solver import Solver
+import multiprocessing
+import argparse
+import random
+import time
+
+PRESETS = {
+    'beginner': (9, 9, 10),
+    'intermediate': (16, 16, 40),
+    'expert': (30, 16, 99)
+}
+
+PHASES = ('generation', 'counting', 'flood fill', 'win checks')
+
+
+class TimedBoard(Board):
+    """A Board measuring the time spent in each phase of the engine."""
+    def __init__(self, width, height, mines, seed=None):
+        self.timings = dict((phase, 0.0) for phase in PHASES) # Seconds spent in each phase
+
+        super(TimedBoard, self).__init__(width, height, mines, seed)
+
+    def _timed(self, phase, method, *args):
+        started_at = time.perf_counter()
+
+        try:
+            return method(*args)
+        finally:
+            self.timings[phase] += time.perf_counter() - started_at
+
+    def _populate(self, rng):
+        return self._timed('generation', super(TimedBoard, self)._populate, rng)
+
+    def _compute_nearby_mines(self):
+        return self._timed('counting', super(TimedBoard, self)._compute_nearby_mines)
+
+    def clear_surrounding_areas(self, coords):
+        return self._timed('flood fill', super(TimedBoard, self).clear_surrounding_areas, coords)
+
+    def is_clear(self):
+        return self._timed('win checks', super(TimedBoard, self).is_clear)
+
+
+def _get_coords(board, index):
+    return index % board.width, index // board.width
+
+
+def _mark_remaining_mines(session):
+    """Mark every uncleared area once only mines are left uncleared."""
+    board = session.board
+
+    if board._initial_count != board.mines - board._correctly_marked_count - board._wrongly_marked_count:
+        return
+
+    index = board._states.find(AreaState.INITIAL)
+
+    while index != -1 and session.state == GameState.PLAYING:
+        session.toggle_mine_marker(_get_coords(board, index))
+
+        index = board._states.find(AreaState.INITIAL, index + 1)
+
+
+def play_random_safe(session, rng):
+    """The baseline strategy: clear uncleared areas at random, relying on the first one being safe."""
+    board = session.board
+
+    while session.state == GameState.PLAYING:
+        index = rng.randrange(0, board.areas_count)
+
+        if board._states[index] != AreaState.INITIAL: # Fall back to the next uncleared area
+            index = board._states.find(AreaState.INITIAL, index)
+
+            if index == -1:
+                index = board._states.find(AreaState.INITIAL)
+
+        session.reveal(_get_coords(board, index))
+
+        _mark_remaining_mines(session)
+
+
+def play_solver(session, rng):
+    """Clear every area the solver finds safe and mark the mines it finds, only following its least risky hint when
+    there's nothing sure left."""
+    board = session.board
+    solver = Solver(board)
+
+    solver.update(session.reveal(_get_coords(board, rng.randrange(0, board.areas_count))))
+
+    while session.state == GameState.PLAYING:
+        solver.solve()
+
+        for index in solver.mines:
+            if board._states[index] == AreaState.INITIAL:
+                session.toggle_mine_marker(_get_coords(board, index))
+                solver.update([index])
+
+        safe = [index for index in solver.safe if board._states[index] == AreaState.INITIAL]
+
+        if safe:
+            for index in safe:
+                solver.update(session.reveal(_get_coords(board, index)))
+        elif session.state == GameState.PLAYING:
+            coords = solver.hint()
+
+            if not coords:
+                break
+
+            solver.update(session.reveal(coords))
+
+
+STRATEGIES = {
+    'random-safe': play_random_safe,
+    'solver': play_solver
+}
+
+
+def play_game(game):
+    """Play a game, given as a (strategy name, width, height, mines, seed) tuple. Return the seed of the game, if it was
+    won, the number of moves, the time it took to play it and the time spent in each phase of the engine."""
+    strategy, width, height, mines, seed = game
+
+    started_at = time.perf_counter()
+
+    board = TimedBoard(width, height, mines, seed=seed)
+    session = Session(board, first_click=FirstClick.SAFE)
+
+    STRATEGIES[strategy](session, random.Random('{}/{}'.format(strategy, seed))) # Not the same numbers as the board ones
+
+    return seed, session.state == GameState.WON, session.moves, time.perf_counter() - started_at, board.timings
+
+
+def get_seeds(master_seed, games):
+    """Derive the seeds of the games of a tournament from its master seed."""
+    rng = random.Random(master_seed)
+
+    return [rng.getrandbits(64) for _ in range(0, games)]
+
+
+def play_tournament(strategy, width, height, mines, games, master_seed, processes=None, progress=None):
+    """Play games in a pool of processes. Return the results of play_game(), in the order games ended. The given
+    progress function, if any, is called with each result as soon as it's received."""
+    tasks = [(strategy, width, height, mines, seed) for seed in get_seeds(master_seed, games)]
+    chunk_size = max(1, games // ((processes or multiprocessing.cpu_count()) * 16)) # Small enough to balance the load
+    results = []
+
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(play_game, tasks, chunk_size):
+            results.append(result)
+
+            if progress:
+                progress(result)
+
+    return results
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Play Minesweeper games without any display, as fast as possible.')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES.keys()), default='solver', help='How games are played')
+    parser.add_argument('--preset', choices=sorted(PRESETS.keys()), default='expert', help='Board size and mines count')
+    parser.add_argument('--games', type=int, default=1000, help='Number of games to play')
+    parser.add_argument('--seed', type=int, help='Master seed the games seeds are derived from (random by default)')
+    parser.add_argument('--processes', type=int, nargs='+', default=[multiprocessing.cpu_count()], help='Processes counts to play the tournament with, one after the other, to show scaling')
+
+    args = parser.parse_args()
+
+    width, height, mines = PRESETS[args.preset]
+    master_seed = args.seed if args.seed is not None else random.getrandbits(32)
+
+    print('{}: {} games of {}x{} with {} mines, master seed {}'.format(args.strategy, args.games, width, height, mines, master_seed))
+
+    rows = []
+
+    for processes in args.processes:
+        played = [0, 0] # Games, wins
+
+        def progress(result):
+            played[0] += 1
+            played[1] += result[1]
+
+            if played[0] % max(1, args.games // 10) == 0:
+                print('  {:>3} processes: {:>8} games, {:6.2f} % won'.format(processes, played[0], played[1] / played[0] * 100), flush=True)
+
+        started_at = time.perf_counter()
+        results = play_tournament(args.strategy, width, height, mines, args.games, master_seed, processes, progress)
+        elapsed = time.perf_counter() - started_at
+
+        rows.append((processes, results, elapsed))
+
+    print()
+    print('{:>9} {:>10} {:>10} {:>10} {:>8}'.format('Processes', 'Win rate', 'Time (s)', 'Games/s', 'Speedup'))
+
+    for processes, results, elapsed in rows:
+        print('{:>9} {:>9.2f}% {:>10.2f} {:>10.1f} {:>7.2f}x'.format(
+            processes,
+            sum(result[1] for result in results) / len(results) * 100,
+            elapsed,
+            len(results) / elapsed,
+            rows[0][2] / elapsed
+        ))
+
+    results = rows[-1][1]
+    played = sum(result[3] for result in results)
+
+    print()
+    print('{:>12} {:>10} {:>14} {:>8}'.format('Phase', 'Time (s)', 'Per game (ms)', 'Share'))
+
+    for phase in PHASES + ('other',):
+        if phase == 'other': # Mostly the strategy itself
+            spent = played - sum(sum(result[4].values()) for result in results)
+        else:
+            spent = sum(result[4][phase] for result in results)
+
+        print('{:>12} {:>10.3f} {:>14.3f} {:>7.1f}%'.format(phase, spent, spent / len(results) * 1000, spent / played * 100))
+
+
+if __name__ == '__main__':
+    run()